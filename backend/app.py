@@ -1,13 +1,30 @@
+import asyncio
+import functools
 import json
+import os
+import threading
 import boto3
 import re
 import urllib.request
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
+import html_text
+import job_store
+import jobs
+import model_invoke
+import prompt_context
+import request_metrics
+import rule_engine
+import sql_splitter
+import usage_stats
+
 app = FastAPI(title="SQL Converter API")
 
 app.add_middleware(
@@ -17,7 +34,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """One metrics log line per request and a Server-Timing header on the response"""
+    metrics = request_metrics.start('app', request_metrics.OTHER_OPERATION)
+    metrics.measure('request_bytes', int(request.headers.get('content-length') or 0), 'Bytes')
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        metrics.operation = getattr(request.scope.get('route'), 'path', metrics.operation)
+        metrics.set(error_type=type(e).__name__, error=str(e))
+        metrics.finish(500)
+        stats_store.record_finished(metrics, 500)
+        raise
+    # Report the route template so /jobs/{job_id} is one operation and
+    # unmatched paths stay under OTHER_OPERATION
+    metrics.operation = getattr(request.scope.get('route'), 'path', metrics.operation)
+    if metrics.deferred:
+        return response
+    if response.headers.get('content-length'):
+        metrics.measure('response_bytes', int(response.headers['content-length']), 'Bytes')
+    response.headers['Server-Timing'] = metrics.finish(response.status_code)
+    response.headers['Timing-Allow-Origin'] = '*'
+    stats_store.record_finished(metrics, response.status_code)
+    return response
+
+# Model calls in flight at once; further requests wait in a bounded queue and
+# anything beyond that is rejected with 503 instead of piling up
+MAX_CONCURRENT_CONVERSIONS = int(os.environ.get('MAX_CONCURRENT_CONVERSIONS', '16'))
+MAX_QUEUED_CONVERSIONS = int(os.environ.get('MAX_QUEUED_CONVERSIONS', '32'))
+
+bedrock = boto3.client(
+    'bedrock-runtime',
+    region_name='us-east-1',
+    config=Config(max_pool_connections=MAX_CONCURRENT_CONVERSIONS)
+)
+
+# Blocking boto3 calls run here so they never stall the event loop
+bedrock_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_CONVERSIONS + MAX_QUEUED_CONVERSIONS,
+    thread_name_prefix='bedrock'
+)
+model_slots = threading.BoundedSemaphore(MAX_CONCURRENT_CONVERSIONS)
+admitted_conversions = 0
+admission_lock = threading.Lock()
+
+# Background jobs get their own pools so they never take interactive executor threads;
+# their model calls still share model_slots with /convert
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', '2'))
+job_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix='job')
+job_statement_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CONVERSIONS, thread_name_prefix='job-statement')
+jobs_store = job_store.job_store_from_env(default='sqlite')
+
+# Token usage, latency and cache counters behind GET /stats, kept in process memory
+stats_store = usage_stats.UsageStats()
+
+MODEL_CONFIG = {'id': 'amazon.nova-pro-v1:0', 'name': 'Amazon Nova Pro', 'format': 'nova'}
 
 class ConversionRequest(BaseModel):
     source_db: str
@@ -28,16 +100,9 @@ class ConversionResponse(BaseModel):
     redshift_sql: str
     explanation: Optional[str] = None
     source_db: str
-
-def extract_sql_keywords(sql: str) -> list:
-    keywords = []
-    types = re.findall(r'\b(VARCHAR2|NUMBER|DATE|TIMESTAMP|CLOB|BLOB|INTEGER|DECIMAL|FLOAT|DOUBLE|STRING|ARRAY|STRUCT)\b', sql, re.IGNORECASE)
-    keywords.extend(types)
-    functions = re.findall(r'\b([A-Z_]+)\s*\(', sql)
-    keywords.extend(functions)
-    commands = re.findall(r'\b(SELECT|INSERT|UPDATE|DELETE|CREATE|ALTER|DROP|MERGE|QUALIFY)\b', sql, re.IGNORECASE)
-    keywords.extend(commands)
-    return list(set(keywords))
+    conversion_path: Optional[str] = None
+    estimated_prompt_tokens: Optional[int] = None
+    statements: Optional[list] = None
 
 def get_conversion_rules(source_db: str) -> str:
     rules = {
@@ -136,19 +201,14 @@ BigQuery to Redshift:
     }
     return rules.get(source_db, "")
 
-def build_prompt(source_db: str, sql: str, include_explanation: bool) -> str:
-    rules = get_conversion_rules(source_db)
-    keywords = extract_sql_keywords(sql)
+def prompt_instructions(source_db: str, context: dict, include_explanation: bool) -> str:
+    rules = "\n".join(f"- {rule}" for rule in context['rules'])
+    if rules:
+        rules = f"{source_db} to Redshift:\n{rules}\n"
     
-    prompt = f"""Convert this {source_db} SQL to Amazon Redshift SQL.
+    prefix = f"""Convert {source_db} SQL to Amazon Redshift SQL.
 
 {rules}
-
-Source SQL ({source_db}):
-```sql
-{sql}
-```
-
 Requirements:
 1. Convert data types to Redshift equivalents
 2. Replace unsupported functions
@@ -158,7 +218,7 @@ Requirements:
 """
     
     if include_explanation:
-        prompt += """Format:
+        prefix += """Format:
 
 CONVERTED SQL:
 ```sql
@@ -169,54 +229,264 @@ EXPLANATION:
 [Key changes]
 """
     else:
-        prompt += "Provide ONLY the converted SQL."
+        prefix += "Provide ONLY the converted SQL.\n"
     
-    return prompt
+    return prefix
+
+def build_prompt(source_db: str, sql: str, include_explanation: bool) -> str:
+    """Conversion prompt carrying only the rules relevant to the SQL, which comes last"""
+    source = f"""
+Source SQL ({source_db}):
+```sql
+{sql}
+```"""
+    context = prompt_context.select_context(
+        sql, source_db, MODEL_CONFIG,
+        rules=prompt_context.split_rules(get_conversion_rules(source_db))
+    )
+    return prompt_instructions(source_db, context, include_explanation) + source
+
+def record_usage(source_db: str, usage: dict, metrics: Optional[request_metrics.RequestMetrics] = None):
+    """Count one model call's tokens in the request metrics (the current request's by default) and /stats"""
+    measure = metrics.measure if metrics is not None else request_metrics.measure
+    measure('input_tokens', usage.get('input_tokens', 0))
+    measure('output_tokens', usage.get('output_tokens', 0))
+    stats_store.record_call(MODEL_CONFIG['id'], source_db, usage.get('input_tokens'), usage.get('output_tokens'), usage.get('seconds', 0))
+
+def parse_response(content: str, include_explanation: bool) -> tuple:
+    if include_explanation:
+        sql_match = re.search(r'```sql\n(.*?)\n```', content, re.DOTALL)
+        redshift_sql = sql_match.group(1).strip() if sql_match else content
+        exp_match = re.search(r'EXPLANATION:\n(.*)', content, re.DOTALL)
+        explanation = exp_match.group(1).strip() if exp_match else None
+    else:
+        # Prose the model adds around fenced answers is dropped; several fenced blocks are joined
+        blocks = re.findall(r'```(?:sql)?\n(.*?)\n```', content, re.DOTALL)
+        redshift_sql = '\n\n'.join(block.strip() for block in blocks) if blocks else re.sub(r'```sql\n|\n```|```', '', content).strip()
+        explanation = None
+    return redshift_sql, explanation
+
+def admit_conversion():
+    global admitted_conversions
+    with admission_lock:
+        if admitted_conversions >= MAX_CONCURRENT_CONVERSIONS + MAX_QUEUED_CONVERSIONS:
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry shortly",
+                headers={"Retry-After": "1"}
+            )
+        admitted_conversions += 1
+
+def release_conversion():
+    global admitted_conversions
+    with admission_lock:
+        admitted_conversions -= 1
+
+def call_with_model_slot(fn, *args, **kwargs):
+    with request_metrics.stage('model_queue'):
+        model_slots.acquire()
+    try:
+        with request_metrics.stage('model_call'):
+            return fn(*args, **kwargs)
+    finally:
+        model_slots.release()
+
+async def run_model_calls(calls) -> list:
+    """Run blocking (fn, *args) model calls concurrently on the Bedrock executor, results in order
+
+    The request is admitted once; each call takes a model slot itself.
+    """
+    admit_conversion()
+    try:
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(
+            loop.run_in_executor(bedrock_executor, functools.partial(request_metrics.bind(fn), *args))
+            for fn, *args in calls
+        ))
+    finally:
+        release_conversion()
+
+def convert_with_rules(source_db: str, statement: str, include_explanation: bool) -> Optional[dict]:
+    """Rule-engine conversion of one statement, or None when it needs the model"""
+    if sql_splitter.is_comment_only(statement):
+        return {'redshift_sql': statement, 'explanation': None, 'path': 'comment', 'prompt_tokens': 0}
+    local = rule_engine.convert_statement(statement, source_db)
+    if local is None:
+        return None
+    redshift_sql, applied = local
+    explanation = None
+    if include_explanation:
+        explanation = f"Converted locally: {', '.join(applied)}" if applied else "No changes required"
+    return {'redshift_sql': redshift_sql, 'explanation': explanation, 'path': 'rules', 'prompt_tokens': 0}
+
+def convert_with_model(source_db: str, statement: str, include_explanation: bool) -> dict:
+    """One blocking model call for one statement, under the model concurrency limit"""
+    with request_metrics.stage('prompt_build'):
+        prompt = build_prompt(source_db, statement, include_explanation)
+    usage = {}
+    # Without an explanation nothing after the statement's SQL fence is used
+    invoke = model_invoke.invoke_text if include_explanation else model_invoke.invoke_until_fence
+    content = call_with_model_slot(invoke, bedrock, MODEL_CONFIG, prompt, max_tokens=4096, usage=usage)
+    record_usage(source_db, usage)
+    with request_metrics.stage('response_parse'):
+        redshift_sql, explanation = parse_response(content, include_explanation)
+    return {
+        'redshift_sql': redshift_sql, 'explanation': explanation, 'path': 'model',
+        'prompt_tokens': prompt_context.estimate_tokens(prompt)
+    }
+
+def stops_at_fence(req: ConversionRequest) -> bool:
+    """Whether generation can stop at the answer's first SQL fence
+
+    Only without an explanation and for a single statement: a script may come
+    back in several fenced blocks.
+    """
+    return not req.include_explanation and len(sql_splitter.split_statements(req.sql, req.source_db)) <= 1
 
 @app.post("/convert", response_model=ConversionResponse)
 async def convert_sql(req: ConversionRequest):
+    request_metrics.set(source_db=req.source_db, model=MODEL_CONFIG['id'])
     try:
-        prompt = build_prompt(req.source_db, req.sql, req.include_explanation)
-        
-        response = bedrock.invoke_model(
-            modelId='amazon.nova-pro-v1:0',
-            body=json.dumps({
-                "messages": [{"role": "user", "content": [{"text": prompt}]}],
-                "inferenceConfig": {"maxTokens": 4096, "temperature": 0.1}
-            })
-        )
+        # Statements the rule engine converts stay local; only the rest reach the model
+        with request_metrics.stage('split'):
+            statements = sql_splitter.split_statements(req.sql, req.source_db) or [req.sql]
+        with request_metrics.stage('rules'):
+            results = [convert_with_rules(req.source_db, statement, req.include_explanation) for statement in statements]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            answers = await run_model_calls(
+                (convert_with_model, req.source_db, statements[i], req.include_explanation) for i in pending
+            )
+            for i, answer in zip(pending, answers):
+                results[i] = answer
         
-        result = json.loads(response['body'].read())
-        content = result['output']['message']['content'][0]['text']
+        paths = {result['path'] for result in results} - {'comment'}
+        conversion_path = paths.pop() if len(paths) == 1 else ('mixed' if paths else 'rules')
+        request_metrics.set(path=conversion_path)
+        prompt_tokens = sum(result['prompt_tokens'] for result in results)
+        request_metrics.measure('estimated_prompt_tokens', prompt_tokens)
         
-        if req.include_explanation:
-            sql_match = re.search(r'```sql\n(.*?)\n```', content, re.DOTALL)
-            redshift_sql = sql_match.group(1).strip() if sql_match else content
-            exp_match = re.search(r'EXPLANATION:\n(.*)', content, re.DOTALL)
-            explanation = exp_match.group(1).strip() if exp_match else None
+        if len(results) == 1:
+            redshift_sql, explanation = results[0]['redshift_sql'], results[0]['explanation']
         else:
-            redshift_sql = re.sub(r'```sql\n|\n```|```', '', content).strip()
-            explanation = None
-        
+            redshift_sql = sql_splitter.join_statements(result['redshift_sql'] for result in results)
+            explanation = "\n\n".join(
+                f"Statement {i}: {result['explanation']}" for i, result in enumerate(results, 1) if result['explanation']
+            ) or None
         return ConversionResponse(
             redshift_sql=redshift_sql,
             explanation=explanation,
-            source_db=req.source_db
+            source_db=req.source_db,
+            conversion_path=conversion_path,
+            estimated_prompt_tokens=prompt_tokens or None,
+            statements=[{'statement': i, 'path': result['path']} for i, result in enumerate(results, 1)]
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
+        request_metrics.record_error(e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def stream_conversion(req: ConversionRequest, metrics: request_metrics.RequestMetrics):
+    # Headers are sent before the model answers, so the stream logs its own
+    # metrics line when it ends and carries no Server-Timing header
+    status = 200
+    try:
+        with metrics.stage('prompt_build'):
+            prompt = build_prompt(req.source_db, req.sql, req.include_explanation)
+        metrics.set(source_db=req.source_db, model=MODEL_CONFIG['id'])
+        yield model_invoke.sse_event('meta', {
+            'source_db': req.source_db,
+            'model_used': MODEL_CONFIG['name'],
+            'estimated_prompt_tokens': prompt_context.estimate_tokens(prompt)
+        })
+        parts = []
+        usage = {}
+        with metrics.stage('model_queue'):
+            model_slots.acquire()
+        try:
+            with metrics.stage('model_call'):
+                for text in model_invoke.stream_text(
+                    bedrock, MODEL_CONFIG, prompt, max_tokens=4096, usage=usage, stop_at_fence=stops_at_fence(req)
+                ):
+                    parts.append(text)
+                    yield model_invoke.sse_event('delta', {'text': text})
+        finally:
+            model_slots.release()
+        record_usage(req.source_db, usage, metrics)
+        with metrics.stage('response_parse'):
+            redshift_sql, explanation = parse_response(''.join(parts), req.include_explanation)
+        yield model_invoke.sse_event('done', {
+            'redshift_sql': redshift_sql,
+            'explanation': explanation,
+            'source_db': req.source_db
+        })
+    except Exception as e:
+        status = 500
+        metrics.set(error_type=type(e).__name__, error=str(e))
+        yield model_invoke.sse_event('error', {'error': str(e)})
+    finally:
+        release_conversion()
+        metrics.finish(status)
+        stats_store.record_finished(metrics, status)
+
+@app.post("/convert/stream")
+async def convert_sql_stream(req: ConversionRequest):
+    admit_conversion()
+    metrics = request_metrics.current()
+    metrics.deferred = True
+    # Sync generator: Starlette iterates it in a worker thread, so the
+    # blocking boto3 event stream never stalls the event loop
+    return StreamingResponse(
+        stream_conversion(req, metrics),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def convert_job_statement(job: dict, statement: str) -> tuple:
+    result = convert_with_rules(job['source_db'], statement, job['include_explanation'])
+    if result is None:
+        result = convert_with_model(job['source_db'], statement, job['include_explanation'])
+    return result['redshift_sql'], result['explanation'], result['path']
+
+def process_job(job_id: str):
+    job = jobs_store.get_job(job_id)
+    jobs.run_job(
+        jobs_store,
+        job_id,
+        functools.partial(convert_job_statement, job),
+        job_statement_executor
+    )
+
+@app.post("/jobs", status_code=202)
+def submit_job(req: ConversionRequest):
+    job = jobs_store.create_job(req.source_db, req.sql, 'nova-pro', req.include_explanation)
+    job_executor.submit(process_job, job['job_id'])
+    return {**job, "status_url": f"/jobs/{job['job_id']}"}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.expire_stale(jobs_store, jobs_store.get_job(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats(days: int = Query(1, ge=1, le=usage_stats.STATS_TTL_DAYS)):
+    """Token usage, throughput, latency percentiles and cache hit rate per model and source dialect"""
+    return stats_store.stats(days)
+
 @app.get("/supported-databases")
 async def supported_databases():
     return {"databases": ["Teradata", "Oracle", "MySQL", "Clickhouse", "Snowflake", "BigQuery"]}
 
 @app.post("/refresh")
-async def refresh_features():
+def refresh_features():
     try:
         # Redshift documentation URLs
         REDSHIFT_DOCS = {
@@ -230,8 +500,7 @@ async def refresh_features():
         # Fetch cluster versions page
         req = urllib.request.Request(REDSHIFT_DOCS["cluster_versions"], headers={'User-Agent': 'Mozilla/5.0'})
         with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8')
-            text = re.sub(r'<[^>]+>', ' ', html)
+            text = html_text.read_text(response)
             
             if "QUALIFY" in text:
                 features.append("QUALIFY clause is SUPPORTED")
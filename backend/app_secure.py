@@ -10,6 +10,9 @@ from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from pydantic import BaseModel
 from typing import Optional
 
+import html_text
+import sql_lexer
+
 app = FastAPI(title="SQL Converter API")
 
 app.add_middleware(
@@ -47,15 +50,8 @@ class ConversionResponse(BaseModel):
     explanation: Optional[str] = None
     source_db: str
 
-def extract_sql_keywords(sql: str) -> list:
-    keywords = []
-    types = re.findall(r'\b(VARCHAR2|NUMBER|DATE|TIMESTAMP|CLOB|BLOB|INTEGER|DECIMAL|FLOAT|DOUBLE|STRING|ARRAY|STRUCT)\b', sql, re.IGNORECASE)
-    keywords.extend(types)
-    functions = re.findall(r'\b([A-Z_]+)\s*\(', sql)
-    keywords.extend(functions)
-    commands = re.findall(r'\b(SELECT|INSERT|UPDATE|DELETE|CREATE|ALTER|DROP|MERGE|QUALIFY)\b', sql, re.IGNORECASE)
-    keywords.extend(commands)
-    return list(set(keywords))
+def extract_sql_keywords(sql: str, source_db: Optional[str] = None) -> list:
+    return sorted(sql_lexer.constructs(sql_lexer.tokenize(sql, source_db)))
 
 def get_conversion_rules(source_db: str) -> str:
     rules = {
@@ -156,7 +152,7 @@ BigQuery to Redshift:
 
 def build_prompt(source_db: str, sql: str, include_explanation: bool) -> str:
     rules = get_conversion_rules(source_db)
-    keywords = extract_sql_keywords(sql)
+    keywords = extract_sql_keywords(sql, source_db)
     
     prompt = f"""Convert this {source_db} SQL to Amazon Redshift SQL.
 
@@ -246,8 +242,7 @@ async def refresh_features(username: str = Depends(verify_credentials)):
         
         req = urllib.request.Request(REDSHIFT_DOCS["cluster_versions"], headers={'User-Agent': 'Mozilla/5.0'})
         with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8')
-            text = re.sub(r'<[^>]+>', ' ', html)
+            text = html_text.read_text(response)
             
             if "QUALIFY" in text:
                 features.append("QUALIFY clause is SUPPORTED")
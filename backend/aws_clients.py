@@ -0,0 +1,46 @@
+import json
+import threading
+
+# boto3 clients and DynamoDB tables built on first use. Importing boto3 and
+# creating clients dominates a Lambda cold start, so nothing here runs until a
+# request actually needs AWS; /health, /models and OPTIONS never pay for it.
+# Each client is then reused for the container's lifetime.
+
+REGION = 'us-east-1'
+
+_clients = {}
+_lock = threading.RLock()
+
+def _shared(key, build):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = build()
+    return client
+
+def client(service, **config):
+    """Shared boto3 client for a service; config keyword arguments go to botocore Config
+
+    Clients are shared per service and config, so callers asking for
+    different timeouts or retries each get their own.
+    """
+    def build():
+        import boto3
+        if not config:
+            return boto3.client(service, region_name=REGION)
+        from botocore.config import Config
+        return boto3.client(service, region_name=REGION, config=Config(**config))
+    return _shared(('client', service, json.dumps(config, sort_keys=True)), build)
+
+def dynamodb():
+    """Shared DynamoDB service resource, for batch calls spanning items"""
+    def build():
+        import boto3
+        return boto3.resource('dynamodb', region_name=REGION)
+    return _shared(('resource', 'dynamodb'), build)
+
+def table(name):
+    """Shared DynamoDB Table resource"""
+    return _shared(('table', name), lambda: dynamodb().Table(name))
@@ -0,0 +1,540 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import defaultdict
+from datetime import datetime
+
+# Offline benchmark for the conversion pipeline. Replays a SQL corpus through
+# lambda_handler.handler, lambda_handler_kb.lambda_handler and the FastAPI app
+# against a fake Bedrock / DynamoDB with configurable latency and token rate,
+# and writes per-stage timings and percentiles as JSON for comparing commits.
+#
+#   python benchmark.py --requests 20 --output bench_results.json
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = os.path.join(REPO_ROOT, 'bigquery_sample_sqls.sql')
+# Lambda init budget: handler import plus the first /health request
+INIT_BUDGET_MS = 150
+
+_SQL_FENCE_RE = re.compile(r'```sql\n(.*?)\n```', re.DOTALL)
+_KB_INPUT_RE = re.compile(r'INPUT SQL:\n(.*?)\n\nIMPORTANT INSTRUCTIONS', re.DOTALL)
+
+class Recorder:
+    """Per-request stage durations and counters, shared by the fakes and wrappers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.stages[stage] += seconds
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def take(self):
+        with self.lock:
+            stages, counters = dict(self.stages), dict(self.counters)
+            self.stages.clear()
+            self.counters.clear()
+        return stages, counters
+
+    def wrap(self, module, name, stage):
+        """Replace module.name with a version that records its duration under stage"""
+        original = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+
+        setattr(module, name, timed)
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+def prompt_text(body):
+    """Prompt of an invoke_model request body in either API format"""
+    content = json.loads(body)['messages'][0]['content']
+    return content[0]['text'] if isinstance(content, list) else content
+
+class FakeBedrock:
+    """bedrock-runtime stand-in that echoes the source SQL back as the conversion
+
+    Each call takes latency_ms plus output tokens / tokens_per_sec, and the
+    response carries usage token counts in the model's API format. Like real
+    models, an answer without an explanation ends with TRAILING_NOTE after its
+    fence. Streams produce their chunks at that rate, so a caller that closes a
+    stream early stops paying for the rest.
+    """
+
+    TRAILING_NOTE = ("\n\nThis query has been converted to Amazon Redshift syntax. Data types and functions "
+                     "were mapped to their Redshift equivalents and the original logic is preserved, so it "
+                     "can be run as is.")
+
+    def __init__(self, recorder, latency_ms=50, tokens_per_sec=2000):
+        self.recorder = recorder
+        self.latency = latency_ms / 1000.0
+        self.tokens_per_sec = tokens_per_sec
+
+    def _answer(self, prompt, trailing_note=True):
+        match = _SQL_FENCE_RE.search(prompt) or _KB_INPUT_RE.search(prompt)
+        sql = match.group(1) if match else 'SELECT 1'
+        text = f"```sql\n{sql}\n```"
+        if 'EXPLANATION:' in prompt:
+            text += "\n\nEXPLANATION:\nBenchmark echo"
+        elif trailing_note:
+            text += self.TRAILING_NOTE
+        return text
+
+    def _record(self, duration, input_tokens, output_tokens):
+        self.recorder.add('model_call', duration)
+        self.recorder.count('model_calls')
+        self.recorder.count('input_tokens', input_tokens)
+        self.recorder.count('output_tokens', output_tokens)
+
+    def _complete(self, prompt, trailing_note=True):
+        text = self._answer(prompt, trailing_note)
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        duration = self.latency + output_tokens / self.tokens_per_sec
+        time.sleep(duration)
+        self._record(duration, input_tokens, output_tokens)
+        return text, input_tokens, output_tokens
+
+    def invoke_model(self, modelId, body, **kwargs):
+        text, input_tokens, output_tokens = self._complete(prompt_text(body))
+        if modelId.startswith('amazon.'):
+            usage = {'inputTokens': input_tokens, 'outputTokens': output_tokens}
+            result = {'output': {'message': {'content': [{'text': text}]}}, 'usage': usage}
+        else:
+            usage = {'input_tokens': input_tokens, 'output_tokens': output_tokens}
+            result = {'content': [{'type': 'text', 'text': text}], 'usage': usage}
+        return {'body': io.BytesIO(json.dumps(result).encode('utf-8'))}
+
+    def converse(self, modelId, messages, **kwargs):
+        text, input_tokens, output_tokens = self._complete(messages[0]['content'][0]['text'], trailing_note=False)
+        return {
+            'output': {'message': {'content': [{'text': text}]}},
+            'usage': {'inputTokens': input_tokens, 'outputTokens': output_tokens}
+        }
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        prompt = prompt_text(body)
+        text = self._answer(prompt)
+        input_tokens = estimate_tokens(prompt)
+        deltas = [text[i:i + 64] for i in range(0, len(text), 64)]
+        if modelId.startswith('amazon.'):
+            chunks = [{'contentBlockDelta': {'delta': {'text': delta}}} for delta in deltas]
+        else:
+            chunks = [{'type': 'content_block_delta', 'delta': {'text': delta}} for delta in deltas]
+        chunks[-1]['amazon-bedrock-invocationMetrics'] = {
+            'inputTokenCount': input_tokens,
+            'outputTokenCount': estimate_tokens(text)
+        }
+
+        def events():
+            # Only the chunks read before the caller closes the stream are generated and counted
+            duration = self.latency
+            sent = ''
+            time.sleep(self.latency)
+            try:
+                for delta, chunk in zip(deltas, chunks):
+                    pause = estimate_tokens(delta) / self.tokens_per_sec
+                    time.sleep(pause)
+                    duration += pause
+                    sent += delta
+                    yield {'chunk': {'bytes': json.dumps(chunk).encode('utf-8')}}
+            finally:
+                self._record(duration, input_tokens, estimate_tokens(sent))
+
+        return {'body': events()}
+
+class FakeAgent:
+    """bedrock-agent-runtime stand-in returning canned documentation chunks"""
+
+    def __init__(self, recorder, latency_ms=50):
+        self.recorder = recorder
+        self.latency = latency_ms / 1000.0
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+        time.sleep(self.latency)
+        self.recorder.count('retrieval_calls')
+        query = retrievalQuery['text']
+        count = retrievalConfiguration['vectorSearchConfiguration']['numberOfResults']
+        return {'retrievalResults': [
+            {'content': {'text': f"Redshift documentation for {query} ({i}). QUALIFY MERGE SUPER UNNEST TRY_CAST."}}
+            for i in range(count)
+        ]}
+
+class FakeTable:
+    """In-memory DynamoDB table supporting the calls the handlers make"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(json.dumps(Key, sort_keys=True, default=str))
+        return {'Item': item} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        key_name = next(iter(Item))
+        self.items[json.dumps({key_name: Item[key_name]}, sort_keys=True, default=str)] = Item
+        return {}
+
+    def update_item(self, **kwargs):
+        return {}
+
+    @contextlib.contextmanager
+    def batch_writer(self):
+        yield self
+
+class FakeDynamoDB:
+    def __init__(self):
+        self.tables = defaultdict(FakeTable)
+
+    def Table(self, name):
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses = {}
+        for name, request in RequestItems.items():
+            found = [self.tables[name].get_item(Key=key).get('Item') for key in request['Keys']]
+            responses[name] = [item for item in found if item is not None]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+class FakeClient:
+    """Any other AWS client; every operation succeeds and returns nothing"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: {}
+
+def install_fakes(recorder, latency_ms, tokens_per_sec, patch_boto3=True):
+    """Point aws_clients, and boto3 for app.py, at the fakes before any handler is imported
+
+    With patch_boto3=False boto3 is never imported, so a cold-start run can
+    check that the handlers do not load it either.
+    """
+    bedrock = FakeBedrock(recorder, latency_ms, tokens_per_sec)
+    agent = FakeAgent(recorder, latency_ms)
+    dynamodb = FakeDynamoDB()
+
+    def client(service, *args, **kwargs):
+        if service == 'bedrock-runtime':
+            return bedrock
+        if service == 'bedrock-agent-runtime':
+            return agent
+        return FakeClient()
+
+    import aws_clients
+    aws_clients.client = client
+    aws_clients.table = dynamodb.Table
+    aws_clients.dynamodb = lambda: dynamodb
+    if not patch_boto3:
+        return dynamodb
+    try:
+        import boto3
+    except ImportError:
+        boto3 = types.ModuleType('boto3')
+        sys.modules['boto3'] = boto3
+    try:
+        import botocore.config  # noqa: F401
+    except ImportError:
+        botocore = types.ModuleType('botocore')
+        botocore.config = types.ModuleType('botocore.config')
+        botocore.config.Config = lambda **kwargs: kwargs
+        sys.modules['botocore'] = botocore
+        sys.modules['botocore.config'] = botocore.config
+    boto3.client = client
+    boto3.resource = lambda service, *args, **kwargs: dynamodb
+    return dynamodb
+
+def load_corpus(path, large_sizes):
+    """Named scripts: the sample file, then larger scripts generated from its statements"""
+    with open(path, encoding='utf-8') as f:
+        sample = f.read()
+    corpus = [('sample', sample)]
+    statements = [s for s in re.split(r';\s*\n', sample) if s.strip()]
+    for size in large_sizes:
+        # A distinct comment per copy keeps every statement a separate cache entry
+        script = ';\n\n'.join(
+            f"-- copy {i}\n{statements[i % len(statements)].strip()}" for i in range(size)
+        ) + ';'
+        corpus.append((f'generated-{size}', script))
+    return corpus
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))] * 1000, 3)
+
+    return {
+        'p50': at(0.50), 'p95': at(0.95), 'p99': at(0.99),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3), 'max': round(ordered[-1] * 1000, 3)
+    }
+
+def summarize(samples):
+    """Aggregate per-request samples into latency, stage and size statistics"""
+    stages = defaultdict(list)
+    for sample in samples:
+        for stage, seconds in sample['stages'].items():
+            stages[stage].append(seconds)
+    totals = defaultdict(int)
+    for sample in samples:
+        for name, value in sample['counters'].items():
+            totals[name] += value
+        totals['request_bytes'] += sample['request_bytes']
+        totals['response_bytes'] += sample['response_bytes']
+    count = len(samples) or 1
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s['status'] >= 400),
+        'latency_ms': percentiles([s['seconds'] for s in samples]),
+        'stages_ms': {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        'per_request': {name: round(value / count, 1) for name, value in sorted(totals.items())}
+    }
+
+def reset_caches(dynamodb):
+    """Drop result and retrieval caches so every request runs the full pipeline"""
+    module = sys.modules.get('result_cache')
+    if module is not None:
+        with module._lru_lock:
+            module._lru.clear()
+        dynamodb.Table(module.RESULT_CACHE_TABLE).items.clear()
+    kb = sys.modules.get('lambda_handler_kb')
+    if kb is not None and hasattr(kb, '_retrieval_cache'):
+        with kb._retrieval_lock:
+            kb._retrieval_cache.clear()
+
+def run_target(call, corpus, requests, recorder, dynamodb, keep_cache):
+    samples = []
+    for i in range(requests):
+        label, sql = corpus[i % len(corpus)]
+        if not keep_cache:
+            reset_caches(dynamodb)
+        recorder.take()
+        started = time.perf_counter()
+        # Handlers log per statement; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            status, request_bytes, response_bytes = call(sql)
+        seconds = time.perf_counter() - started
+        stages, counters = recorder.take()
+        samples.append({
+            'corpus': label, 'status': status, 'seconds': seconds, 'stages': stages,
+            'counters': counters, 'request_bytes': request_bytes, 'response_bytes': response_bytes
+        })
+    by_corpus = defaultdict(list)
+    for sample in samples:
+        by_corpus[sample['corpus']].append(sample)
+    return {**summarize(samples), 'by_corpus': {label: summarize(s) for label, s in by_corpus.items()}}
+
+def lambda_target(recorder, dynamodb):
+    import lambda_handler
+    import result_cache  # noqa: F401
+    dynamodb.Table('sql-converter-features').put_item(Item={
+        'feature_key': 'redshift_features',
+        'features': list(lambda_handler.DEFAULT_REDSHIFT_FEATURES),
+        'updated_at': datetime.now().isoformat()
+    })
+    recorder.wrap(lambda_handler, 'get_redshift_features', 'feature_lookup')
+    recorder.wrap(lambda_handler, 'build_prompt', 'prompt_build')
+    recorder.wrap(lambda_handler, 'parse_response', 'response_parse')
+    recorder.wrap(lambda_handler.rule_engine, 'convert_statement', 'rules')
+    recorder.wrap(lambda_handler.sql_splitter, 'split_statements', 'split')
+
+    def call(sql):
+        body = json.dumps({'source_db': 'BigQuery', 'sql': sql, 'model': 'nova-pro'})
+        response = lambda_handler.handler({'rawPath': '/convert', 'body': body}, None)
+        return response['statusCode'], len(body), len(response.get('body', ''))
+    return call
+
+def kb_target(recorder, dynamodb):
+    import lambda_handler_kb
+    recorder.wrap(lambda_handler_kb, 'retrieve_for_sql', 'retrieval')
+    recorder.wrap(lambda_handler_kb.prompt_context, 'select_context', 'prompt_build')
+
+    def call(sql):
+        body = json.dumps({'source_db': 'BigQuery', 'sql': sql})
+        response = lambda_handler_kb.lambda_handler({'rawPath': '/convert', 'body': body}, None)
+        return response['statusCode'], len(body), len(response.get('body', ''))
+    return call
+
+def app_target(recorder, dynamodb):
+    from fastapi.testclient import TestClient
+    import app
+    recorder.wrap(app, 'build_prompt', 'prompt_build')
+    recorder.wrap(app, 'parse_response', 'response_parse')
+    recorder.wrap(app, 'convert_with_rules', 'rules')
+    client = TestClient(app.app)
+
+    def call(sql):
+        body = json.dumps({'source_db': 'BigQuery', 'sql': sql})
+        response = client.post('/convert', content=body, headers={'Content-Type': 'application/json'})
+        return response.status_code, len(body), len(response.content)
+    return call
+
+TARGETS = {'lambda': lambda_target, 'kb': kb_target, 'app': app_target}
+
+# Handler entry points measured by --cold-start, each in a fresh interpreter
+COLD_START_HANDLERS = {'lambda': ('lambda_handler', 'handler'), 'kb': ('lambda_handler_kb', 'lambda_handler')}
+
+def cold_start_child(target, latency_ms, tokens_per_sec):
+    """Runs in a fresh interpreter: time the handler import and its first requests"""
+    recorder = Recorder()
+    install_fakes(recorder, latency_ms, tokens_per_sec, patch_boto3=False)
+    module_name, function_name = COLD_START_HANDLERS[target]
+    started = time.perf_counter()
+    module = __import__(module_name)
+    import_seconds = time.perf_counter() - started
+    boto3_loaded_at_import = 'boto3' in sys.modules or 'botocore' in sys.modules
+    handler = getattr(module, function_name)
+
+    def first(event):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            handler(event, None)
+        return round((time.perf_counter() - started) * 1000, 3)
+
+    result = {
+        'import_ms': round(import_seconds * 1000, 3),
+        'boto3_loaded_at_import': boto3_loaded_at_import,
+        'first_options_ms': first({'rawPath': '/convert', 'requestContext': {'http': {'method': 'OPTIONS'}}}),
+        'first_health_ms': first({'rawPath': '/health'}),
+        'first_models_ms': first({'rawPath': '/models'})
+    }
+    # Cheap endpoints must not have pulled in boto3 or the HTTP client stack
+    result['boto3_loaded_before_convert'] = 'boto3' in sys.modules or 'botocore' in sys.modules
+    result['first_convert_ms'] = first({'rawPath': '/convert', 'body': json.dumps({
+        'source_db': 'BigQuery', 'sql': 'SELECT SAFE_CAST(a AS INT64) FROM `p.d.t`'
+    })})
+    print(json.dumps(result))
+
+def cold_start(targets, latency_ms, tokens_per_sec, budget_ms):
+    """Measure each Lambda handler's init in a subprocess against an init budget"""
+    results = {}
+    for target in targets:
+        if target not in COLD_START_HANDLERS:
+            continue
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--cold-start-child', target,
+             '--latency-ms', str(latency_ms), '--tokens-per-sec', str(tokens_per_sec)],
+            capture_output=True, text=True, env=os.environ.copy(), timeout=120
+        )
+        if output.returncode != 0:
+            results[target] = {'error': output.stderr.strip().splitlines()[-1] if output.stderr.strip() else 'failed'}
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        init_ms = result['import_ms'] + result['first_health_ms']
+        result['init_ms'] = round(init_ms, 3)
+        result['budget_ms'] = budget_ms
+        result['within_budget'] = init_ms <= budget_ms and not result['boto3_loaded_before_convert']
+        results[target] = result
+    return results
+
+def set_default_environment(workdir):
+    """Point job store, docs index and Knowledge Base at local stand-ins unless already set"""
+    os.environ.setdefault('JOB_STORE', 'sqlite')
+    os.environ.setdefault('JOB_STORE_PATH', os.path.join(workdir, 'jobs.sqlite3'))
+    os.environ.setdefault('KNOWLEDGE_BASE_ID', 'benchmark')
+    os.environ.setdefault('DOCS_INDEX_PATH', os.path.join(workdir, 'missing.idx'))
+    # The fake model echoes the source dialect back, which never validates as Redshift
+    os.environ.setdefault('VALIDATION_REPAIRS', '0')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the conversion pipeline against a fake Bedrock')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='SQL script to replay')
+    parser.add_argument('--large', default='50,200', help='comma separated statement counts of generated scripts')
+    parser.add_argument('--targets', default='lambda,kb,app', help='comma separated: lambda, kb, app')
+    parser.add_argument('--requests', type=int, default=12, help='requests per target')
+    parser.add_argument('--latency-ms', type=float, default=50, help='fake model time to first token')
+    parser.add_argument('--tokens-per-sec', type=float, default=2000, help='fake model output token rate')
+    parser.add_argument('--keep-cache', action='store_true', help='let repeated scripts hit the result cache')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--cold-start', action='store_true', help='also measure handler import and first-request latency')
+    parser.add_argument('--init-budget-ms', type=float, default=INIT_BUDGET_MS, help='import plus first /health budget per handler')
+    parser.add_argument('--cold-start-child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    set_default_environment(tempfile.mkdtemp(prefix='sql-converter-bench-'))
+
+    if args.cold_start_child:
+        cold_start_child(args.cold_start_child, args.latency_ms, args.tokens_per_sec)
+        return
+
+    targets = [t.strip() for t in args.targets.split(',') if t.strip()]
+    cold = None
+    if args.cold_start:
+        # Before this process imports anything, so the children start equally cold
+        cold = cold_start(targets, args.latency_ms, args.tokens_per_sec, args.init_budget_ms)
+        for target, result in cold.items():
+            if 'error' in result:
+                print(f"{target} cold start: failed ({result['error']})")
+            else:
+                print(f"{target} cold start: import {result['import_ms']}ms, first /health {result['first_health_ms']}ms, "
+                      f"first /convert {result['first_convert_ms']}ms ({'within' if result['within_budget'] else 'OVER'} {args.init_budget_ms:g}ms budget)")
+
+    recorder = Recorder()
+    dynamodb = install_fakes(recorder, args.latency_ms, args.tokens_per_sec)
+    corpus = load_corpus(args.corpus, [int(n) for n in args.large.split(',') if n.strip()])
+
+    results = {}
+    for target in targets:
+        try:
+            call = TARGETS[target](recorder, dynamodb)
+        except ImportError as e:
+            results[target] = {'skipped': f"missing dependency: {e}"}
+            print(f"{target}: skipped ({e})")
+            continue
+        results[target] = run_target(call, corpus, args.requests, recorder, dynamodb, args.keep_cache)
+        latency = results[target]['latency_ms']
+        print(f"{target}: p50 {latency['p50']}ms p95 {latency['p95']}ms p99 {latency['p99']}ms")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'corpus': os.path.relpath(args.corpus, REPO_ROOT),
+            'scripts': [{'name': label, 'bytes': len(sql)} for label, sql in corpus],
+            'requests': args.requests,
+            'latency_ms': args.latency_ms,
+            'tokens_per_sec': args.tokens_per_sec,
+            'keep_cache': args.keep_cache
+        },
+        'results': results
+    }
+    if cold is not None:
+        report['cold_start'] = cold
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if cold is not None and not all(r.get('within_budget') for r in cold.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
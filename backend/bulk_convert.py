@@ -0,0 +1,327 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Bulk conversion of a directory tree of .sql files. Each file is one /convert
+# request, sent by a pool of workers under a shared rate limit to one of:
+#
+#   local   lambda_handler.handler in this process (needs AWS credentials for Bedrock)
+#   lambda  the deployed function, invoked directly (no API Gateway timeout)
+#   http    the deployed API's /convert endpoint
+#
+# Converted files mirror the input tree under the output directory. Every
+# finished file is appended to a JSON-lines manifest, so an interrupted run
+# started again with the same arguments skips files already converted and
+# only converts what is new, changed or failed. Retries of a partly failed
+# file reuse its converted statements from the statement cache.
+#
+#   python bulk_convert.py sql/ converted/ --source-db Oracle --workers 8 --rate 4
+
+MANIFEST_NAME = '.bulk_manifest.jsonl'
+DEFAULT_FUNCTION = 'sql-converter-api'
+# Statuses and errors worth another attempt before the file is marked failed
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = ('Throttling', 'TooManyRequests', 'timed out', 'Timeout', 'Connection')
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all workers; rate 0 disables it"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+class Manifest:
+    """Append-only record of finished files, keyed by path relative to the input directory
+
+    One JSON object per line, flushed and fsynced as each file finishes, so a
+    crash loses at most the line being written. On load the last entry for a
+    path wins and a torn final line is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['file']] = entry
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, rel_path, input_hash, options):
+        entry = self.entries.get(rel_path)
+        return (entry is not None and entry['status'] == 'done' and entry['input_sha256'] == input_hash
+                and entry.get('options') == options)
+
+    def record(self, entry):
+        with self.lock:
+            if self.file.closed:
+                # A worker finishing after an interrupt; the file is converted again next run
+                return
+            self.entries[entry['file']] = entry
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+class Progress:
+    """One status line on stderr: files done, failed, skipped, throughput and ETA"""
+
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.tty = sys.stderr.isatty()
+        self.last_line = 0.0
+        self.last_text = None
+
+    def update(self, ok):
+        with self.lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            self.show()
+
+    def show(self, final=False):
+        finished = self.done + self.failed
+        elapsed = time.monotonic() - self.started
+        rate = finished / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.skipped - finished
+        eta = time.strftime('%H:%M:%S', time.gmtime(remaining / rate)) if rate and remaining else '--:--:--'
+        line = (f"[{self.skipped + finished}/{self.total}] converted {self.done} failed {self.failed} "
+                f"skipped {self.skipped} | {rate:.2f} files/s | ETA {eta}")
+        if self.tty:
+            sys.stderr.write('\r' + line + ('\n' if final else ''))
+            sys.stderr.flush()
+        elif (final or time.monotonic() - self.last_line >= 10) and line != self.last_text:
+            # Logs get a line every 10 seconds instead of a redrawn one
+            self.last_line = time.monotonic()
+            self.last_text = line
+            print(line, file=sys.stderr)
+
+def find_sql_files(input_dir, suffix, exclude=None):
+    """Paths relative to input_dir of the files ending in suffix, sorted; hidden and exclude dirs are skipped"""
+    found = []
+    exclude = os.path.abspath(exclude) if exclude else None
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = sorted(
+            d for d in dirs if not d.startswith('.') and os.path.abspath(os.path.join(root, d)) != exclude
+        )
+        for name in files:
+            if name.lower().endswith(suffix.lower()):
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(found)
+
+def local_sender():
+    """Calls lambda_handler.handler in-process, as API Gateway would"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import lambda_handler
+
+    def send(body):
+        response = lambda_handler.handler({'httpMethod': 'POST', 'path': '/convert', 'body': json.dumps(body)}, None)
+        return response['statusCode'], json.loads(response['body'])
+    return send
+
+def lambda_sender(function_name):
+    """Invokes the deployed function directly, like convert-large-sql.sh"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import aws_clients
+    client = aws_clients.client('lambda', read_timeout=900, retries={'max_attempts': 0})
+
+    def send(body):
+        response = client.invoke(FunctionName=function_name, Payload=json.dumps(body).encode('utf-8'))
+        payload = json.loads(response['Payload'].read())
+        if response.get('FunctionError'):
+            return 500, {'error': payload.get('errorMessage', 'Lambda function error')}
+        return payload['statusCode'], json.loads(payload['body'])
+    return send
+
+def http_sender(endpoint, timeout):
+    """POSTs to the deployed API's /convert endpoint"""
+    import urllib.error
+    import urllib.request
+    url = endpoint.rstrip('/') + '/convert'
+
+    def send(body):
+        request = urllib.request.Request(
+            url, data=json.dumps(body).encode('utf-8'), headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read())
+            except ValueError:
+                return e.code, {'error': str(e)}
+    return send
+
+def convert_file(send, limiter, body, retries):
+    """Send one request with retries on throttling and timeouts, returns (result, error)"""
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            # Exponential backoff, capped; retried scripts reuse statements already converted
+            time.sleep(min(30, 2 ** attempt))
+        limiter.wait()
+        try:
+            status, result = send(body)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if not any(marker in error for marker in RETRYABLE_ERRORS):
+                return None, error
+            continue
+        if status == 200:
+            return result, None
+        error = f"HTTP {status}: {result.get('error', result)}"
+        if status not in RETRYABLE_STATUS:
+            return None, error
+    return None, error
+
+def write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def run(args, send):
+    """Convert every pending file, returns the number of files that failed"""
+    options = {'source_db': args.source_db, 'model': args.model, 'include_explanation': args.include_explanation}
+    manifest = Manifest(args.manifest or os.path.join(args.output_dir, MANIFEST_NAME))
+    # An output directory inside the input tree is not converted again
+    files = find_sql_files(args.input_dir, args.suffix, exclude=args.output_dir)
+    pending = []
+    for rel_path in files:
+        with open(os.path.join(args.input_dir, rel_path), 'rb') as f:
+            data = f.read()
+        input_hash = hashlib.sha256(data).hexdigest()
+        if manifest.is_done(rel_path, input_hash, options) and os.path.exists(os.path.join(args.output_dir, rel_path)):
+            continue
+        pending.append((rel_path, data.decode('utf-8', errors='replace'), input_hash))
+
+    progress = Progress(len(files), len(files) - len(pending))
+    limiter = RateLimiter(args.rate)
+    print(f"{len(files)} files, {len(pending)} to convert, {len(files) - len(pending)} already done", file=sys.stderr)
+
+    def work(rel_path, sql, input_hash):
+        started = time.monotonic()
+        result, error = None, None
+        if sql.strip():
+            result, error = convert_file(send, limiter, {**options, 'sql': sql}, args.retries)
+        else:
+            result = {'redshift_sql': sql, 'failed_statements': []}
+        entry = {
+            'file': rel_path, 'input_sha256': input_hash, 'options': options,
+            'seconds': round(time.monotonic() - started, 3), 'finished_at': int(time.time())
+        }
+        if result is None:
+            entry.update(status='failed', error=error)
+        else:
+            output = result['redshift_sql']
+            if args.include_explanation and result.get('explanation'):
+                output += '\n\n/*\n' + result['explanation'].replace('*/', '* /') + '\n*/\n'
+            write_atomic(os.path.join(args.output_dir, rel_path), output)
+            failed_statements = result.get('failed_statements') or []
+            # Files with failed statements are written but converted again on the next run
+            entry.update(
+                status='partial' if failed_statements else 'done', output=rel_path,
+                statements=result.get('statement_count'), failed_statements=len(failed_statements),
+                reused_statements=result.get('reused_statements', 0)
+            )
+        manifest.record(entry)
+        return entry
+
+    failed = 0
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = [pool.submit(work, *item) for item in pending]
+        for future in as_completed(futures):
+            entry = future.result()
+            ok = entry['status'] == 'done'
+            if not ok:
+                failed += 1
+                print(f"\n{entry['file']}: {entry['status']} {entry.get('error', '')}".rstrip(), file=sys.stderr)
+            progress.update(ok)
+    except KeyboardInterrupt:
+        # Files not yet started are dropped; finished ones are already in the manifest
+        pool.shutdown(wait=False, cancel_futures=True)
+        print('\nInterrupted; run the same command again to resume', file=sys.stderr)
+        raise
+    finally:
+        progress.show(final=True)
+        manifest.close()
+    pool.shutdown()
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert a directory tree of SQL files to Redshift, resumably')
+    parser.add_argument('input_dir', help='directory searched recursively for SQL files')
+    parser.add_argument('output_dir', help='directory the converted files are written to, mirroring input_dir')
+    parser.add_argument('--source-db', required=True, help='source database, e.g. Oracle, Snowflake, BigQuery')
+    parser.add_argument('--model', default='nova-pro', help="model key, or 'auto'")
+    parser.add_argument('--include-explanation', action='store_true', help='append the explanation as a trailing comment')
+    parser.add_argument('--target', choices=('local', 'lambda', 'http'), default='local', help='where conversions run')
+    parser.add_argument('--function-name', default=DEFAULT_FUNCTION, help='Lambda function for --target lambda')
+    parser.add_argument('--endpoint', help='API base URL for --target http')
+    parser.add_argument('--workers', type=int, default=4, help='files converted concurrently')
+    parser.add_argument('--rate', type=float, default=2.0, help='max requests per second across workers, 0 for no limit')
+    parser.add_argument('--retries', type=int, default=3, help='retries per file on throttling, timeouts and 5xx')
+    parser.add_argument('--timeout', type=float, default=60, help='HTTP timeout in seconds for --target http')
+    parser.add_argument('--suffix', default='.sql', help='file name suffix to convert')
+    parser.add_argument('--manifest', help=f"manifest path, default output_dir/{MANIFEST_NAME}")
+    parser.add_argument('--log', default=os.devnull, help='file for the handler log lines of --target local')
+    args = parser.parse_args(argv)
+    if args.target == 'http' and not args.endpoint:
+        parser.error('--endpoint is required with --target http')
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"{args.input_dir} is not a directory")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.target == 'local':
+        send = local_sender()
+    elif args.target == 'lambda':
+        send = lambda_sender(args.function_name)
+    else:
+        send = http_sender(args.endpoint, args.timeout)
+
+    # The in-process handler prints a metrics line per request; keep stdout for it
+    # away from the terminal so it does not break the progress line
+    with open(args.log, 'a', encoding='utf-8') as log:
+        stdout = sys.stdout
+        if args.target == 'local':
+            sys.stdout = log
+        try:
+            failed = run(args, send)
+        finally:
+            sys.stdout = stdout
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
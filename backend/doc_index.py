@@ -0,0 +1,220 @@
+import heapq
+import math
+import mmap
+import os
+import re
+import struct
+from collections import Counter
+
+# Offline retrieval over the Redshift documentation pages downloaded by
+# infrastructure/download-docs.sh. Pages are split into heading-scoped chunks
+# and written to a single BM25 index file that is memory-mapped at load, so a
+# cold start only maps the file and lookups never leave the process.
+#
+# File layout (little endian):
+#   header    magic, term count, chunk count, average chunk length, section offsets
+#   terms     sorted fixed-size records (string offset, string length, postings start, df)
+#   strings   utf-8 term text
+#   postings  (chunk id, term frequency) records grouped by term
+#   chunks    (length in tokens, text offset, text length) records
+#   text      utf-8 chunk text
+
+MAGIC = b'SQLDOCX1'
+_HEADER = struct.Struct('<8sIIfQQQQQ')
+_TERM = struct.Struct('<IHII')
+_POSTING = struct.Struct('<IH')
+_CHUNK = struct.Struct('<III')
+
+CHUNK_CHARS = 1500
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r'[a-z_][a-z0-9_]*')
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'for', 'from', 'if', 'in',
+    'is', 'it', 'its', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'when',
+    'which', 'with', 'you', 'your'
+}
+
+def terms(text):
+    """Lower-cased index terms in a piece of text"""
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOP_WORDS]
+
+def chunk_page(text, source):
+    """Split extracted page text into chunks of at most CHUNK_CHARS under their heading"""
+    chunks = []
+    title = source
+    heading = None
+    body = []
+
+    def flush():
+        paragraphs = [p for p in '\n'.join(body).split('\n\n') if p.strip()]
+        prefix = f"[{title}{' > ' + heading if heading and heading != title else ''}]\n"
+        current = ''
+        for paragraph in paragraphs:
+            while len(paragraph) > CHUNK_CHARS:
+                if current:
+                    chunks.append(prefix + current)
+                    current = ''
+                chunks.append(prefix + paragraph[:CHUNK_CHARS])
+                paragraph = paragraph[CHUNK_CHARS:]
+            if current and len(current) + len(paragraph) + 2 > CHUNK_CHARS:
+                chunks.append(prefix + current)
+                current = ''
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current:
+            chunks.append(prefix + current)
+        body.clear()
+
+    for line in text.split('\n'):
+        if line.startswith('#'):
+            flush()
+            heading = line.lstrip('#').strip()
+            if line.startswith('# ') and title == source:
+                title = heading
+        else:
+            body.append(line)
+    flush()
+    return chunks
+
+def build_index(paths, out_path):
+    """Chunk HTML or text pages and write a BM25 index file, returns the chunk count"""
+    # Only index builds parse HTML; lookups in the Lambda never load the parser
+    import html_text
+    chunks = []
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            content = f.read()
+        if path.endswith(('.html', '.htm')):
+            content = html_text.html_to_text(content, max_chars=len(content))
+        chunks.extend(chunk_page(content, os.path.splitext(os.path.basename(path))[0]))
+
+    postings = {}
+    lengths = []
+    for chunk_id, chunk in enumerate(chunks):
+        counts = Counter(terms(chunk))
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term.encode('utf-8'), []).append((chunk_id, min(tf, 0xFFFF)))
+
+    vocabulary = sorted(postings)
+    term_records = bytearray()
+    strings = bytearray()
+    posting_records = bytearray()
+    posting_count = 0
+    for term in vocabulary:
+        entries = postings[term]
+        term_records += _TERM.pack(len(strings), len(term), posting_count, len(entries))
+        strings += term
+        for chunk_id, tf in entries:
+            posting_records += _POSTING.pack(chunk_id, tf)
+        posting_count += len(entries)
+
+    chunk_records = bytearray()
+    text = bytearray()
+    for chunk, length in zip(chunks, lengths):
+        encoded = chunk.encode('utf-8')
+        chunk_records += _CHUNK.pack(length, len(text), len(encoded))
+        text += encoded
+
+    terms_off = _HEADER.size
+    strings_off = terms_off + len(term_records)
+    postings_off = strings_off + len(strings)
+    chunks_off = postings_off + len(posting_records)
+    text_off = chunks_off + len(chunk_records)
+    avgdl = sum(lengths) / len(lengths) if lengths else 0.0
+
+    with open(out_path, 'wb') as f:
+        f.write(_HEADER.pack(
+            MAGIC, len(vocabulary), len(chunks), avgdl,
+            terms_off, strings_off, postings_off, chunks_off, text_off
+        ))
+        for section in (term_records, strings, posting_records, chunk_records, text):
+            f.write(section)
+    return len(chunks)
+
+class DocIndex:
+    """Read-only BM25 index backed by a memory-mapped file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.term_count, self.chunk_count, self.avgdl, self.terms_off,
+         self.strings_off, self.postings_off, self.chunks_off, self.text_off) = _HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a documentation index")
+
+    def _term(self, index):
+        str_off, str_len, start, df = _TERM.unpack_from(self.data, self.terms_off + index * _TERM.size)
+        offset = self.strings_off + str_off
+        return self.data[offset:offset + str_len], start, df
+
+    def _lookup(self, term):
+        """(postings start, df) for a term, binary searched in the term table"""
+        key = term.encode('utf-8')
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found, start, df = self._term(mid)
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                return start, df
+        return None
+
+    def chunk_text(self, chunk_id):
+        _, text_off, text_len = _CHUNK.unpack_from(self.data, self.chunks_off + chunk_id * _CHUNK.size)
+        offset = self.text_off + text_off
+        return self.data[offset:offset + text_len].decode('utf-8')
+
+    def _chunk_length(self, chunk_id):
+        return _CHUNK.unpack_from(self.data, self.chunks_off + chunk_id * _CHUNK.size)[0]
+
+    def search(self, query, num_results=5):
+        """Top chunks for a query by BM25 score, as a list of texts like retrieve_from_kb"""
+        scores = {}
+        for term in set(terms(query)):
+            found = self._lookup(term)
+            if found is None:
+                continue
+            start, df = found
+            idf = math.log(1 + (self.chunk_count - df + 0.5) / (df + 0.5))
+            for i in range(df):
+                chunk_id, tf = _POSTING.unpack_from(self.data, self.postings_off + (start + i) * _POSTING.size)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._chunk_length(chunk_id) / (self.avgdl or 1))
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        best = heapq.nlargest(num_results, scores.items(), key=lambda item: item[1])
+        return [self.chunk_text(chunk_id) for chunk_id, _ in best]
+
+def load_index(path):
+    """Open an index file, or None when it is missing or unreadable"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return DocIndex(path)
+    except Exception as e:
+        print(f"Documentation index error: {e}")
+        return None
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Build or query the local Redshift documentation index')
+    parser.add_argument('pages', nargs='*', help='HTML or text pages to index')
+    parser.add_argument('-o', '--output', default='redshift_docs.idx', help='index file to write or query')
+    parser.add_argument('-q', '--query', help='search the index instead of building it')
+    parser.add_argument('-n', '--num-results', type=int, default=3)
+    args = parser.parse_args()
+    if args.query:
+        index = load_index(args.output)
+        if index is None:
+            parser.error(f"no index at {args.output}")
+        for text in index.search(args.query, args.num_results):
+            print(text)
+            print('---')
+    else:
+        if not args.pages:
+            parser.error('no pages given')
+        count = build_index(args.pages, args.output)
+        print(f"Indexed {count} chunks from {len(args.pages)} pages into {args.output}")
@@ -0,0 +1,111 @@
+import codecs
+import itertools
+import re
+from html.parser import HTMLParser
+
+# Incremental HTML-to-text extraction for documentation pages. The response is
+# parsed chunk by chunk, navigation and script noise is dropped, headings are
+# kept as markdown-style "## Title" lines for chunking, and reading stops as
+# soon as enough text has been collected.
+
+# Elements whose content is never documentation text
+SKIP_TAGS = {
+    'script', 'style', 'noscript', 'template', 'svg', 'nav', 'header', 'footer',
+    'aside', 'form', 'button', 'select', 'iframe', 'head'
+}
+HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'main', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'tr',
+    'table', 'pre', 'blockquote', 'br', 'hr', 'title', 'caption', 'figure'
+}
+
+_SPACE_RE = re.compile(r'[ \t\r\f\v\n]+')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+class TextExtractor(HTMLParser):
+    """HTMLParser that collects readable text up to max_chars characters"""
+
+    def __init__(self, max_chars=100000):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        # (text, preformatted) pairs; text from <pre> keeps its whitespace
+        self.parts = []
+        self.length = 0
+        self.skip_depth = 0
+        self.pre_depth = 0
+
+    @property
+    def done(self):
+        return self.length >= self.max_chars
+
+    def _emit(self, text, preformatted=False):
+        self.parts.append((text, preformatted))
+        self.length += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif self.skip_depth:
+            return
+        elif tag in HEADING_TAGS:
+            self._emit('\n\n' + '#' * HEADING_TAGS[tag] + ' ')
+        elif tag in BLOCK_TAGS:
+            if tag == 'pre':
+                self.pre_depth += 1
+            self._emit('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif self.skip_depth:
+            return
+        elif tag in HEADING_TAGS:
+            self._emit('\n')
+        elif tag in BLOCK_TAGS:
+            if tag == 'pre':
+                self.pre_depth = max(0, self.pre_depth - 1)
+            self._emit('\n')
+
+    def handle_data(self, data):
+        if self.skip_depth or self.done:
+            return
+        if self.pre_depth:
+            self._emit(data, preformatted=True)
+            return
+        data = _SPACE_RE.sub(' ', data)
+        if data.strip():
+            self._emit(data)
+
+    def text(self):
+        """Collected text with spaces and blank-line runs collapsed outside <pre>, cut to max_chars"""
+        pieces = []
+        for preformatted, group in itertools.groupby(self.parts, key=lambda part: part[1]):
+            text = ''.join(part for part, _ in group)
+            if not preformatted:
+                lines = [' '.join(line.split()) for line in text.split('\n')]
+                text = _BLANK_LINES_RE.sub('\n\n', '\n'.join(lines))
+            pieces.append(text)
+        return ''.join(pieces).strip()[:self.max_chars]
+
+def read_text(stream, max_chars=100000, chunk_size=65536, encoding='utf-8'):
+    """Extract text from a file-like HTML response without reading all of it
+
+    Stops reading once max_chars characters of text have been collected.
+    """
+    extractor = TextExtractor(max_chars)
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    while not extractor.done:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            extractor.feed(decoder.decode(b'', final=True))
+            break
+        extractor.feed(decoder.decode(chunk))
+    extractor.close()
+    return extractor.text()
+
+def html_to_text(html, max_chars=100000):
+    """Extract text from an HTML string"""
+    extractor = TextExtractor(max_chars)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
@@ -0,0 +1,239 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+JOBS_TABLE = os.environ.get('JOBS_TABLE', 'sql-converter-jobs')
+JOBS_BUCKET = os.environ.get('JOBS_BUCKET', '')
+JOB_TTL_HOURS = int(os.environ.get('JOB_TTL_HOURS', '168'))  # 7 days
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', 'jobs.sqlite3')
+
+def new_job(source_db, model, include_explanation):
+    """Job record in its initial queued state"""
+    now = datetime.now().isoformat()
+    return {
+        'job_id': uuid.uuid4().hex,
+        'status': 'queued',
+        'source_db': source_db,
+        'model': model,
+        'include_explanation': bool(include_explanation),
+        'statement_count': 0,
+        'completed_count': 0,
+        'failed_count': 0,
+        'statements': [],
+        'created_at': now,
+        'updated_at': now
+    }
+
+class SQLiteJobStore:
+    """Job store on a local SQLite file, for development and tests"""
+
+    def __init__(self, path=JOB_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, job TEXT NOT NULL, input_sql TEXT NOT NULL, result TEXT)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _load(self, conn, job_id):
+        row = conn.execute("SELECT job FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _update(self, job_id, change, result=None):
+        """Apply change to a job, and store result with it in the same UPDATE; None for an unknown job"""
+        with self.lock, self._connect() as conn:
+            job = self._load(conn, job_id)
+            if job is None:
+                return None
+            change(job)
+            job['updated_at'] = datetime.now().isoformat()
+            if result is None:
+                conn.execute("UPDATE jobs SET job = ? WHERE job_id = ?", (json.dumps(job), job_id))
+            else:
+                conn.execute("UPDATE jobs SET job = ?, result = ? WHERE job_id = ?", (json.dumps(job), json.dumps(result), job_id))
+            return job
+
+    def create_job(self, source_db, sql, model, include_explanation):
+        job = new_job(source_db, model, include_explanation)
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, job, input_sql) VALUES (?, ?, ?)",
+                (job['job_id'], json.dumps(job), sql)
+            )
+        return job
+
+    def get_job(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT job, result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        job = json.loads(row[0])
+        if row[1]:
+            job.update(json.loads(row[1]))
+        return job
+
+    def get_input(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT input_sql FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def start_job(self, job_id, statement_count, deadline=None):
+        def change(job):
+            job['status'] = 'running'
+            job['statement_count'] = statement_count
+            job['statements'] = [{'index': i, 'status': 'pending'} for i in range(statement_count)]
+            if deadline is not None:
+                job['deadline'] = int(deadline)
+        self._update(job_id, change)
+
+    def update_statement(self, job_id, index, status, error=None, path=None):
+        def change(job):
+            entry = {'index': index, 'status': status}
+            if path:
+                entry['path'] = path
+            if error:
+                entry['error'] = error
+            job['statements'][index] = entry
+            job['failed_count' if status == 'failed' else 'completed_count'] += 1
+        self._update(job_id, change)
+
+    def finish_job(self, job_id, status, redshift_sql=None, explanation=None, error=None):
+        def change(job):
+            job['status'] = status
+            if error:
+                job['error'] = error
+        # Status and result in one UPDATE, so a poller never sees completed without the SQL
+        result = {'redshift_sql': redshift_sql, 'explanation': explanation} if redshift_sql is not None else None
+        self._update(job_id, change, result)
+
+class DynamoDBJobStore:
+    """Job metadata in DynamoDB, with SQL bodies in S3 when a bucket is configured
+
+    Without a bucket the input and result are stored inline on the item, which
+    limits scripts to DynamoDB's 400KB item size.
+    """
+
+    def __init__(self, table_name=JOBS_TABLE, bucket=JOBS_BUCKET):
+        self.table_name = table_name
+        self.bucket = bucket
+
+    @property
+    def table(self):
+        # Built on first use so creating the store costs nothing at import time
+        import aws_clients
+        return aws_clients.table(self.table_name)
+
+    @property
+    def s3(self):
+        import aws_clients
+        return aws_clients.client('s3')
+
+    def _put_body(self, key, text):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=text.encode('utf-8'))
+
+    def _get_body(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read().decode('utf-8')
+
+    def create_job(self, source_db, sql, model, include_explanation):
+        job = new_job(source_db, model, include_explanation)
+        item = {**job, 'expires_at': int(time.time()) + JOB_TTL_HOURS * 3600}
+        if self.bucket:
+            self._put_body(f"jobs/{job['job_id']}/input.sql", sql)
+        else:
+            item['input_sql'] = sql
+        self.table.put_item(Item=item)
+        return job
+
+    def get_job(self, job_id):
+        item = self.table.get_item(Key={'job_id': job_id}).get('Item')
+        if not item:
+            return None
+        job = {k: v for k, v in item.items() if k not in ('input_sql', 'result', 'expires_at')}
+        for key in ('statement_count', 'completed_count', 'failed_count'):
+            job[key] = int(job.get(key, 0))
+        if 'deadline' in job:
+            job['deadline'] = int(job['deadline'])
+        job['statements'] = [{**s, 'index': int(s['index'])} for s in job.get('statements', [])]
+        if job['status'] in ('completed', 'completed_with_errors'):
+            result = item.get('result')
+            if result is None and self.bucket:
+                result = self._get_body(f"jobs/{job_id}/result.json")
+            if result:
+                job.update(json.loads(result))
+        return job
+
+    def get_input(self, job_id):
+        if self.bucket:
+            return self._get_body(f"jobs/{job_id}/input.sql")
+        item = self.table.get_item(Key={'job_id': job_id}).get('Item')
+        return item.get('input_sql') if item else None
+
+    def start_job(self, job_id, statement_count, deadline=None):
+        expression = 'SET #status = :running, statement_count = :n, statements = :statements, updated_at = :now'
+        values = {
+            ':running': 'running',
+            ':n': statement_count,
+            ':statements': [{'index': i, 'status': 'pending'} for i in range(statement_count)],
+            ':now': datetime.now().isoformat()
+        }
+        if deadline is not None:
+            expression += ', deadline = :deadline'
+            values[':deadline'] = int(deadline)
+        self.table.update_item(
+            Key={'job_id': job_id},
+            UpdateExpression=expression,
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues=values
+        )
+
+    def update_statement(self, job_id, index, status, error=None, path=None):
+        entry = {'index': index, 'status': status}
+        if path:
+            entry['path'] = path
+        if error:
+            entry['error'] = error
+        counter = 'failed_count' if status == 'failed' else 'completed_count'
+        # Atomic per-statement update so concurrent workers never overwrite each other
+        self.table.update_item(
+            Key={'job_id': job_id},
+            UpdateExpression=f'SET statements[{int(index)}] = :entry, updated_at = :now ADD {counter} :one',
+            ExpressionAttributeValues={':entry': entry, ':now': datetime.now().isoformat(), ':one': 1}
+        )
+
+    def finish_job(self, job_id, status, redshift_sql=None, explanation=None, error=None):
+        names = {'#status': 'status'}
+        values = {':status': status, ':now': datetime.now().isoformat()}
+        expression = 'SET #status = :status, updated_at = :now'
+        if error:
+            expression += ', #error = :error'
+            names['#error'] = 'error'
+            values[':error'] = error
+        if redshift_sql is not None:
+            result = json.dumps({'redshift_sql': redshift_sql, 'explanation': explanation})
+            if self.bucket:
+                self._put_body(f"jobs/{job_id}/result.json", result)
+            else:
+                expression += ', #result = :result'
+                names['#result'] = 'result'
+                values[':result'] = result
+        self.table.update_item(
+            Key={'job_id': job_id},
+            UpdateExpression=expression,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+def job_store_from_env(default='dynamodb'):
+    """Pick the job store backend from JOB_STORE (dynamodb or sqlite)"""
+    backend = os.environ.get('JOB_STORE', default)
+    if backend == 'sqlite':
+        return SQLiteJobStore(JOB_STORE_PATH)
+    return DynamoDBJobStore(JOBS_TABLE, JOBS_BUCKET)
@@ -0,0 +1,80 @@
+import os
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+
+import sql_splitter
+
+# A queued or running job without a deadline is failed once it has made no
+# progress for this long; the default is the longest Lambda timeout
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '900'))
+# Slack past a job's deadline before it is failed, for its last writes to land
+JOB_DEADLINE_GRACE_SECONDS = 5
+
+def run_job(store, job_id, convert_fn, executor, deadline=None):
+    """Convert a stored job statement by statement, recording progress as each finishes
+
+    convert_fn(statement) returns (redshift_sql, explanation, path). Statements
+    run concurrently on executor and are reassembled in their original order.
+    deadline is the time.time() by which the worker is stopped, e.g. the end of
+    its Lambda invocation; it is stored with the job for expire_stale().
+    """
+    job = store.get_job(job_id)
+    if job is None:
+        print(f"Job not found: {job_id}")
+        return None
+    try:
+        sql = store.get_input(job_id)
+        statements = sql_splitter.split_statements(sql, job['source_db'])
+        store.start_job(job_id, len(statements), deadline)
+
+        def convert_one(statement):
+            if sql_splitter.is_comment_only(statement):
+                return statement, None, 'comment'
+            return convert_fn(statement)
+
+        futures = {executor.submit(convert_one, statement): i for i, statement in enumerate(statements)}
+        results = [None] * len(statements)
+        failed = 0
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+                store.update_statement(job_id, index, 'completed', path=results[index][2])
+            except Exception as e:
+                print(f"Job {job_id} statement {index} error: {e}")
+                results[index] = (f"-- Conversion failed: {e}\n{statements[index]}", None, 'model')
+                failed += 1
+                store.update_statement(job_id, index, 'failed', str(e))
+
+        explanation = None
+        if job['include_explanation']:
+            explanation = "\n\n".join(
+                f"Statement {i}: {exp}" for i, (_, exp, _) in enumerate(results, 1) if exp
+            ) or None
+        status = 'completed_with_errors' if failed else 'completed'
+        store.finish_job(job_id, status, sql_splitter.join_statements(r[0] for r in results), explanation)
+        return status
+    except Exception as e:
+        print(f"Job {job_id} error: {e}")
+        store.finish_job(job_id, 'failed', error=str(e))
+        return 'failed'
+
+def expire_stale(store, job):
+    """Record a failure for a queued or running job whose worker can no longer be alive
+
+    A job whose deadline has passed, or that has made no progress for
+    JOB_STALE_SECONDS, would otherwise stay running forever. Returns the job
+    as it is now stored.
+    """
+    if job is None or job['status'] not in ('queued', 'running'):
+        return job
+    now = time.time()
+    if job.get('deadline') is not None:
+        expired = now > job['deadline'] + JOB_DEADLINE_GRACE_SECONDS
+    else:
+        expired = now - datetime.fromisoformat(job['updated_at']).timestamp() > JOB_STALE_SECONDS
+    if not expired:
+        return job
+    store.finish_job(job['job_id'], 'failed', error='Job did not finish before its worker stopped')
+    return store.get_job(job['job_id'])
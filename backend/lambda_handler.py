@@ -1,24 +1,92 @@
+import functools
 import json
-import boto3
+import os
 import re
-import urllib.request
-import urllib.error
+import threading
+import time
+from collections import Counter
 from datetime import datetime, timedelta
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 
-bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-features_table = dynamodb.Table('sql-converter-features')
+import aws_clients
+import jobs
+import model_invoke
+import model_router
+import prompt_context
+import request_metrics
+import result_cache
+import rule_engine
+import sql_splitter
+import sql_validator
+import static_responses
+import usage_stats
+
+# Per-call deadline for model invocations; keep it under the API Gateway timeout
+MODEL_DEADLINE_SECONDS = float(os.environ.get('MODEL_DEADLINE_SECONDS', '25'))
+# Model raced against a slow call, 'none' disables hedging; it is only used for
+# models of the same or a lower tier, so a hedge never downgrades the answer
+HEDGE_MODEL_KEY = os.environ.get('HEDGE_MODEL', '')
+# Re-prompts per statement whose converted SQL fails local validation, 0 only reports the issues
+VALIDATION_REPAIRS = int(os.environ.get('VALIDATION_REPAIRS', '1'))
+
+# AWS clients and the job store are built on first use, so a cold start that
+# only serves /health, /models or OPTIONS never imports boto3
+def bedrock_client():
+    # Retries are handled by model_invoke so they can respect the call deadline
+    return aws_clients.client(
+        'bedrock-runtime',
+        connect_timeout=5,
+        read_timeout=int(MODEL_DEADLINE_SECONDS) + 5,
+        retries={'mode': 'standard', 'max_attempts': 1}
+    )
+
+def features_table():
+    return aws_clients.table('sql-converter-features')
+
+@functools.lru_cache(maxsize=None)
+def jobs_store():
+    import job_store
+    return job_store.job_store_from_env()
+
+# Token usage, latency and cache counters behind GET /stats
+stats_store = usage_stats.UsageStats(usage_stats.STATS_TABLE)
 
 CACHE_DURATION_HOURS = 168  # 7 days
 
+# How long a warm container trusts its in-memory feature list before revalidating
+FEATURES_MEMORY_TTL_SECONDS = int(os.environ.get('FEATURES_MEMORY_TTL_SECONDS', '300'))
+
+DEFAULT_REDSHIFT_FEATURES = [
+    "QUALIFY clause is SUPPORTED (filters window function results)",
+    "MERGE statement is SUPPORTED (upsert operations)",
+    "SUPER data type is SUPPORTED (semi-structured data)",
+    "UNNEST is SUPPORTED (converts arrays to rows)",
+    "TRY_CAST is SUPPORTED (safe type conversion)",
+    "GROUP BY ALL is SUPPORTED"
+]
+
+_features_memory = {'features': None, 'loaded_at': 0.0, 'refreshing': False}
+_features_lock = threading.Lock()
+
+# Upper bound on concurrent Bedrock calls when fanning out a multi-statement script
+MAX_PARALLEL_STATEMENTS = int(os.environ.get('MAX_PARALLEL_STATEMENTS', '8'))
+statement_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_STATEMENTS)
+# Primary and hedge calls for each statement run here, never on statement_pool
+model_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_STATEMENTS * 2)
+
 AVAILABLE_MODELS = {
-    'nova-pro': {'id': 'amazon.nova-pro-v1:0', 'name': 'Amazon Nova Pro', 'format': 'nova'},
-    'claude-haiku-4.5': {'id': 'us.anthropic.claude-haiku-4-5-20251001-v1:0', 'name': 'Claude Haiku 4.5', 'format': 'anthropic'},
-    'claude-opus-4.5': {'id': 'us.anthropic.claude-opus-4-5-20251101-v1:0', 'name': 'Claude Opus 4.5', 'format': 'anthropic'},
-    'claude-opus-4.6': {'id': 'us.anthropic.claude-opus-4-6-v1', 'name': 'Claude Opus 4.6', 'format': 'anthropic'}
+    'nova-pro': {'id': 'amazon.nova-pro-v1:0', 'name': 'Amazon Nova Pro', 'format': 'nova', 'tier': 0},
+    'claude-haiku-4.5': {'id': 'us.anthropic.claude-haiku-4-5-20251001-v1:0', 'name': 'Claude Haiku 4.5', 'format': 'anthropic', 'tier': 1},
+    'claude-opus-4.5': {'id': 'us.anthropic.claude-opus-4-5-20251101-v1:0', 'name': 'Claude Opus 4.5', 'format': 'anthropic', 'tier': 2},
+    'claude-opus-4.6': {'id': 'us.anthropic.claude-opus-4-6-v1', 'name': 'Claude Opus 4.6', 'format': 'anthropic', 'tier': 2}
 }
 
+# model "auto" scores each statement locally and routes it to the cheapest
+# model whose tier covers the score (see model_router.ROUTING_TIERS)
+AUTO_MODEL_KEY = 'auto'
+AUTO_MODEL = {'id': None, 'name': 'Auto (routed by complexity)', 'format': None, 'auto': True}
+
 REFERENCE_DOCS = {
     "Redshift": "https://docs.aws.amazon.com/redshift/latest/dg/",
     "Teradata": "https://docs.teradata.com/",
@@ -36,44 +104,48 @@ REDSHIFT_FEATURE_PAGES = {
     "window_functions": "https://docs.aws.amazon.com/redshift/latest/dg/c_Window_functions.html"
 }
 
-def get_cached_features():
-    """Get features from DynamoDB cache"""
+def get_cached_features(include_stale=False):
+    """Get features from DynamoDB cache, returns (features, is_fresh)"""
     try:
-        response = features_table.get_item(Key={'feature_key': 'redshift_features'})
+        response = features_table().get_item(Key={'feature_key': 'redshift_features'})
         if 'Item' in response:
             item = response['Item']
             cached_time = datetime.fromisoformat(item['updated_at'])
-            if datetime.now() - cached_time < timedelta(hours=CACHE_DURATION_HOURS):
-                return item.get('features', [])
+            is_fresh = datetime.now() - cached_time < timedelta(hours=CACHE_DURATION_HOURS)
+            if is_fresh or include_stale:
+                return item.get('features', []), is_fresh
     except Exception as e:
         print(f"Cache read error: {e}")
-    return None
+    return None, False
 
 def save_features_to_cache(features):
     """Save features to DynamoDB"""
     try:
-        features_table.put_item(Item={
+        features_table().put_item(Item={
             'feature_key': 'redshift_features',
             'features': features,
             'updated_at': datetime.now().isoformat()
         })
     except Exception as e:
         print(f"Cache write error: {e}")
+    remember_features(features)
 
 def fetch_doc_snippet(url, max_length=500):
     """Fetch documentation snippet"""
+    # Deferred: only feature refreshes fetch pages, never the request path
+    import urllib.request
+    import html_text
     try:
         req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
         with urllib.request.urlopen(req, timeout=3) as response:
-            html = response.read().decode('utf-8')
-            text = re.sub(r'<[^>]+>', ' ', html)
-            text = re.sub(r'\s+', ' ', text).strip()
-            return text[:max_length]
+            return html_text.read_text(response, max_chars=max_length)
     except Exception as e:
         return None
 
 def fetch_redshift_features():
     """Fetch latest Redshift features using AI detection"""
+    import urllib.request
+    import html_text
     try:
         # Fetch documentation page
         req = urllib.request.Request(
@@ -81,9 +153,7 @@ def fetch_redshift_features():
             headers={'User-Agent': 'Mozilla/5.0'}
         )
         with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8')
-            text = re.sub(r'<[^>]+>', ' ', html)
-            text = re.sub(r'\s+', ' ', text).strip()[:50000]  # Limit to 50K chars
+            text = html_text.read_text(response, max_chars=50000)  # Limit to 50K chars
             
             # Use AI to extract features
             prompt = f"""Extract all Amazon Redshift SQL features, functions, and capabilities mentioned in this documentation.
@@ -99,7 +169,7 @@ Return 15-25 most important features.
 
 Format: ["feature 1", "feature 2", ...]"""
 
-            response = bedrock.invoke_model(
+            response = bedrock_client().invoke_model(
                 modelId='amazon.nova-pro-v1:0',
                 body=json.dumps({
                     "messages": [{"role": "user", "content": [{"text": prompt}]}],
@@ -117,30 +187,63 @@ Format: ["feature 1", "feature 2", ...]"""
     except Exception as e:
         print(f"AI feature detection error: {e}")
         # Fallback to basic detection
-        return [
-            "QUALIFY clause is SUPPORTED (filters window function results)",
-            "MERGE statement is SUPPORTED (upsert operations)",
-            "SUPER data type is SUPPORTED (semi-structured data)",
-            "UNNEST is SUPPORTED (converts arrays to rows)",
-            "TRY_CAST is SUPPORTED (safe type conversion)",
-            "GROUP BY ALL is SUPPORTED"
-        ]
+        return list(DEFAULT_REDSHIFT_FEATURES)
+
+def remember_features(features):
+    """Store features in the container's memory cache"""
+    with _features_lock:
+        _features_memory['features'] = features
+        _features_memory['loaded_at'] = time.time()
+
+def refresh_features_in_background():
+    """Revalidate the feature cache on a daemon thread, at most one at a time"""
+    with _features_lock:
+        if _features_memory['refreshing']:
+            return
+        _features_memory['refreshing'] = True
+    
+    def refresh():
+        try:
+            features, is_fresh = get_cached_features()
+            if features and is_fresh:
+                remember_features(features)
+                return
+            features = fetch_redshift_features()
+            if features:
+                save_features_to_cache(features)
+        except Exception as e:
+            print(f"Feature refresh error: {e}")
+        finally:
+            with _features_lock:
+                _features_memory['refreshing'] = False
+    
+    threading.Thread(target=refresh, daemon=True).start()
 
 def get_redshift_features():
-    """Get Redshift features with DynamoDB caching"""
-    # Try cache first
-    cached = get_cached_features()
-    if cached:
-        return cached
+    """Get Redshift features with stale-while-revalidate caching
+
+    Warm containers serve from memory. Expired entries are still served while a
+    background refresh runs. A cold container reads DynamoDB once and never
+    waits on fetch_redshift_features; it falls back to DEFAULT_REDSHIFT_FEATURES.
+    """
+    with _features_lock:
+        features = _features_memory['features']
+        age = time.time() - _features_memory['loaded_at']
     
-    # Fetch fresh data
-    features = fetch_redshift_features()
+    if features is not None:
+        if age >= FEATURES_MEMORY_TTL_SECONDS:
+            refresh_features_in_background()
+        return features
     
-    # Save to cache
+    features, is_fresh = get_cached_features(include_stale=True)
     if features:
-        save_features_to_cache(features)
+        remember_features(features)
+        if not is_fresh:
+            refresh_features_in_background()
+        return features
     
-    return features
+    refresh_features_in_background()
+    return DEFAULT_REDSHIFT_FEATURES
 
 def get_conversion_rules(source_db):
     rules = {
@@ -153,26 +256,15 @@ def get_conversion_rules(source_db):
     }
     return rules.get(source_db, "")
 
-def build_prompt(source_db, sql, include_explanation):
-    rules = get_conversion_rules(source_db)
-    
-    # Fetch latest Redshift features
-    redshift_features = get_redshift_features()
-    features_text = "\n".join([f"- {f}" for f in redshift_features]) if redshift_features else ""
-    
-    prompt = f"""Convert this {source_db} SQL to Amazon Redshift SQL.
-
-LATEST REDSHIFT FEATURES (verified from docs):
-{features_text}
-
-Key conversions: {rules}
-
-Source SQL ({source_db}):
-```sql
-{sql}
-```
-
-Requirements:
+def prompt_instructions(source_db, context, include_explanation):
+    """Everything in a conversion prompt before the source SQL, for the chosen rules and features"""
+    prefix = f"Convert {source_db} SQL to Amazon Redshift SQL.\n\n"
+    if context['features']:
+        features_text = "\n".join([f"- {f}" for f in context['features']])
+        prefix += f"LATEST REDSHIFT FEATURES (verified from docs):\n{features_text}\n\n"
+    if context['rules']:
+        prefix += f"Key conversions: {', '.join(context['rules'])}\n\n"
+    prefix += """Requirements:
 1. Convert data types to Redshift equivalents
 2. Replace unsupported functions
 3. Preserve original logic exactly
@@ -182,7 +274,7 @@ Requirements:
 
 """
     if include_explanation:
-        prompt += """Format:
+        prefix += """Format:
 
 CONVERTED SQL:
 ```sql
@@ -193,149 +285,694 @@ EXPLANATION:
 [Key changes]
 """
     else:
-        prompt += "Provide ONLY the converted SQL."
-    return prompt
+        prefix += "Provide ONLY the converted SQL.\n"
+    return prefix
 
-def handler(event, context):
-    try:
-        # Parse request
-        if 'body' in event:
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-        else:
-            body = event
-        
-        source_db = body.get('source_db')
-        sql = body.get('sql')
-        include_explanation = body.get('include_explanation', False)
-        model_key = body.get('model', 'nova-pro')
-        
-        # Handle OPTIONS for CORS
-        if event.get('requestContext', {}).get('http', {}).get('method') == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                },
-                'body': ''
-            }
-        
-        # Handle GET /health
-        if event.get('rawPath') == '/health' or event.get('path') == '/health':
+def build_prompt(source_db, sql, include_explanation, redshift_features=None, model_config=None):
+    """Conversion prompt carrying only the rules and features relevant to the SQL, which comes last"""
+    # Fetch latest Redshift features
+    if redshift_features is None:
+        redshift_features = get_redshift_features()
+    model_config = model_config or AVAILABLE_MODELS['nova-pro']
+    source = f"""
+Source SQL ({source_db}):
+```sql
+{sql}
+```"""
+    context = prompt_context.select_context(
+        sql, source_db, model_config,
+        rules=prompt_context.split_rules(get_conversion_rules(source_db)),
+        features=redshift_features
+    )
+    return prompt_instructions(source_db, context, include_explanation) + source
+
+def build_repair_prompt(source_db, sql, redshift_sql, issues):
+    """Short prompt asking the model to fix one statement that failed validation
+
+    It carries only the statement, the previous answer and the issues found,
+    without the features and rules of the conversion prompt.
+    """
+    issues_text = "\n".join(f"- {issue}" for issue in issues)
+    return f"""This {source_db} SQL was converted to Amazon Redshift SQL, but the result failed validation.
+
+Source SQL ({source_db}):
+```sql
+{sql}
+```
+
+Converted Redshift SQL:
+```sql
+{redshift_sql}
+```
+
+Validation errors:
+{issues_text}
+
+Fix these errors while preserving the original logic. Provide ONLY the corrected Redshift SQL."""
+
+def hedge_model(model_config):
+    """Second model raced against a slow call, never of a lower tier than model_config
+
+    HEDGE_MODEL when its tier is high enough, else the lowest-tier other model
+    at or above model_config's tier (Haiku for Nova Pro, Opus for Haiku, the
+    other Opus for Opus).
+    """
+    tier = model_config.get('tier', 0)
+    if HEDGE_MODEL_KEY:
+        hedge = AVAILABLE_MODELS.get(HEDGE_MODEL_KEY)
+        return hedge if hedge is not None and hedge is not model_config and hedge['tier'] >= tier else None
+    candidates = [m for m in AVAILABLE_MODELS.values() if m is not model_config and m['tier'] >= tier]
+    return min(candidates, key=lambda m: m['tier']) if candidates else None
+
+def invoke_model(model_config, prompt, usage=None, stop_at_fence=False):
+    """Call the selected Bedrock model under a deadline, returns (text, model_config that answered)
+
+    Throttled calls are retried with jitter, and a call slower than the model's
+    recent p95 is hedged to hedge_model(); the first answer wins. usage, when
+    given, receives the answering call's token counts. With stop_at_fence the
+    answer is streamed and cut off once its SQL code fence closes.
+    """
+    return model_invoke.invoke_hedged(
+        model_pool, bedrock_client(), model_config, prompt,
+        deadline_seconds=MODEL_DEADLINE_SECONDS,
+        hedge_config=hedge_model(model_config),
+        usage=usage,
+        stop_at_fence=stop_at_fence
+    )
+
+def record_usage(model_key, source_db, usage):
+    """Count one model call's tokens in the request metrics and /stats, where models are keyed by Bedrock model id"""
+    request_metrics.measure('input_tokens', usage.get('input_tokens', 0))
+    request_metrics.measure('output_tokens', usage.get('output_tokens', 0))
+    stats_store.record_call(AVAILABLE_MODELS[model_key]['id'], source_db, usage.get('input_tokens'), usage.get('output_tokens'), usage.get('seconds', 0))
+
+def parse_response(content, include_explanation):
+    """Extract converted SQL and optional explanation from model output"""
+    if include_explanation:
+        sql_match = re.search(r'```sql\n(.*?)\n```', content, re.DOTALL)
+        redshift_sql = sql_match.group(1).strip() if sql_match else content
+        exp_match = re.search(r'EXPLANATION:\n(.*)', content, re.DOTALL)
+        explanation = exp_match.group(1).strip() if exp_match else None
+    else:
+        # Prose the model adds around fenced answers is dropped; several fenced blocks are joined
+        blocks = re.findall(r'```(?:sql)?\n(.*?)\n```', content, re.DOTALL)
+        redshift_sql = '\n\n'.join(block.strip() for block in blocks) if blocks else re.sub(r'```sql\n|\n```|```', '', content).strip()
+        explanation = None
+    return redshift_sql, explanation
+
+def resolve_model(model_key):
+    """Model config for a request's model key, unknown keys fall back to Nova Pro"""
+    if model_key == AUTO_MODEL_KEY:
+        return AUTO_MODEL
+    return AVAILABLE_MODELS.get(model_key, AVAILABLE_MODELS['nova-pro'])
+
+def model_key_of(model_config):
+    return next((k for k, v in AVAILABLE_MODELS.items() if v is model_config), None)
+
+def route_model(model_config, source_db, sql):
+    """Concrete model for a statement, returns (model_key, model_config, complexity)"""
+    if not model_config.get('auto'):
+        return model_key_of(model_config), model_config, None
+    model_key, score = model_router.choose_model(sql, source_db)
+    if model_key not in AVAILABLE_MODELS:
+        model_key = 'nova-pro'
+    return model_key, AVAILABLE_MODELS[model_key], score
+
+def validate_and_repair(source_db, sql, redshift_sql, model_config, known_functions=()):
+    """Check a model conversion locally and re-prompt with the issues until it passes
+
+    At most VALIDATION_REPAIRS repair calls are made, each with
+    build_repair_prompt(). A repaired answer is only kept when it has fewer
+    issues. Returns (redshift_sql, remaining issues, whether a repair was kept).
+    """
+    with request_metrics.stage('validate'):
+        issues = sql_validator.validate_script(redshift_sql, known_functions)
+    repairs = 0
+    repaired = False
+    # The streaming endpoint repairs whole scripts, which may come back in several fenced blocks
+    single_statement = bool(issues) and len(sql_splitter.split_statements(sql, source_db)) <= 1
+    while issues and repairs < VALIDATION_REPAIRS:
+        repairs += 1
+        request_metrics.measure('validation_failures', 1)
+        usage = {}
+        with request_metrics.stage('repair_call'):
+            content, answered_by = invoke_model(
+                model_config, build_repair_prompt(source_db, sql, redshift_sql, issues), usage, stop_at_fence=single_statement
+            )
+        request_metrics.measure('repair_calls', 1)
+        record_usage(model_key_of(answered_by), source_db, usage)
+        repaired_sql, _ = parse_response(content, False)
+        with request_metrics.stage('validate'):
+            repaired_issues = sql_validator.validate_script(repaired_sql, known_functions)
+        if len(repaired_issues) >= len(issues):
+            break
+        redshift_sql, issues, repaired = repaired_sql, repaired_issues, True
+    return redshift_sql, issues, repaired
+
+def convert_statement(source_db, sql, include_explanation, model_config, redshift_features, known_functions=()):
+    """Convert a single statement
+
+    Statements the rule engine fully understands are rewritten locally
+    (path 'rules'); everything else costs one model call (path 'model'),
+    routed by complexity when model_config is AUTO_MODEL, and is checked by
+    validate_and_repair(). Returns a dict with redshift_sql, explanation, path,
+    model, complexity, prompt_tokens, repaired and issues.
+    """
+    with request_metrics.stage('rules'):
+        local = rule_engine.convert_statement(sql, source_db)
+    if local is not None:
+        redshift_sql, applied = local
+        explanation = None
+        if include_explanation:
+            explanation = f"Converted locally: {', '.join(applied)}" if applied else "No changes required"
+        return {
+            'redshift_sql': redshift_sql, 'explanation': explanation, 'path': 'rules',
+            'model': None, 'complexity': None, 'prompt_tokens': 0, 'repaired': False, 'issues': []
+        }
+    with request_metrics.stage('routing'):
+        model_key, model_config, score = route_model(model_config, source_db, sql)
+    with request_metrics.stage('prompt_build'):
+        prompt = build_prompt(source_db, sql, include_explanation, redshift_features, model_config)
+    usage = {}
+    with request_metrics.stage('model_call'):
+        # Without an explanation nothing after the statement's SQL fence is used
+        content, answered_by = invoke_model(model_config, prompt, usage, stop_at_fence=not include_explanation)
+    request_metrics.measure('model_calls', 1)
+    if answered_by is not model_config:
+        model_key = model_key_of(answered_by)
+    record_usage(model_key, source_db, usage)
+    with request_metrics.stage('response_parse'):
+        redshift_sql, explanation = parse_response(content, include_explanation)
+    redshift_sql, issues, repaired = validate_and_repair(source_db, sql, redshift_sql, answered_by, known_functions)
+    return {
+        'redshift_sql': redshift_sql, 'explanation': explanation, 'path': 'model',
+        'model': model_key, 'complexity': score, 'prompt_tokens': prompt_context.estimate_tokens(prompt),
+        'repaired': repaired, 'issues': issues
+    }
+
+def statement_report(index, converted):
+    """Per-statement entry for the statements list of a conversion result"""
+    entry = {'statement': index, 'path': converted['path']}
+    if converted.get('model'):
+        entry['model'] = converted['model']
+    if converted.get('complexity') is not None:
+        entry['complexity'] = converted['complexity']
+    if converted.get('cache') == 'hit':
+        entry['cache'] = 'hit'
+    if converted.get('repaired'):
+        entry['repaired'] = True
+    if converted.get('issues'):
+        entry['issues'] = converted['issues']
+    return entry
+
+def statement_cache_entry(converted):
+    """What the statement cache keeps of a conversion, or None when it should not be reused
+
+    Only clean model answers are kept: rule-engine rewrites are cheaper to
+    redo, and failed or still-invalid statements should be retried.
+    """
+    if converted['path'] != 'model' or converted.get('error') or converted.get('issues') or converted.get('cache') == 'hit':
+        return None
+    return {key: converted.get(key) for key in ('redshift_sql', 'explanation', 'path', 'model', 'complexity', 'repaired')}
+
+def result_cacheable(result):
+    """Whether a whole conversion result may be cached: nothing failed and no statement still has issues"""
+    return not result['failed_statements'] and not any(entry.get('issues') for entry in result['statements'])
+
+def answered_model_name(model_config, statements):
+    """model_used of a conversion: the models that answered its statements, in order
+
+    Hedged statements can be answered by another model than the requested
+    one; model "auto" and conversions without a model call keep the requested name.
+    """
+    names = []
+    for entry in statements:
+        model = AVAILABLE_MODELS.get(entry.get('model'))
+        if model is not None and model['name'] not in names:
+            names.append(model['name'])
+    if model_config.get('auto') or not names:
+        return model_config['name']
+    return ', '.join(names)
+
+def answered_model_key(statements):
+    """Key of the model that answered most statements, None when no statement called a model"""
+    keys = Counter(entry['model'] for entry in statements if entry.get('model') in AVAILABLE_MODELS)
+    return keys.most_common(1)[0][0] if keys else None
+
+def convert_script(source_db, sql, include_explanation, model_config, redshift_features, incremental=True):
+    """Convert a script statement by statement on a bounded thread pool
+
+    Statements are reassembled in their original order. A statement that fails
+    is kept as its original SQL behind a comment and listed in failed_statements.
+    Each statement's conversion path and model are reported in statements,
+    with the validation issues a model answer still has after repair.
+
+    With incremental, statements converted before under the same dialect,
+    model, explanation setting and feature version are reused from the
+    statement cache, so after an edit only new or changed statements reach the
+    model. reused_statements counts them.
+    """
+    with request_metrics.stage('split'):
+        statements = sql_splitter.split_statements(sql, source_db)
+    # Calls to routines the script creates itself are not unknown functions
+    known_functions = sql_validator.defined_functions(sql)
+    if len(statements) <= 1:
+        converted = convert_statement(source_db, sql, include_explanation, model_config, redshift_features, known_functions)
+        return {
+            'redshift_sql': converted['redshift_sql'],
+            'explanation': converted['explanation'],
+            'estimated_prompt_tokens': converted['prompt_tokens'],
+            'statement_count': len(statements),
+            'statements': [statement_report(1, converted)],
+            'failed_statements': [],
+            'reused_statements': 0
+        }
+    
+    # Statements are keyed by their normalized text, like whole requests
+    feature_version = result_cache.features_version(redshift_features)
+    requested_key = AUTO_MODEL_KEY if model_config.get('auto') else model_key_of(model_config)
+    keys = [
+        None if sql_splitter.is_comment_only(statement)
+        else result_cache.make_statement_key(source_db, statement, requested_key, include_explanation, feature_version)
+        for statement in statements
+    ]
+    reused = {}
+    if incremental:
+        with request_metrics.stage('statement_cache_lookup'):
+            reused = result_cache.get_cached_results([key for key in keys if key])
+    
+    def convert_one(statement, key):
+        if key is None:
+            return {'redshift_sql': statement, 'explanation': None, 'path': 'comment', 'prompt_tokens': 0}
+        if key in reused:
+            return {**reused[key], 'prompt_tokens': 0, 'cache': 'hit'}
+        try:
+            return convert_statement(source_db, statement, include_explanation, model_config, redshift_features, known_functions)
+        except Exception as e:
+            print(f"Statement conversion error: {e}")
+            request_metrics.record_error(e)
             return {
-                'statusCode': 200,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'status': 'healthy'})
+                'redshift_sql': f"-- Conversion failed: {e}\n{statement}", 'explanation': None,
+                'path': 'model', 'prompt_tokens': 0, 'error': str(e)
             }
+    
+    # map() yields results in submission order regardless of completion order
+    results = list(statement_pool.map(request_metrics.bind(convert_one), statements, keys))
+    
+    fresh = {}
+    for key, r in zip(keys, results):
+        entry = statement_cache_entry(r) if key else None
+        if entry is not None:
+            fresh[key] = entry
+    with request_metrics.stage('statement_cache_store'):
+        result_cache.put_cached_results(fresh)
+    reused_count = sum(1 for r in results if r.get('cache') == 'hit')
+    request_metrics.measure('reused_statements', reused_count)
+    
+    failed = [
+        {'statement': index, 'error': r['error']}
+        for index, r in enumerate(results, 1) if r.get('error')
+    ]
+    
+    explanation = None
+    if include_explanation:
+        explanation = "\n\n".join(
+            f"Statement {i}: {r['explanation']}" for i, r in enumerate(results, 1) if r['explanation']
+        ) or None
+    
+    return {
+        'redshift_sql': sql_splitter.join_statements(r['redshift_sql'] for r in results),
+        'explanation': explanation,
+        'estimated_prompt_tokens': sum(r['prompt_tokens'] for r in results),
+        'statement_count': len(statements),
+        'statements': [statement_report(i, r) for i, r in enumerate(results, 1)],
+        'failed_statements': failed,
+        'reused_statements': reused_count
+    }
+
+def parse_body(event):
+    """Request payload from an API Gateway/function URL event or a direct invoke"""
+    if 'body' in event:
+        if not event['body']:
+            return {}
+        return json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+    return event
+
+def stream_events(source_db, sql, include_explanation, model_key):
+    """Yield Server-Sent Events for a streamed conversion
+
+    Emits a meta frame, then delta frames with raw model text as it is
+    generated, then a done frame with the parsed result (or an error frame).
+    """
+    try:
+        if model_key not in AVAILABLE_MODELS and model_key != AUTO_MODEL_KEY:
+            model_key = 'nova-pro'
+        model_config = resolve_model(model_key)
+        request_metrics.set(source_db=source_db, model=model_key, model_id=model_config['id'])
+        with request_metrics.stage('feature_lookup'):
+            redshift_features = get_redshift_features()
+        cache_key = result_cache.make_cache_key(
+            source_db, sql, model_key, include_explanation,
+            result_cache.features_version(redshift_features)
+        )
+        with request_metrics.stage('cache_lookup'):
+            cached, cache_tier = result_cache.get_cached_result(cache_key)
+        request_metrics.set(cache='hit' if cached is not None else 'miss', cache_tier=cache_tier)
+        if cached is not None:
+            yield model_invoke.sse_event('meta', {'source_db': source_db, 'model_used': cached['model_used'], 'cache': 'hit'})
+            yield model_invoke.sse_event('delta', {'text': cached['redshift_sql']})
+            yield model_invoke.sse_event('done', {**cached, 'cache': 'hit'})
+            return
         
-        # Handle GET /supported-databases
-        if event.get('rawPath') == '/supported-databases' or event.get('path') == '/supported-databases':
-            return {
-                'statusCode': 200,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'databases': ['Teradata', 'Oracle', 'MySQL', 'Clickhouse', 'Snowflake', 'BigQuery']})
-            }
+        with request_metrics.stage('routing'):
+            routed_key, model_config, score = route_model(model_config, source_db, sql)
+        with request_metrics.stage('prompt_build'):
+            prompt = build_prompt(source_db, sql, include_explanation, redshift_features, model_config)
+        prompt_tokens = prompt_context.estimate_tokens(prompt)
+        statement_count = len(sql_splitter.split_statements(sql, source_db))
+        request_metrics.set(routed_model=routed_key, model_id=model_config['id'])
+        request_metrics.measure('estimated_prompt_tokens', prompt_tokens)
+        yield model_invoke.sse_event('meta', {
+            'source_db': source_db, 'model_used': model_config['name'], 'cache': 'miss',
+            'estimated_prompt_tokens': prompt_tokens
+        })
+        parts = []
+        usage = {}
+        with request_metrics.stage('model_call'):
+            for text in model_invoke.stream_text(
+                bedrock_client(), model_config, prompt, usage=usage,
+                # A script may come back in several fenced blocks, so only a single statement stops early
+                stop_at_fence=not include_explanation and statement_count == 1
+            ):
+                parts.append(text)
+                yield model_invoke.sse_event('delta', {'text': text})
+        record_usage(routed_key, source_db, usage)
         
-        # Handle GET /models
-        if event.get('rawPath') == '/models' or event.get('path') == '/models':
+        with request_metrics.stage('response_parse'):
+            redshift_sql, explanation = parse_response(''.join(parts), include_explanation)
+        # A repaired answer replaces the streamed text in the done frame
+        redshift_sql, issues, repaired = validate_and_repair(
+            source_db, sql, redshift_sql, model_config, sql_validator.defined_functions(sql)
+        )
+        report = {'path': 'model', 'model': routed_key, 'complexity': score, 'repaired': repaired, 'issues': issues}
+        result = {
+            'redshift_sql': redshift_sql,
+            'explanation': explanation,
+            'estimated_prompt_tokens': prompt_tokens,
+            'statement_count': statement_count,
+            'statements': [statement_report(1, report)],
+            'failed_statements': [],
+            'source_db': source_db,
+            'model_used': model_config['name']
+        }
+        if result_cacheable(result):
+            with request_metrics.stage('cache_store'):
+                result_cache.put_cached_result(cache_key, result)
+        yield model_invoke.sse_event('done', {**result, 'cache': 'miss'})
+    except Exception as e:
+        request_metrics.record_error(e)
+        yield model_invoke.sse_event('error', {'error': str(e)})
+
+def stream_handler(event, context):
+    """POST /convert/stream - converted SQL as an SSE stream
+
+    The Python managed runtime buffers the returned body, so through API Gateway
+    the frames arrive together. For incremental delivery serve app.py's
+    /convert/stream behind the Lambda Web Adapter with a RESPONSE_STREAM function URL.
+    """
+    body = parse_body(event)
+    source_db = body.get('source_db')
+    sql = body.get('sql')
+    if not source_db or not sql:
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'source_db and sql are required'})
+        }
+    return {
+        'statusCode': 200,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'},
+        'body': ''.join(stream_events(source_db, sql, body.get('include_explanation', False), body.get('model', 'nova-pro')))
+    }
+
+def submit_job(body, context):
+    """POST /jobs - queue a conversion and hand it to an async self-invocation"""
+    source_db = body.get('source_db')
+    sql = body.get('sql')
+    if not source_db or not sql:
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'source_db and sql are required'})
+        }
+    model_key = body.get('model', 'nova-pro')
+    if model_key not in AVAILABLE_MODELS and model_key != AUTO_MODEL_KEY:
+        model_key = 'nova-pro'
+    
+    job = jobs_store().create_job(source_db, sql, model_key, body.get('include_explanation', False))
+    aws_clients.client('lambda').invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps({'action': 'process_job', 'job_id': job['job_id']})
+    )
+    return {
+        'statusCode': 202,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+        'body': json.dumps({**job, 'status_url': f"/jobs/{job['job_id']}"})
+    }
+
+def get_job(job_id):
+    """GET /jobs/{id} - job progress, per-statement status and the result once done"""
+    job = jobs.expire_stale(jobs_store(), jobs_store().get_job(job_id))
+    if job is None:
+        return {
+            'statusCode': 404,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Job not found'})
+        }
+    return {
+        'statusCode': 200,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+        'body': json.dumps(job)
+    }
+
+def process_job(job_id, deadline=None):
+    """Async invocation target that runs a queued job to completion before deadline (a time.time())"""
+    job = jobs_store().get_job(job_id)
+    if job is None:
+        return {'job_id': job_id, 'status': 'not_found'}
+    model_config = resolve_model(job['model'])
+    with request_metrics.stage('feature_lookup'):
+        redshift_features = get_redshift_features()
+    request_metrics.set(job_id=job_id, model=job['model'])
+    known_functions = sql_validator.defined_functions(jobs_store().get_input(job_id))
+    feature_version = result_cache.features_version(redshift_features)
+    
+    @request_metrics.bind
+    def convert_fn(statement):
+        # Resubmitted jobs reuse the statements converted before, as /convert does
+        key = result_cache.make_statement_key(job['source_db'], statement, job['model'], job['include_explanation'], feature_version)
+        cached, _ = result_cache.get_cached_result(key)
+        if cached is not None:
+            request_metrics.measure('reused_statements', 1)
+            return cached['redshift_sql'], cached['explanation'], cached['path']
+        converted = convert_statement(job['source_db'], statement, job['include_explanation'], model_config, redshift_features, known_functions)
+        entry = statement_cache_entry(converted)
+        if entry is not None:
+            result_cache.put_cached_result(key, entry)
+        return converted['redshift_sql'], converted['explanation'], converted['path']
+    
+    status = jobs.run_job(jobs_store(), job_id, convert_fn, statement_pool, deadline)
+    return {'job_id': job_id, 'status': status}
+
+def handler(event, context):
+    request_id = getattr(context, 'aws_request_id', None)
+    # Async self-invocation from POST /jobs
+    if event.get('action') == 'process_job':
+        metrics = request_metrics.start('lambda', 'process_job', request_id)
+        # The invocation is stopped at its timeout, which bounds the job
+        deadline = time.time() + context.get_remaining_time_in_millis() / 1000 if context is not None else None
+        result = process_job(event['job_id'], deadline)
+        metrics.finish(result['status'])
+        stats_store.flush()
+        return result
+    
+    path = event.get('rawPath') or event.get('path') or '/convert'
+    # Unknown paths still convert, but report under one fixed operation
+    operation = '/jobs/{id}' if path.startswith('/jobs/') else request_metrics.operation_for(path, STATIC_ROUTES, ROUTES, ('/convert',))
+    metrics = request_metrics.start('lambda', operation, request_id)
+    if isinstance(event.get('body'), str):
+        metrics.measure('request_bytes', len(event['body'].encode('utf-8')), 'Bytes')
+    response = request_metrics.finish_response(metrics, route(event, context))
+    stats_store.record_finished(metrics, response['statusCode'])
+    stats_store.flush()
+    return response
+
+def convert_endpoint(event, context):
+    """POST /convert - convert a script, serving repeats from the result cache"""
+    body = parse_body(event)
+    source_db = body.get('source_db')
+    sql = body.get('sql')
+    include_explanation = body.get('include_explanation', False)
+    model_key = body.get('model', 'nova-pro')
+    if not source_db or not sql:
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'source_db and sql are required'})
+        }
+    
+    # Get model config
+    if model_key not in AVAILABLE_MODELS and model_key != AUTO_MODEL_KEY:
+        model_key = 'nova-pro'
+    request_metrics.set(source_db=source_db)
+    model_config = resolve_model(model_key)
+    
+    # Serve repeated scripts from the result cache without calling Bedrock
+    with request_metrics.stage('feature_lookup'):
+        redshift_features = get_redshift_features()
+    cache_key = result_cache.make_cache_key(
+        source_db, sql, model_key, include_explanation,
+        result_cache.features_version(redshift_features)
+    )
+    with request_metrics.stage('cache_lookup'):
+        cached, cache_tier = result_cache.get_cached_result(cache_key)
+    request_metrics.set(cache='hit' if cached is not None else 'miss', cache_tier=cache_tier, model=model_key, model_id=model_config['id'])
+    if cached is not None:
+        return {
+            'statusCode': 200,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json', 'X-Cache': 'Hit'},
+            'body': json.dumps({**cached, 'cache': 'hit', 'cache_tier': cache_tier})
+        }
+    
+    # Split into top-level statements and convert them in parallel, reusing
+    # unchanged statements unless the client asks for a full re-conversion
+    converted = convert_script(
+        source_db, sql, include_explanation, model_config, redshift_features,
+        incremental=body.get('incremental', True) is not False
+    )
+    
+    result = {
+        **converted,
+        'source_db': source_db,
+        'model_used': answered_model_name(model_config, converted['statements'])
+    }
+    routed_key = answered_model_key(converted['statements'])
+    if routed_key is not None:
+        request_metrics.set(routed_model=routed_key, model_id=AVAILABLE_MODELS[routed_key]['id'])
+    request_metrics.measure('statements', converted['statement_count'])
+    request_metrics.measure('estimated_prompt_tokens', converted['estimated_prompt_tokens'])
+    if result_cacheable(result):
+        with request_metrics.stage('cache_store'):
+            result_cache.put_cached_result(cache_key, result)
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json', 'X-Cache': 'Miss'},
+        'body': json.dumps({**result, 'cache': 'miss'})
+    }
+
+def refresh_endpoint(event, context):
+    """POST /refresh - fetch fresh features and store them"""
+    try:
+        # Trigger refresh by fetching fresh features
+        features = fetch_redshift_features()
+        if features:
+            save_features_to_cache(features)
             return {
                 'statusCode': 200,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
                 'body': json.dumps({
-                    'models': [{'key': k, 'name': v['name']} for k, v in AVAILABLE_MODELS.items()],
-                    'reference_docs': REFERENCE_DOCS
+                    'message': 'Features refreshed successfully',
+                    'features_count': len(features),
+                    'features': features
                 })
             }
-        
-        # Handle POST /refresh
-        if event.get('rawPath') == '/refresh' or event.get('path') == '/refresh':
-            try:
-                # Trigger refresh by fetching fresh features
-                features = fetch_redshift_features()
-                if features:
-                    save_features_to_cache(features)
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                        'body': json.dumps({
-                            'message': 'Features refreshed successfully',
-                            'features_count': len(features),
-                            'features': features
-                        })
-                    }
-                else:
-                    return {
-                        'statusCode': 500,
-                        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                        'body': json.dumps({'error': 'Failed to fetch features'})
-                    }
-            except Exception as e:
-                return {
-                    'statusCode': 500,
-                    'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                    'body': json.dumps({'error': str(e)})
-                }
-        
-        if not source_db or not sql:
+        else:
             return {
-                'statusCode': 400,
+                'statusCode': 500,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'source_db and sql are required'})
+                'body': json.dumps({'error': 'Failed to fetch features'})
             }
+    except Exception as e:
+        request_metrics.record_error(e)
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': str(e)})
+        }
+
+def stats_endpoint(event, context):
+    """GET /stats - usage counters over the last ?days= days"""
+    days = (event.get('queryStringParameters') or {}).get('days', '1')
+    if not str(days).isdigit():
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'days must be a whole number'})
+        }
+    days = int(days)
+    return {
+        'statusCode': 200,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+        'body': json.dumps(stats_store.stats(min(days, usage_stats.STATS_TTL_DAYS)))
+    }
+
+# GET endpoints whose payload only changes on deploy: serialized once, served
+# with an ETag and Cache-Control, and answered with 304 on a matching If-None-Match
+STATIC_ROUTES = {
+    '/health': static_responses.static_response(
+        {'status': 'healthy'}, cache_control=static_responses.REVALIDATE_CACHE_CONTROL
+    ),
+    '/supported-databases': static_responses.static_response(
+        {'databases': ['Teradata', 'Oracle', 'MySQL', 'Clickhouse', 'Snowflake', 'BigQuery']}
+    ),
+    '/models': static_responses.static_response({
+        'models': [{'key': k, 'name': v['name']} for k, v in AVAILABLE_MODELS.items()] + [{'key': AUTO_MODEL_KEY, 'name': AUTO_MODEL['name']}],
+        'reference_docs': REFERENCE_DOCS
+    })
+}
+
+ROUTES = {
+    '/stats': stats_endpoint,
+    '/convert/stream': stream_handler,
+    '/jobs': lambda event, context: submit_job(parse_body(event), context),
+    '/refresh': refresh_endpoint
+}
+
+CORS_PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
+    'Access-Control-Max-Age': '86400'
+}
+
+def route(event, context):
+    """Dispatch an API event to its endpoint; unknown paths and direct invokes convert"""
+    try:
+        if event.get('requestContext', {}).get('http', {}).get('method') == 'OPTIONS':
+            return {'statusCode': 200, 'headers': dict(CORS_PREFLIGHT_HEADERS), 'body': ''}
         
-        # Get model config
-        model_config = AVAILABLE_MODELS.get(model_key, AVAILABLE_MODELS['nova-pro'])
-        
-        # Build prompt and call Bedrock
-        prompt = build_prompt(source_db, sql, include_explanation)
-        
-        # Call model based on format with streaming for faster response
-        if model_config['format'] == 'nova':
-            response = bedrock.invoke_model(
-                modelId=model_config['id'],
-                body=json.dumps({
-                    "messages": [{"role": "user", "content": [{"text": prompt}]}],
-                    "inferenceConfig": {"max_new_tokens": 8192, "temperature": 0.1}
-                })
-            )
-            result = json.loads(response['body'].read())
-            content = result['output']['message']['content'][0]['text']
-        else:  # anthropic
-            response = bedrock.invoke_model(
-                modelId=model_config['id'],
-                body=json.dumps({
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 8192,
-                    "temperature": 0.1,
-                    "messages": [{"role": "user", "content": prompt}]
-                })
-            )
-            result = json.loads(response['body'].read())
-            content = result['content'][0]['text']
-        
-        # Parse response
-        if include_explanation:
-            sql_match = re.search(r'```sql\n(.*?)\n```', content, re.DOTALL)
-            redshift_sql = sql_match.group(1).strip() if sql_match else content
-            exp_match = re.search(r'EXPLANATION:\n(.*)', content, re.DOTALL)
-            explanation = exp_match.group(1).strip() if exp_match else None
-        else:
-            redshift_sql = re.sub(r'```sql\n|\n```|```', '', content).strip()
-            explanation = None
+        path = event.get('rawPath') or event.get('path') or ''
+        static = STATIC_ROUTES.get(path)
+        if static is not None:
+            return static_responses.serve(static, event)
+        endpoint = ROUTES.get(path)
+        if endpoint is not None:
+            return endpoint(event, context)
+        if path.startswith('/jobs/'):
+            return get_job(path[len('/jobs/'):])
+        return convert_endpoint(event, context)
         
+    except model_invoke.DeadlineExceeded as e:
+        request_metrics.record_error(e)
         return {
-            'statusCode': 200,
+            'statusCode': 504,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'redshift_sql': redshift_sql,
-                'explanation': explanation,
-                'source_db': source_db,
-                'model_used': model_config['name']
-            })
+            'body': json.dumps({'error': str(e), 'retryable': True})
         }
-        
     except Exception as e:
+        request_metrics.record_error(e)
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -1,13 +1,37 @@
 import json
-import boto3
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
-bedrock_agent = boto3.client('bedrock-agent-runtime', region_name='us-east-1')
+import aws_clients
+import doc_index
+import prompt_context
+import request_metrics
+import static_responses
+import usage_stats
 
 KB_ID = os.environ.get('KNOWLEDGE_BASE_ID', '')
 
+# Local BM25 index built by download-docs.sh; when packaged it replaces KB retrieval
+DOCS_INDEX_PATH = os.environ.get('DOCS_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'redshift_docs.idx'))
+docs_index = doc_index.load_index(DOCS_INDEX_PATH)
+
+# One retrieval query per construct found in the SQL, run concurrently and
+# cached per normalized query so repeated constructs skip the round trip
+MAX_RETRIEVAL_QUERIES = int(os.environ.get('MAX_RETRIEVAL_QUERIES', '4'))
+RESULTS_PER_QUERY = 2
+RETRIEVAL_CACHE_TTL_SECONDS = int(os.environ.get('RETRIEVAL_CACHE_TTL_SECONDS', '3600'))
+RETRIEVAL_CACHE_SIZE = 512
+retrieval_pool = ThreadPoolExecutor(max_workers=MAX_RETRIEVAL_QUERIES)
+_retrieval_cache = OrderedDict()
+_retrieval_lock = threading.Lock()
+
+# Token usage, latency and cache counters behind GET /stats
+stats_store = usage_stats.UsageStats(usage_stats.STATS_TABLE)
+
 MODELS = {
     'amazon.nova-pro-v1:0': 'Amazon Nova Pro',
     'us.anthropic.claude-4-5-haiku-v1:0': 'Claude Haiku 4.5',
@@ -86,7 +110,7 @@ CONVERSION_RULES = {
 def retrieve_from_kb(query, num_results=5):
     """Retrieve relevant documentation from Knowledge Base"""
     try:
-        response = bedrock_agent.retrieve(
+        response = aws_clients.client('bedrock-agent-runtime').retrieve(
             knowledgeBaseId=KB_ID,
             retrievalQuery={'text': query},
             retrievalConfiguration={
@@ -107,20 +131,79 @@ def retrieve_from_kb(query, num_results=5):
         print(f"KB retrieval error: {str(e)}")
         return []
 
+def retrieve_docs(query, num_results=5):
+    """Retrieve documentation from the local index if packaged, else the Knowledge Base"""
+    if docs_index is not None:
+        return docs_index.search(query, num_results)
+    if KB_ID:
+        return retrieve_from_kb(query, num_results)
+    return []
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+def cached_retrieve(query, num_results):
+    """retrieve_docs behind an in-memory TTL cache keyed by normalized query"""
+    key = (normalize_query(query), num_results)
+    now = time.time()
+    with _retrieval_lock:
+        entry = _retrieval_cache.get(key)
+        if entry is not None and entry[1] > now:
+            _retrieval_cache.move_to_end(key)
+            return entry[0]
+    results = retrieve_docs(query, num_results)
+    if results:
+        # Empty results are not cached so a failed KB call is retried next time
+        with _retrieval_lock:
+            _retrieval_cache[key] = (results, now + RETRIEVAL_CACHE_TTL_SECONDS)
+            _retrieval_cache.move_to_end(key)
+            while len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+                _retrieval_cache.popitem(last=False)
+    return results
+
+def retrieval_queries(source_db, sql):
+    """One query per dialect construct in the SQL, rule-backed constructs first"""
+    rules = CONVERSION_RULES.get(source_db, {}).get('rules', [])
+    queries = []
+    for construct, rule in prompt_context.retrieval_constructs(sql, source_db, rules):
+        query = f"Redshift {rule}" if rule else f"Redshift {construct}"
+        if query not in queries:
+            queries.append(query)
+    return queries[:MAX_RETRIEVAL_QUERIES] or [f"Redshift SQL syntax {source_db} conversion"]
+
+def retrieve_for_sql(source_db, sql):
+    """Documentation for the constructs in the SQL, interleaved across queries"""
+    queries = retrieval_queries(source_db, sql)
+    request_metrics.set(retrieval_query_text=queries)
+    request_metrics.measure('retrieval_queries', len(queries))
+    per_query = list(retrieval_pool.map(lambda q: cached_retrieve(q, RESULTS_PER_QUERY), queries))
+    chunks = []
+    for rank in range(RESULTS_PER_QUERY):
+        for results in per_query:
+            if rank < len(results) and results[rank] not in chunks:
+                chunks.append(results[rank])
+    return chunks
+
 def convert_sql(source_db, sql, model_id):
-    """Convert SQL using Bedrock with Knowledge Base RAG"""
+    """Convert SQL using Bedrock with Knowledge Base RAG, returns (sql, estimated_prompt_tokens)"""
     
-    # Get conversion rules
-    rules = CONVERSION_RULES.get(source_db, {}).get('rules', [])
-    rules_text = '\n'.join([f'- {rule}' for rule in rules])
+    # Retrieve documentation for the constructs the SQL actually uses
+    with request_metrics.stage('retrieval'):
+        kb_results = retrieve_for_sql(source_db, sql)
+    
+    # Keep only the rules and chunks that mention constructs in the SQL
+    with request_metrics.stage('prompt_build'):
+        context = prompt_context.select_context(
+            sql, source_db,
+            {'format': 'nova' if model_id.startswith('amazon.') else 'anthropic'},
+            rules=CONVERSION_RULES.get(source_db, {}).get('rules', []),
+            docs=kb_results
+        )
+    rules_text = '\n'.join([f'- {rule}' for rule in context['rules']])
     
-    # Retrieve relevant documentation from Knowledge Base
     kb_context = ""
-    if KB_ID:
-        print(f"Retrieving from KB for: {source_db} SQL conversion")
-        kb_results = retrieve_from_kb(f"Redshift SQL syntax {sql[:200]}", num_results=3)
-        if kb_results:
-            kb_context = "\n\nRELEVANT REDSHIFT DOCUMENTATION:\n" + "\n---\n".join(kb_results[:3])
+    if context['docs']:
+        kb_context = "\n\nRELEVANT REDSHIFT DOCUMENTATION:\n" + "\n---\n".join(context['docs'])
     
     # Build prompt
     prompt = f"""You are an expert SQL converter. Convert the following {source_db} SQL to Amazon Redshift SQL.
@@ -151,8 +234,13 @@ CONVERTED REDSHIFT SQL:"""
             "messages": [{"role": "user", "content": [{"text": prompt}]}],
             "inferenceConfig": {"temperature": 0.1, "maxTokens": 2000}
         }
-        response = bedrock_runtime.converse(modelId=model_id, **body)
-        result = response['output']['message']['content'][0]['text']
+        started = time.monotonic()
+        with request_metrics.stage('model_call'):
+            response = aws_clients.client('bedrock-runtime').converse(modelId=model_id, **body)
+        with request_metrics.stage('response_parse'):
+            result = response['output']['message']['content'][0]['text']
+        usage = response.get('usage', {})
+        input_tokens, output_tokens = usage.get('inputTokens', 0), usage.get('outputTokens', 0)
     else:
         # Claude models
         body = {
@@ -161,103 +249,148 @@ CONVERTED REDSHIFT SQL:"""
             "temperature": 0.1,
             "max_tokens": 2000
         }
-        response = bedrock_runtime.invoke_model(
-            modelId=model_id,
-            body=json.dumps(body)
-        )
-        result = json.loads(response['body'].read())['content'][0]['text']
+        started = time.monotonic()
+        with request_metrics.stage('model_call'):
+            response = aws_clients.client('bedrock-runtime').invoke_model(
+                modelId=model_id,
+                body=json.dumps(body)
+            )
+        with request_metrics.stage('response_parse'):
+            response_body = json.loads(response['body'].read())
+            result = response_body['content'][0]['text']
+        usage = response_body.get('usage', {})
+        input_tokens, output_tokens = usage.get('input_tokens', 0), usage.get('output_tokens', 0)
     
-    return result.strip()
+    prompt_tokens = prompt_context.estimate_tokens(prompt)
+    stats_store.record_call(model_id, source_db, input_tokens, output_tokens, time.monotonic() - started)
+    request_metrics.measure('input_tokens', input_tokens)
+    request_metrics.measure('output_tokens', output_tokens)
+    request_metrics.measure('retrieved_chunks', len(kb_results))
+    request_metrics.measure('estimated_prompt_tokens', prompt_tokens)
+    return result.strip(), prompt_tokens
 
 def lambda_handler(event, context):
-    """Main Lambda handler"""
-    
-    # Handle CORS preflight
-    if event.get('requestContext', {}).get('http', {}).get('method') == 'OPTIONS':
+    """Main Lambda handler, logs one metrics line per request and adds Server-Timing"""
+    operation = request_metrics.operation_for(event.get('rawPath', '/'), STATIC_ROUTES, ROUTES)
+    metrics = request_metrics.start('lambda-kb', operation, getattr(context, 'aws_request_id', None))
+    if isinstance(event.get('body'), str):
+        metrics.measure('request_bytes', len(event['body'].encode('utf-8')), 'Bytes')
+    response = request_metrics.finish_response(metrics, route(event, context))
+    stats_store.record_finished(metrics, response['statusCode'])
+    stats_store.flush()
+    return response
+
+def health_endpoint(event, context):
+    """GET /health - live, so never cached"""
+    return {
+        'statusCode': 200,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json', 'Cache-Control': 'no-store'},
+        'body': json.dumps({
+            'status': 'healthy',
+            'rag_type': 'Full RAG with Knowledge Base',
+            'kb_id': KB_ID,
+            'retrieval': 'local-index' if docs_index is not None else 'knowledge-base',
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    }
+
+def stats_endpoint(event, context):
+    """GET /stats - usage counters over the last ?days= days"""
+    days = (event.get('queryStringParameters') or {}).get('days', '1')
+    if not str(days).isdigit():
         return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': ''
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'days must be a whole number'})
         }
-    
-    path = event.get('rawPath', '/')
-    
-    # Health check
-    if path == '/health':
+    days = int(days)
+    return {
+        'statusCode': 200,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+        'body': json.dumps(stats_store.stats(min(days, usage_stats.STATS_TTL_DAYS)))
+    }
+
+def convert_endpoint(event, context):
+    """POST /convert - convert SQL with Knowledge Base RAG"""
+    try:
+        body = json.loads(event.get('body', '{}'))
+        source_db = body.get('source_db')
+        sql = body.get('sql')
+        model_id = body.get('model', 'amazon.nova-pro-v1:0')
+        
+        if not source_db or not sql:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                'body': json.dumps({'error': 'Missing source_db or sql'})
+            }
+        
+        if source_db not in CONVERSION_RULES:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                'body': json.dumps({'error': f'Unsupported database: {source_db}'})
+            }
+        
+        # Convert SQL
+        request_metrics.set(source_db=source_db, model=model_id, retrieval='local-index' if docs_index is not None else 'knowledge-base')
+        redshift_sql, prompt_tokens = convert_sql(source_db, sql, model_id)
+        
         return {
             'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
             'body': json.dumps({
-                'status': 'healthy',
-                'rag_type': 'Full RAG with Knowledge Base',
-                'kb_id': KB_ID,
-                'timestamp': datetime.utcnow().isoformat()
+                'redshift_sql': redshift_sql,
+                'explanation': None,
+                'source_db': source_db,
+                'model_used': MODELS.get(model_id, model_id),
+                'rag_type': 'Full RAG',
+                'estimated_prompt_tokens': prompt_tokens
             })
         }
-    
-    # List models
-    if path == '/models':
+        
+    except Exception as e:
+        request_metrics.record_error(e)
         return {
-            'statusCode': 200,
+            'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'models': list(MODELS.keys())})
+            'body': json.dumps({'error': str(e)})
         }
+
+# GET endpoints whose payload only changes on deploy: serialized once, served
+# with an ETag and Cache-Control, and answered with 304 on a matching If-None-Match
+STATIC_ROUTES = {
+    '/models': static_responses.static_response({'models': list(MODELS.keys())}),
+    '/supported-databases': static_responses.static_response({'databases': list(CONVERSION_RULES.keys())})
+}
+
+ROUTES = {
+    '/health': health_endpoint,
+    '/stats': stats_endpoint,
+    '/convert': convert_endpoint
+}
+
+CORS_PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
+    'Access-Control-Max-Age': '86400'
+}
+
+def route(event, context):
+    """Dispatch an API event to its endpoint"""
     
-    # List supported databases
-    if path == '/supported-databases':
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'databases': list(CONVERSION_RULES.keys())})
-        }
+    # Handle CORS preflight
+    if event.get('requestContext', {}).get('http', {}).get('method') == 'OPTIONS':
+        return {'statusCode': 200, 'headers': dict(CORS_PREFLIGHT_HEADERS), 'body': ''}
     
-    # Convert SQL
-    if path == '/convert':
-        try:
-            body = json.loads(event.get('body', '{}'))
-            source_db = body.get('source_db')
-            sql = body.get('sql')
-            model_id = body.get('model', 'amazon.nova-pro-v1:0')
-            
-            if not source_db or not sql:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                    'body': json.dumps({'error': 'Missing source_db or sql'})
-                }
-            
-            if source_db not in CONVERSION_RULES:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                    'body': json.dumps({'error': f'Unsupported database: {source_db}'})
-                }
-            
-            # Convert SQL
-            redshift_sql = convert_sql(source_db, sql, model_id)
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({
-                    'redshift_sql': redshift_sql,
-                    'explanation': None,
-                    'source_db': source_db,
-                    'model_used': MODELS.get(model_id, model_id),
-                    'rag_type': 'Full RAG'
-                })
-            }
-            
-        except Exception as e:
-            return {
-                'statusCode': 500,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': str(e)})
-            }
+    path = event.get('rawPath', '/')
+    static = STATIC_ROUTES.get(path)
+    if static is not None:
+        return static_responses.serve(static, event)
+    endpoint = ROUTES.get(path)
+    if endpoint is not None:
+        return endpoint(event, context)
     
     return {
         'statusCode': 404,
@@ -0,0 +1,258 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import prompt_context
+
+# Error codes worth retrying with backoff; anything else fails the call at once
+RETRYABLE_ERRORS = {
+    'ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException',
+    'ModelNotReadyException', 'InternalServerException', 'ModelTimeoutException'
+}
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8.0
+
+# Hedge after the p95 of recent latencies for the model, or this before enough samples
+HEDGE_DEFAULT_DELAY_SECONDS = 8.0
+HEDGE_MIN_DELAY_SECONDS = 1.0
+HEDGE_MIN_SAMPLES = 20
+
+_latencies = {}
+_latency_lock = threading.Lock()
+
+# Opening line of a Markdown code fence, e.g. ```sql
+_FENCE_OPEN_RE = re.compile(r'```[A-Za-z]*\n')
+
+class DeadlineExceeded(Exception):
+    """No model answered before the call's deadline"""
+
+def request_body(model_config, prompt, max_tokens=8192, temperature=0.1):
+    """Build the invoke_model request body for the model's API format"""
+    if model_config['format'] == 'nova':
+        return json.dumps({
+            "messages": [{"role": "user", "content": [{"text": prompt}]}],
+            "inferenceConfig": {"max_new_tokens": max_tokens, "temperature": temperature}
+        })
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "messages": [{"role": "user", "content": prompt}]
+    })
+
+def parse_completion(model_config, result):
+    """Pull the completion text out of a decoded invoke_model response"""
+    if model_config['format'] == 'nova':
+        return result['output']['message']['content'][0]['text']
+    return result['content'][0]['text']
+
+def parse_usage(model_config, result):
+    """Input and output token counts of a decoded invoke_model response"""
+    usage = result.get('usage') or {}
+    if model_config['format'] == 'nova':
+        return {'input_tokens': usage.get('inputTokens', 0), 'output_tokens': usage.get('outputTokens', 0)}
+    return {'input_tokens': usage.get('input_tokens', 0), 'output_tokens': usage.get('output_tokens', 0)}
+
+def invoke_text(client, model_config, prompt, max_tokens=8192, usage=None):
+    """Blocking model call returning the full completion text
+
+    When usage is a dict it receives the call's input_tokens, output_tokens and seconds.
+    """
+    started = time.monotonic()
+    response = client.invoke_model(
+        modelId=model_config['id'],
+        body=request_body(model_config, prompt, max_tokens)
+    )
+    result = json.loads(response['body'].read())
+    if usage is not None:
+        usage.update(parse_usage(model_config, result), seconds=time.monotonic() - started)
+    return parse_completion(model_config, result)
+
+def invoke_until_fence(client, model_config, prompt, max_tokens=8192, usage=None):
+    """Streamed model call returning the completion up to the end of its first code fence
+
+    Generation is cancelled as soon as the model goes on past the fence, so
+    prose it adds after the SQL is neither waited for nor paid for. A
+    completion without a fence is returned whole. Takes the same arguments as
+    invoke_text; only use it when the answer is a single statement, since
+    anything after the first fence is dropped.
+    """
+    return ''.join(stream_text(client, model_config, prompt, max_tokens, usage, stop_at_fence=True))
+
+def _error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+def record_latency(model_config, seconds):
+    with _latency_lock:
+        _latencies.setdefault(model_config['id'], deque(maxlen=200)).append(seconds)
+
+def hedge_delay(model_config):
+    """Seconds to wait for a model before hedging: the p95 of its recent calls"""
+    with _latency_lock:
+        samples = sorted(_latencies.get(model_config['id'], ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY_SECONDS
+    return max(HEDGE_MIN_DELAY_SECONDS, samples[int(len(samples) * 0.95) - 1])
+
+def invoke_with_retries(client, model_config, prompt, max_tokens=8192, deadline=None, usage=None, stop_at_fence=False):
+    """invoke_text with full-jitter exponential backoff on throttling, bounded by deadline
+
+    deadline is an absolute time.monotonic() value; backoff never sleeps past it.
+    With stop_at_fence the call is made with invoke_until_fence instead.
+    """
+    call = invoke_until_fence if stop_at_fence else invoke_text
+    attempt = 0
+    while True:
+        started = time.monotonic()
+        try:
+            text = call(client, model_config, prompt, max_tokens, usage)
+            record_latency(model_config, time.monotonic() - started)
+            return text
+        except Exception as e:
+            if _error_code(e) not in RETRYABLE_ERRORS:
+                raise
+            backoff = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+            if deadline is not None and time.monotonic() + backoff >= deadline:
+                raise
+            print(f"{model_config['name']} {_error_code(e)}, retrying in {backoff:.2f}s")
+            time.sleep(backoff)
+            attempt += 1
+
+def invoke_hedged(executor, client, model_config, prompt, max_tokens=8192, deadline_seconds=25.0, hedge_config=None, usage=None, stop_at_fence=False):
+    """Call a model under a deadline, hedging to a second model when it is slow
+
+    If the primary has not answered after hedge_delay(), or fails outright, the
+    same prompt is sent to hedge_config and whichever answers first wins.
+    Returns (text, model_config that answered). Raises DeadlineExceeded when
+    nothing answers in time, or the last error when every call failed.
+    usage, when given, receives the token counts of the answering call.
+    stop_at_fence is passed on to invoke_with_retries.
+    """
+    deadline = time.monotonic() + deadline_seconds
+
+    def submit(config):
+        call_usage = {}
+        future = executor.submit(invoke_with_retries, client, config, prompt, max_tokens, deadline, call_usage, stop_at_fence)
+        calls[future] = config
+        usages[future] = call_usage
+        return future
+
+    calls = {}
+    usages = {}
+    pending = {submit(model_config)}
+    hedged = hedge_config is None
+    last_error = None
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        timeout = remaining if hedged else min(remaining, hedge_delay(model_config))
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if usage is not None:
+                    usage.update(usages[future])
+                return future.result(), calls[future]
+            last_error = future.exception()
+            print(f"{calls[future]['name']} call failed: {last_error}")
+        if not hedged and (not done or not pending):
+            # Primary is slow or failed: race the hedge model against it
+            hedged = True
+            pending.add(submit(hedge_config))
+    if last_error is not None and not pending:
+        raise last_error
+    raise DeadlineExceeded(f"No model answered within {deadline_seconds:g}s")
+
+def _chunk_text(model_config, chunk):
+    if model_config['format'] == 'nova':
+        return chunk.get('contentBlockDelta', {}).get('delta', {}).get('text')
+    if chunk.get('type') == 'content_block_delta':
+        return chunk.get('delta', {}).get('text')
+    return None
+
+def _chunk_usage(chunk):
+    """Token counts Bedrock appends to the final chunk of a stream"""
+    metrics = chunk.get('amazon-bedrock-invocationMetrics')
+    if metrics:
+        return {'input_tokens': metrics.get('inputTokenCount', 0), 'output_tokens': metrics.get('outputTokenCount', 0)}
+    return None
+
+def fence_end(text, start=0):
+    """Index just past the closing ``` of the first code fence in text, or None while it is open
+
+    start skips text already known to hold no closing fence; the search backs
+    up a few characters so a fence split across deltas is still found.
+    """
+    opening = _FENCE_OPEN_RE.search(text)
+    if not opening:
+        return None
+    closing = text.find('\n```', max(opening.end() - 1, start - 4))
+    return closing + 4 if closing != -1 else None
+
+def estimated_usage(prompt, text):
+    """Token counts of a stream cancelled before Bedrock reported them"""
+    return {'input_tokens': prompt_context.estimate_tokens(prompt), 'output_tokens': prompt_context.estimate_tokens(text)}
+
+def stream_text(client, model_config, prompt, max_tokens=8192, usage=None, stop_at_fence=False):
+    """Yield completion text deltas as the model produces them
+
+    Closing the generator early closes the underlying event stream. When usage
+    is a dict it receives the call's token counts and seconds once the stream ends.
+    With stop_at_fence nothing after the first code fence's closing ``` is
+    yielded. When the model stops there the stream is read to its end for the
+    real token counts; when it goes on with more text the stream is cancelled
+    and usage is estimated.
+    """
+    started = time.monotonic()
+    response = client.invoke_model_with_response_stream(
+        modelId=model_config['id'],
+        body=request_body(model_config, prompt, max_tokens)
+    )
+    stream = response['body']
+    received = ''
+    fenced = False
+    cancelled = False
+    try:
+        for event in stream:
+            if 'chunk' not in event:
+                continue
+            chunk = json.loads(event['chunk']['bytes'])
+            chunk_usage = _chunk_usage(chunk)
+            if usage is not None and chunk_usage:
+                usage.update(chunk_usage, seconds=time.monotonic() - started)
+            text = _chunk_text(model_config, chunk)
+            if not text:
+                continue
+            if not stop_at_fence:
+                yield text
+                continue
+            if fenced:
+                if text.strip():
+                    cancelled = True
+                    break
+                continue
+            end = fence_end(received + text, len(received))
+            if end is not None:
+                fenced = True
+                cut = end - len(received)
+                cancelled = bool(text[cut:].strip())
+                text = text[:cut]
+            received += text
+            if text:
+                yield text
+            if cancelled:
+                break
+        if cancelled and usage is not None:
+            usage.update(estimated_usage(prompt, received), seconds=time.monotonic() - started)
+    finally:
+        close = getattr(stream, 'close', None)
+        if close:
+            close()
+
+def sse_event(event, data):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,93 @@
+import os
+
+import rule_engine
+import sql_lexer
+
+# Local complexity scoring behind model "auto": each statement is scored from
+# its token stream and sent to the cheapest model whose tier covers the score.
+
+# Cheapest first as (minimum score, model key). AUTO_MODEL_TIERS overrides it,
+# e.g. "nova-pro:0,claude-haiku-4.5:35,claude-opus-4.6:70"
+DEFAULT_TIERS = [(0, 'nova-pro'), (35, 'claude-haiku-4.5'), (70, 'claude-opus-4.6')]
+
+SEMI_STRUCTURED = {
+    'VARIANT', 'OBJECT', 'ARRAY', 'STRUCT', 'SUPER', 'JSON', 'FLATTEN', 'PARSE_JSON',
+    'JSON_EXTRACT', 'JSON_EXTRACT_SCALAR', 'JSON_VALUE', 'JSON_QUERY', 'GET_PATH',
+    'OBJECT_CONSTRUCT', 'ARRAY_CONSTRUCT', 'ARRAY_AGG', 'UNNEST', 'ARRAYJOIN',
+    'GROUPARRAY', 'TO_VARIANT', 'LATERAL'
+}
+PROCEDURAL = {'BEGIN', 'DECLARE', 'LOOP', 'WHILE', 'EXCEPTION', 'CURSOR', 'RAISE', 'EXECUTE'}
+
+def parse_tiers(spec):
+    """Tiers from a 'model:min_score,...' string, sorted by minimum score"""
+    tiers = []
+    for part in spec.split(','):
+        if ':' in part:
+            model, threshold = part.rsplit(':', 1)
+            tiers.append((int(threshold), model.strip()))
+    return sorted(tiers)
+
+ROUTING_TIERS = parse_tiers(os.environ['AUTO_MODEL_TIERS']) if os.environ.get('AUTO_MODEL_TIERS') else DEFAULT_TIERS
+
+def complexity(sql, source_db=None):
+    """Score a statement from 0 (trivial) to 100 (needs the strongest model)
+
+    Returns a dict with the score and the signals it was built from.
+    """
+    tokens = sql_lexer.significant(sql_lexer.tokenize(sql, source_db))
+    depth = max_depth = 0
+    subqueries = ctes = 0
+    semi_structured = set()
+    dialect = set()
+    procedural = False
+    for i, (kind, text, _) in enumerate(tokens):
+        upper = text.upper()
+        if text == '(':
+            depth += 1
+            max_depth = max(max_depth, depth)
+        elif text == ')':
+            depth = max(0, depth - 1)
+        elif kind in sql_lexer.WORD_KINDS:
+            if upper == 'SELECT' and depth > 0:
+                subqueries += 1
+            elif upper == 'AS' and i + 2 < len(tokens) and tokens[i + 1][1] == '(' and tokens[i + 2][1].upper() in ('SELECT', 'WITH'):
+                ctes += 1
+            if upper in SEMI_STRUCTURED:
+                semi_structured.add(upper)
+            if upper in rule_engine.BLOCKING_WORDS:
+                dialect.add(upper)
+            if upper in PROCEDURAL:
+                procedural = True
+        elif kind == 'op' and text in ('(+)', '@', '$'):
+            dialect.add(text)
+        elif kind == 'op' and text == ':' and source_db == 'Snowflake':
+            # Snowflake variant path access, e.g. payload:customer.id
+            semi_structured.add(':')
+
+    score = (
+        min(25, len(tokens) // 40)
+        + min(20, 4 * max(0, max_depth - 2) + 3 * subqueries)
+        + min(15, 5 * ctes)
+        + min(20, 10 * len(semi_structured))
+        + min(20, 5 * len(dialect))
+        + (20 if procedural else 0)
+    )
+    return {
+        'score': min(100, score),
+        'tokens': len(tokens),
+        'depth': max_depth,
+        'subqueries': subqueries,
+        'ctes': ctes,
+        'semi_structured': sorted(semi_structured),
+        'dialect_features': sorted(dialect),
+        'procedural': procedural
+    }
+
+def choose_model(sql, source_db=None, tiers=None):
+    """Cheapest model key whose tier covers the statement, returns (model_key, score)"""
+    score = complexity(sql, source_db)['score']
+    chosen = None
+    for threshold, model_key in tiers or ROUTING_TIERS:
+        if score >= threshold or chosen is None:
+            chosen = model_key
+    return chosen, score
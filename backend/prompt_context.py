@@ -0,0 +1,164 @@
+import os
+import re
+
+import rule_engine
+import sql_lexer
+
+# Picks the conversion rules, Redshift features and documentation chunks that
+# mention a construct used in the SQL being converted, and trims them to a
+# per-model token budget so prompts only carry context the model can use.
+
+# Context tokens allowed per model API format, PROMPT_CONTEXT_TOKENS overrides all
+CONTEXT_TOKEN_BUDGETS = {'nova': 1500, 'anthropic': 3000}
+DEFAULT_CONTEXT_TOKENS = 1500
+
+# Words too common to make a rule, feature or doc chunk relevant on their own
+COMMON_TERMS = {
+    'A', 'ALL', 'AND', 'AS', 'ASC', 'BY', 'CASE', 'CLAUSE', 'COLUMN', 'COLUMNS', 'CREATE',
+    'DATA', 'DELETE', 'DESC', 'DISTINCT', 'ELSE', 'END', 'FOR', 'FROM', 'FUNCTION',
+    'FUNCTIONS', 'IN', 'INNER', 'INSERT', 'INTO', 'IS', 'JOIN', 'LEFT', 'NOT', 'NULL',
+    'OF', 'ON', 'OR', 'REMOVE', 'SAME', 'SELECT', 'SET', 'SIMILAR', 'STATEMENT', 'SUPPORTED',
+    'SYNTAX', 'TABLE', 'TABLES', 'THE', 'THEN', 'TO', 'TYPE', 'UPDATE', 'USE', 'VALUES',
+    'WHEN', 'WHERE', 'WITH', '(', ')', ',', '.', ';', '=', '*', '/', '-', '+', '<', '>'
+}
+
+# Source constructs whose Redshift replacement is described under another name
+RELATED_TERMS = {
+    'VARIANT': {'SUPER'}, 'OBJECT': {'SUPER'}, 'ARRAY': {'SUPER', 'UNNEST'},
+    'STRUCT': {'SUPER'}, 'PARSE_JSON': {'SUPER', 'JSON_PARSE'}, 'FLATTEN': {'UNNEST', 'SUPER'},
+    'ARRAYJOIN': {'UNNEST'}, 'SAFE_CAST': {'TRY_CAST'}, 'ROW_NUMBER': {'QUALIFY'},
+    'RANK': {'QUALIFY'}, 'DENSE_RANK': {'QUALIFY'}, 'ROWNUM': {'ROW_NUMBER'},
+    'UPSERT': {'MERGE'}, 'DUPLICATE': {'MERGE'}
+}
+
+# Documentation is prose, so chunks are matched on plain words rather than SQL tokens
+_DOC_WORD_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+def estimate_tokens(text):
+    """Rough token count for budgeting, about four characters per token"""
+    return (len(text) + 3) // 4
+
+def context_budget(model_config):
+    """Context token budget for a model"""
+    override = os.environ.get('PROMPT_CONTEXT_TOKENS')
+    if override:
+        return int(override)
+    return CONTEXT_TOKEN_BUDGETS.get(model_config.get('format'), DEFAULT_CONTEXT_TOKENS)
+
+def _terms(tokens):
+    terms = set()
+    for kind, text, _ in tokens:
+        if kind in sql_lexer.WORD_KINDS:
+            upper = text.upper()
+            terms.add(upper)
+            # Sized type families such as UInt32 or Float64 match their rule
+            terms.add(upper.rstrip('0123456789'))
+        elif kind == 'op':
+            terms.add(text)
+        elif kind == 'qident' and text[0] == '`':
+            terms.add('`')
+    return terms - COMMON_TERMS
+
+def sql_terms(sql, source_db=None):
+    """Constructs used by the SQL, with their related Redshift names"""
+    terms = _terms(sql_lexer.tokenize(sql, source_db))
+    for term in list(terms):
+        terms |= RELATED_TERMS.get(term, set())
+    return terms
+
+def rule_terms(rule):
+    """Terms on the source side of a 'source → target' rule"""
+    source = rule.split('→', 1)[0]
+    return _terms(sql_lexer.tokenize(source))
+
+def feature_terms(feature):
+    """Terms naming a feature written as 'NAME is SUPPORTED (description)'"""
+    lowered = feature.lower()
+    name = feature[:lowered.index(' is ')] if ' is ' in lowered else feature
+    return _terms(sql_lexer.tokenize(name))
+
+def doc_terms(doc):
+    """Upper-cased words in a documentation chunk"""
+    return {word.upper() for word in _DOC_WORD_RE.findall(doc)} - COMMON_TERMS
+
+def retrieval_constructs(sql, source_db=None, rules=()):
+    """Constructs worth a documentation lookup, as (construct, rule) pairs
+
+    Constructs named by a conversion rule come first, paired with that rule,
+    then other non-portable functions and constructs that always need the
+    model. Each construct appears once, in order of first use.
+    """
+    found = []
+    seen = set()
+    for kind, text, _ in sql_lexer.tokenize(sql, source_db):
+        if kind in ('keyword', 'function') or (kind == 'op' and text in ('::', '(+)')):
+            upper = text.upper()
+            if upper not in seen and upper not in COMMON_TERMS:
+                seen.add(upper)
+                found.append((upper, kind))
+    
+    ruled = []
+    other = []
+    for construct, kind in found:
+        rule = next((r for r in rules if construct in rule_terms(r)), None)
+        if rule is not None:
+            ruled.append((construct, rule))
+        elif (kind == 'function' and construct not in rule_engine.SAFE_FUNCTIONS) or construct in rule_engine.BLOCKING_WORDS:
+            other.append((construct, None))
+    return ruled + other
+
+def split_rules(rules):
+    """Individual rules from a comma separated or bulleted rules string"""
+    items = []
+    for line in rules.splitlines():
+        line = line.strip()
+        if line.startswith('- '):
+            items.append(line[2:].strip())
+        elif line and not line.endswith(':'):
+            # One line of comma separated rules; commas inside parentheses stay
+            depth = 0
+            start = 0
+            for i, ch in enumerate(line):
+                if ch == '(':
+                    depth += 1
+                elif ch == ')':
+                    depth = max(0, depth - 1)
+                elif ch == ',' and depth == 0:
+                    items.append(line[start:i].strip())
+                    start = i + 1
+            items.append(line[start:].strip())
+    return [item for item in items if item]
+
+def _relevant(items, terms, terms_of):
+    scored = []
+    for index, item in enumerate(items):
+        score = len(terms_of(item) & terms)
+        if score:
+            scored.append((-score, index, item))
+    return [item for _, _, item in sorted(scored)]
+
+def select_context(sql, source_db, model_config, rules=(), features=(), docs=(), terms=None):
+    """Relevant rules, features and doc chunks that fit the model's context budget
+
+    Rules are filled first, then features, then documentation, each in order
+    of how many of the SQL's constructs they mention. Returns a dict with the
+    selected lists and their estimated token count.
+    """
+    if terms is None:
+        terms = sql_terms(sql, source_db)
+    budget = context_budget(model_config)
+    selected = {'rules': [], 'features': [], 'docs': [], 'context_tokens': 0}
+
+    candidates = (
+        ('rules', _relevant(rules, terms, rule_terms)),
+        ('features', _relevant(features, terms, feature_terms)),
+        ('docs', _relevant(docs, terms, doc_terms))
+    )
+    for section, items in candidates:
+        for item in items:
+            cost = estimate_tokens(item)
+            if selected['context_tokens'] + cost > budget:
+                continue
+            selected[section].append(item)
+            selected['context_tokens'] += cost
+    return selected
@@ -1,12 +1,22 @@
+import hashlib
 import json
 import boto3
-import re
+import os
+import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import html_text
+
 dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
 features_table = dynamodb.Table('sql-converter-features')
 
+# Item holding per-page ETag/Last-Modified validators, content hashes and features
+PAGE_STATE_KEY = 'doc_pages'
+MAX_PARALLEL_FETCHES = int(os.environ.get('MAX_PARALLEL_FETCHES', '8'))
+FETCH_TIMEOUT_SECONDS = 10
+
 REDSHIFT_DOCS = {
     "cluster_versions": "https://docs.aws.amazon.com/redshift/latest/mgmt/cluster-versions.html",
     "qualify": "https://docs.aws.amazon.com/redshift/latest/dg/r_QUALIFY_clause.html",
@@ -20,79 +30,145 @@ REDSHIFT_DOCS = {
     "conditional_functions": "https://docs.aws.amazon.com/redshift/latest/dg/c_conditional_expressions.html"
 }
 
-def fetch_page(url):
-    """Fetch documentation page"""
+def fetch_page(url, etag=None, last_modified=None):
+    """Conditionally fetch a documentation page
+
+    Returns a dict with status 'ok', 'not_modified' or 'error'. On 'ok' it also
+    carries the extracted page text, its sha256 and the response validators.
+    """
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8')
-            text = re.sub(r'<[^>]+>', ' ', html)
-            text = re.sub(r'\s+', ' ', text).strip()
-            return text[:100000]  # Get 100K chars to capture all features
+        req = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(req, timeout=FETCH_TIMEOUT_SECONDS) as response:
+            text = html_text.read_text(response, max_chars=100000)  # Get 100K chars to capture all features
+            return {
+                'status': 'ok',
+                'text': text,
+                'content_hash': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return {'status': 'not_modified'}
+        print(f"Error fetching {url}: {e}")
     except Exception as e:
         print(f"Error fetching {url}: {e}")
-        return None
+    return {'status': 'error'}
 
-def extract_features():
-    """Extract Redshift features from documentation"""
+def detect_release_features(recent):
+    """Features mentioned in the cluster versions (release notes) page"""
     features = []
     
-    # Check cluster versions page for latest features
-    versions_doc = fetch_page(REDSHIFT_DOCS["cluster_versions"])
-    if versions_doc:
-        # Check first 100K chars to capture all recent patches
-        recent = versions_doc[:100000]
-        
-        # Look for key feature mentions
-        if "QUALIFY" in recent:
-            features.append("QUALIFY clause is SUPPORTED (filters window function results)")
-        if "MERGE" in recent:
-            features.append("MERGE statement is SUPPORTED (upsert operations)")
-        if "SUPER" in recent:
-            features.append("SUPER data type is SUPPORTED (semi-structured data, up to 16MB)")
-        if "UNNEST" in recent or "unnest" in recent.lower():
-            features.append("UNNEST is SUPPORTED (converts arrays to rows)")
-        if "TRY_CAST" in recent:
-            features.append("TRY_CAST is SUPPORTED (safe type conversion)")
-        if "GROUP BY ALL" in recent:
-            features.append("GROUP BY ALL is SUPPORTED")
-        if "EXCLUDE" in recent:
-            features.append("EXCLUDE keyword is SUPPORTED")
-        if "PIVOT" in recent or "pivot" in recent.lower():
-            features.append("PIVOT operator is SUPPORTED")
-        if "INTERVAL" in recent:
-            features.append("INTERVAL data type is SUPPORTED")
-        if "H3_" in recent:
-            features.append("H3 spatial functions are SUPPORTED")
-        if "GET_NUMBER_ATTRIBUTES" in recent:
-            features.append("GET_NUMBER_ATTRIBUTES function is SUPPORTED")
-    
-    # Fallback checks on specific pages
-    if not any("QUALIFY" in f for f in features):
-        qualify_doc = fetch_page(REDSHIFT_DOCS["qualify"])
-        if qualify_doc and "QUALIFY" in qualify_doc:
-            features.append("QUALIFY clause is SUPPORTED")
-    
-    if not any("MERGE" in f for f in features):
-        merge_doc = fetch_page(REDSHIFT_DOCS["merge"])
-        if merge_doc and "MERGE" in merge_doc:
-            features.append("MERGE statement is SUPPORTED")
+    # Look for key feature mentions
+    if "QUALIFY" in recent:
+        features.append("QUALIFY clause is SUPPORTED (filters window function results)")
+    if "MERGE" in recent:
+        features.append("MERGE statement is SUPPORTED (upsert operations)")
+    if "SUPER" in recent:
+        features.append("SUPER data type is SUPPORTED (semi-structured data, up to 16MB)")
+    if "UNNEST" in recent or "unnest" in recent.lower():
+        features.append("UNNEST is SUPPORTED (converts arrays to rows)")
+    if "TRY_CAST" in recent:
+        features.append("TRY_CAST is SUPPORTED (safe type conversion)")
+    if "GROUP BY ALL" in recent:
+        features.append("GROUP BY ALL is SUPPORTED")
+    if "EXCLUDE" in recent:
+        features.append("EXCLUDE keyword is SUPPORTED")
+    if "PIVOT" in recent or "pivot" in recent.lower():
+        features.append("PIVOT operator is SUPPORTED")
+    if "INTERVAL" in recent:
+        features.append("INTERVAL data type is SUPPORTED")
+    if "H3_" in recent:
+        features.append("H3 spatial functions are SUPPORTED")
+    if "GET_NUMBER_ATTRIBUTES" in recent:
+        features.append("GET_NUMBER_ATTRIBUTES function is SUPPORTED")
+    return features
+
+# Pages to check, in priority order, and how to read features from each. Later
+# pages only add a feature when no earlier page already reported it.
+FEATURE_PAGES = [
+    ("cluster_versions", detect_release_features),
+    ("qualify", lambda doc: ["QUALIFY clause is SUPPORTED"] if "QUALIFY" in doc else []),
+    ("merge", lambda doc: ["MERGE statement is SUPPORTED"] if "MERGE" in doc else []),
+    ("json_functions", lambda doc: ["JSON functions are SUPPORTED (JSON_PARSE, JSON_EXTRACT_PATH_TEXT, etc.)"] if "JSON" in doc else [])
+]
+
+def load_page_state():
+    """Per-page validators, content hashes and features from the last refresh"""
+    try:
+        item = features_table.get_item(Key={'feature_key': PAGE_STATE_KEY}).get('Item')
+        return item.get('pages', {}) if item else {}
+    except Exception as e:
+        print(f"Error loading page state: {e}")
+        return {}
+
+def save_page_state(pages):
+    features_table.put_item(Item={
+        'feature_key': PAGE_STATE_KEY,
+        'pages': pages,
+        'updated_at': datetime.now().isoformat()
+    })
+
+def refresh_page(name, detect, previous):
+    """Fetch one page if it changed, returns (page_state, changed)"""
+    url = REDSHIFT_DOCS[name]
+    previous = previous if previous and previous.get('url') == url else {}
+    page = fetch_page(url, previous.get('etag'), previous.get('last_modified'))
+    if page['status'] == 'error':
+        return previous or None, False
+    if page['status'] == 'not_modified' or page['content_hash'] == previous.get('content_hash'):
+        return previous, False
+    return {
+        'url': url,
+        'etag': page['etag'],
+        'last_modified': page['last_modified'],
+        'content_hash': page['content_hash'],
+        'features': detect(page['text'])
+    }, True
+
+def extract_features(previous_pages=None):
+    """Extract Redshift features from documentation
+
+    All pages are fetched concurrently with conditional requests, so a refresh
+    takes about as long as the slowest page and unchanged pages are neither
+    downloaded nor re-parsed. Returns (features, pages, changed_pages).
+    """
+    previous_pages = previous_pages or {}
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_FETCHES, len(FEATURE_PAGES))) as pool:
+        results = list(pool.map(
+            lambda entry: refresh_page(entry[0], entry[1], previous_pages.get(entry[0])),
+            FEATURE_PAGES
+        ))
     
-    # Check JSON functions
-    json_doc = fetch_page(REDSHIFT_DOCS["json_functions"])
-    if json_doc and "JSON" in json_doc:
-        features.append("JSON functions are SUPPORTED (JSON_PARSE, JSON_EXTRACT_PATH_TEXT, etc.)")
+    features = []
+    pages = {}
+    changed = []
+    for (name, _), (page, page_changed) in zip(FEATURE_PAGES, results):
+        if page is None:
+            continue
+        pages[name] = page
+        if page_changed:
+            changed.append(name)
+        for feature in page['features']:
+            subject = feature.split()[0]
+            if not any(f.split()[0] == subject for f in features):
+                features.append(feature)
     
-    return features if features else ["Redshift SQL features detected"]
+    return features if features else ["Redshift SQL features detected"], pages, changed
 
 def handler(event, context):
     """Scheduled Lambda to refresh Redshift features"""
     print("Starting feature refresh...")
     
-    # Extract features from docs
-    features = extract_features()
+    # Extract features from docs, skipping pages unchanged since the last run
+    features, pages, changed = extract_features(load_page_state())
     
-    print(f"Found {len(features)} features")
+    print(f"Found {len(features)} features ({len(changed)} of {len(pages)} pages changed)")
     
     # Save to DynamoDB
     try:
@@ -102,6 +178,7 @@ def handler(event, context):
             'updated_at': datetime.now().isoformat(),
             'source': 'scheduled_refresh'
         })
+        save_page_state(pages)
         print("Features saved to DynamoDB")
     except Exception as e:
         print(f"Error saving to DynamoDB: {e}")
@@ -112,6 +189,7 @@ def handler(event, context):
         'body': json.dumps({
             'message': 'Features refreshed successfully',
             'features_count': len(features),
-            'features': features
+            'features': features,
+            'changed_pages': changed
         })
     }
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per-request stage timing shared by the Lambda handlers and app.py. A handler
+# starts a RequestMetrics, code on the request path times its stages with
+# stage(), and finish() prints one CloudWatch Embedded Metric Format line and
+# returns the matching Server-Timing header value. A stage that runs on several
+# statement threads accumulates, so stage totals can exceed the wall time.
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'SQLConverter')
+
+# Operation reported for paths that match no route, so the dimension stays bounded
+OTHER_OPERATION = 'other'
+
+_current = ContextVar('request_metrics', default=None)
+
+class RequestMetrics:
+    """Stage durations, measurements and properties of one request"""
+
+    def __init__(self, service, operation, request_id=None):
+        self.service = service
+        self.operation = operation
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.measurements = {}
+        self.properties = {}
+        self.lock = threading.Lock()
+        # Streaming responses finish from their generator instead of the handler
+        self.deferred = False
+        self.finished = False
+        self.total_seconds = None
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+
+    def measure(self, name, value, unit='Count'):
+        with self.lock:
+            previous = self.measurements.get(name, (0, unit))[0]
+            self.measurements[name] = (previous + value, unit)
+
+    def set(self, **properties):
+        with self.lock:
+            self.properties.update({k: v for k, v in properties.items() if v is not None})
+
+    def server_timing(self, total_seconds):
+        with self.lock:
+            stages = list(self.stages.items())
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages]
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ', '.join(parts)
+
+    def finish(self, status=None):
+        """Print the request's EMF log line once, returns the Server-Timing value"""
+        total = time.perf_counter() - self.started
+        with self.lock:
+            if self.finished:
+                return None
+            self.finished = True
+            self.total_seconds = total
+            values = {f"{name}_ms": (round(seconds * 1000, 3), 'Milliseconds') for name, seconds in self.stages.items()}
+            values['total_ms'] = (round(total * 1000, 3), 'Milliseconds')
+            values.update(self.measurements)
+            properties = dict(self.properties)
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['service', 'operation']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in values.items()]
+                }]
+            },
+            'service': self.service,
+            'operation': self.operation,
+            'status': status,
+            **properties,
+            **{name: value for name, (value, _) in values.items()}
+        }
+        if self.request_id:
+            record['request_id'] = self.request_id
+        print(json.dumps(record, default=str))
+        return self.server_timing(total)
+
+def start(service, operation, request_id=None):
+    """Begin collecting metrics for the request running in this context"""
+    metrics = RequestMetrics(service, operation, request_id)
+    _current.set(metrics)
+    return metrics
+
+def operation_for(path, *routes):
+    """The operation dimension for a request path: the matched route or OTHER_OPERATION"""
+    for table in routes:
+        if path in table:
+            return path
+    return OTHER_OPERATION
+
+def current():
+    return _current.get()
+
+@contextmanager
+def stage(name):
+    """Time a block as a stage of the current request; a no-op outside one"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name):
+        yield
+
+def measure(name, value, unit='Count'):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.measure(name, value, unit)
+
+def set(**properties):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.set(**properties)
+
+def record_error(error):
+    """Attach an exception's type and message to the current request's log line"""
+    set(error_type=type(error).__name__, error=str(error))
+
+def bind(fn):
+    """Wrap fn so it records into the current request when run on a pool thread"""
+    metrics = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(metrics)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+def finish_response(metrics, response):
+    """Finish a Lambda proxy response: log the request and add Server-Timing"""
+    body = response.get('body') or ''
+    metrics.measure('response_bytes', len(body.encode('utf-8')) if isinstance(body, str) else len(body), 'Bytes')
+    server_timing = metrics.finish(response.get('statusCode'))
+    if server_timing and 'headers' in response:
+        response['headers']['Server-Timing'] = server_timing
+        response['headers']['Timing-Allow-Origin'] = '*'
+    return response
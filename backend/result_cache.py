@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import aws_clients
+import sql_lexer
+
+RESULT_CACHE_TABLE = os.environ.get('RESULT_CACHE_TABLE', 'sql-converter-results')
+RESULT_CACHE_TTL_HOURS = int(os.environ.get('RESULT_CACHE_TTL_HOURS', '168'))  # 7 days
+LRU_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_LRU_SIZE', '256'))
+# BatchGetItem accepts at most 100 keys per call
+BATCH_GET_SIZE = 100
+# Unprocessed keys are retried with full-jitter backoff; lookups sit on the
+# request path, so the base is small and the attempts few
+BATCH_GET_ATTEMPTS = 3
+BATCH_RETRY_BASE_SECONDS = 0.05
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+def normalize_sql(sql, source_db=None):
+    """Canonical token text so reformatted or re-cased scripts share a cache entry"""
+    return sql_lexer.normalize(sql_lexer.tokenize(sql, source_db))
+
+def features_version(features):
+    """Short fingerprint of the feature list that went into the prompt"""
+    return hashlib.sha256(json.dumps(features or [], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def make_cache_key(source_db, sql, model_key, include_explanation, feature_version):
+    """Content-addressed key for a conversion request"""
+    payload = json.dumps([source_db, normalize_sql(sql, source_db), model_key, bool(include_explanation), feature_version])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def make_statement_key(source_db, statement, model_key, include_explanation, feature_version):
+    """Key for one statement's conversion, kept apart from whole-request keys"""
+    payload = json.dumps(['statement', source_db, normalize_sql(statement, source_db), model_key, bool(include_explanation), feature_version])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _lru_get(key):
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at < time.time():
+            del _lru[key]
+            return None
+        _lru.move_to_end(key)
+        return result
+
+def _lru_put(key, result, expires_at):
+    with _lru_lock:
+        _lru[key] = (result, expires_at)
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_MAX_ENTRIES:
+            _lru.popitem(last=False)
+
+def get_cached_result(key):
+    """Look up a conversion result, returns (result, tier) or (None, None)"""
+    result = _lru_get(key)
+    if result is not None:
+        return result, 'memory'
+    try:
+        response = aws_clients.table(RESULT_CACHE_TABLE).get_item(Key={'cache_key': key})
+        item = response.get('Item')
+        # DynamoDB TTL deletes lazily, so expired items can still be returned
+        if item and int(item['expires_at']) > time.time():
+            result = json.loads(item['result'])
+            _lru_put(key, result, int(item['expires_at']))
+            return result, 'dynamodb'
+    except Exception as e:
+        print(f"Result cache read error: {e}")
+    return None, None
+
+def put_cached_result(key, result):
+    """Store a conversion result in both tiers"""
+    expires_at = int(time.time()) + RESULT_CACHE_TTL_HOURS * 3600
+    _lru_put(key, result, expires_at)
+    try:
+        aws_clients.table(RESULT_CACHE_TABLE).put_item(Item={
+            'cache_key': key,
+            'result': json.dumps(result),
+            'expires_at': expires_at
+        })
+    except Exception as e:
+        print(f"Result cache write error: {e}")
+
+def get_cached_results(keys):
+    """Look up many results at once, returns {key: result} for the keys found
+
+    Keys missing from the in-memory LRU are fetched with BatchGetItem, up to
+    BATCH_GET_SIZE per call, so a 100-statement script costs one round trip.
+    """
+    found = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        result = _lru_get(key)
+        if result is not None:
+            found[key] = result
+        else:
+            missing.append(key)
+    now = time.time()
+    for start in range(0, len(missing), BATCH_GET_SIZE):
+        request = {RESULT_CACHE_TABLE: {'Keys': [{'cache_key': key} for key in missing[start:start + BATCH_GET_SIZE]]}}
+        try:
+            # Throttled keys come back unprocessed; retry them a couple of times
+            for attempt in range(BATCH_GET_ATTEMPTS):
+                if attempt:
+                    time.sleep(random.uniform(0, BATCH_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+                response = aws_clients.dynamodb().batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(RESULT_CACHE_TABLE, []):
+                    if int(item['expires_at']) > now:
+                        result = json.loads(item['result'])
+                        _lru_put(item['cache_key'], result, int(item['expires_at']))
+                        found[item['cache_key']] = result
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+        except Exception as e:
+            print(f"Result cache read error: {e}")
+    return found
+
+def put_cached_results(results):
+    """Store many {key: result} entries in both tiers with one batch writer"""
+    if not results:
+        return
+    expires_at = int(time.time()) + RESULT_CACHE_TTL_HOURS * 3600
+    for key, result in results.items():
+        _lru_put(key, result, expires_at)
+    try:
+        with aws_clients.table(RESULT_CACHE_TABLE).batch_writer() as batch:
+            for key, result in results.items():
+                batch.put_item(Item={'cache_key': key, 'result': json.dumps(result), 'expires_at': expires_at})
+    except Exception as e:
+        print(f"Result cache write error: {e}")
@@ -0,0 +1,317 @@
+import re
+
+import sql_lexer
+import sql_validator
+
+# Local rewrite engine for statements that need nothing beyond the mechanical
+# mappings from get_conversion_rules. Anything it does not fully understand is
+# left for the model: convert_statement returns None rather than guessing.
+
+DIALECT_RULES = {
+    'Teradata': {
+        'keywords': {'SEL': 'SELECT'},
+    },
+    'Oracle': {
+        'types': {'VARCHAR2': 'VARCHAR', 'NUMBER': 'DECIMAL'},
+        'functions': {'NVL': 'COALESCE'},
+        'keywords': {'SYSDATE': 'GETDATE()'},
+    },
+    'MySQL': {
+        'types': {'DATETIME': 'TIMESTAMP', 'TEXT': 'VARCHAR(65535)'},
+        'functions': {'IFNULL': 'COALESCE'},
+        'niladic': {'NOW': 'GETDATE()'},
+        'backticks': True,
+    },
+    'Clickhouse': {
+        'types': {
+            'UINT8': 'SMALLINT', 'UINT16': 'INTEGER', 'UINT32': 'BIGINT',
+            'INT8': 'SMALLINT', 'INT16': 'SMALLINT', 'INT32': 'INTEGER', 'INT64': 'BIGINT',
+            'FLOAT32': 'REAL', 'FLOAT64': 'DOUBLE PRECISION',
+            'STRING': 'VARCHAR', 'DATETIME': 'TIMESTAMP',
+        },
+    },
+    'Snowflake': {
+        'functions': {'PARSE_JSON': 'JSON_PARSE'},
+        'niladic': {'CURRENT_TIMESTAMP': 'GETDATE()'},
+    },
+    'BigQuery': {
+        'types': {'STRING': 'VARCHAR', 'INT64': 'BIGINT', 'FLOAT64': 'DOUBLE PRECISION', 'BOOL': 'BOOLEAN'},
+        'functions': {'IFNULL': 'COALESCE', 'SAFE_CAST': 'TRY_CAST'},
+        'niladic': {'CURRENT_DATETIME': 'GETDATE()'},
+        'backticks': True,
+    },
+}
+
+# Types that are only safe to map when a precision is given (Oracle NUMBER without
+# one is a float, DECIMAL without one is DECIMAL(18,0))
+REQUIRES_PRECISION = {'NUMBER'}
+
+REDSHIFT_TYPES = {
+    'SMALLINT', 'INT', 'INT2', 'INT4', 'INT8', 'INTEGER', 'BIGINT', 'DECIMAL', 'NUMERIC',
+    'REAL', 'FLOAT', 'FLOAT4', 'FLOAT8', 'DOUBLE', 'BOOLEAN', 'BOOL', 'CHAR', 'CHARACTER',
+    'VARCHAR', 'DATE', 'TIMESTAMP', 'TIMESTAMPTZ', 'TIME', 'TIMETZ', 'VARBYTE', 'SUPER'
+}
+INTEGER_TYPES = {'SMALLINT', 'INT', 'INT2', 'INT4', 'INT8', 'INTEGER', 'BIGINT'}
+
+# Functions whose semantics match between the source dialects and Redshift.
+# Not AVG (Redshift keeps the integer type of its argument) and not
+# GREATEST/LEAST (Redshift skips NULLs, most sources return NULL)
+SAFE_FUNCTIONS = {
+    'COUNT', 'SUM', 'MIN', 'MAX', 'COALESCE', 'NULLIF', 'UPPER', 'LOWER',
+    'TRIM', 'LTRIM', 'RTRIM', 'LENGTH', 'REPLACE', 'ROUND', 'ABS', 'FLOOR', 'CEIL',
+    'CEILING', 'SQRT', 'EXP', 'LN', 'CAST', 'TRY_CAST', 'ROW_NUMBER', 'RANK',
+    'DENSE_RANK', 'LAG', 'LEAD', 'FIRST_VALUE', 'LAST_VALUE', 'NTILE',
+    'STDDEV_SAMP', 'STDDEV_POP', 'VAR_SAMP', 'VAR_POP', 'GETDATE'
+}
+# Aggregates that need an argument in Redshift; Clickhouse accepts count()
+AGGREGATE_FUNCTIONS = {'COUNT', 'SUM', 'MIN', 'MAX', 'STDDEV_SAMP', 'STDDEV_POP', 'VAR_SAMP', 'VAR_POP'}
+
+SQL_KEYWORDS = {
+    'SELECT', 'FROM', 'WHERE', 'AND', 'OR', 'NOT', 'IN', 'IS', 'NULL', 'AS', 'ON',
+    'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'OUTER', 'CROSS', 'GROUP', 'BY', 'ORDER',
+    'HAVING', 'LIMIT', 'OFFSET', 'DISTINCT', 'ALL', 'UNION', 'INTERSECT', 'EXCEPT',
+    'MINUS', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'BETWEEN', 'LIKE', 'ILIKE', 'ASC',
+    'DESC', 'NULLS', 'FIRST', 'LAST', 'WITH', 'RECURSIVE', 'INSERT', 'INTO', 'VALUES',
+    'UPDATE', 'SET', 'DELETE', 'CREATE', 'TABLE', 'VIEW', 'TEMP', 'TEMPORARY',
+    'PRIMARY', 'KEY', 'DEFAULT', 'EXISTS', 'OVER', 'PARTITION', 'ROWS', 'RANGE',
+    'UNBOUNDED', 'PRECEDING', 'FOLLOWING', 'CURRENT', 'ROW', 'TRUE', 'FALSE',
+    'USING', 'QUALIFY', 'TOP', 'PRECISION', 'CURRENT_DATE', 'CURRENT_TIMESTAMP',
+    'UNIQUE', 'REFERENCES', 'CONSTRAINT', 'CHECK'
+}
+
+# Constructs that always need the model, whatever the dialect
+BLOCKING_WORDS = {
+    'CONNECT', 'PRIOR', 'ROWNUM', 'ROWID', 'DUAL', 'LEVEL', 'PIVOT', 'UNPIVOT',
+    'LATERAL', 'FLATTEN', 'TABLESAMPLE', 'SAMPLE', 'FINAL', 'ARRAY', 'STRUCT',
+    'UNNEST', 'MERGE', 'SEQUENCE', 'NEXTVAL', 'CURRVAL', 'INTERVAL', 'WINDOW',
+    'DECLARE', 'BEGIN', 'EXECUTE', 'IMMEDIATE', 'CALL', 'RETURNS', 'FUNCTION',
+    'PROCEDURE', 'TRIGGER', 'PACKAGE', 'INDEX', 'OPTIONS', 'DUPLICATE', 'IGNORE',
+    'STRAIGHT_JOIN', 'UNSIGNED', 'ZEROFILL', 'AUTO_INCREMENT', 'ENGINE', 'CLUSTER',
+    'COMPRESS', 'MULTISET', 'VOLATILE', 'SETTINGS', 'FORMAT', 'COLLATE', 'CHARSET',
+    'COMMENT', 'MATERIALIZED', 'REPLACE_INTO'
+}
+
+# Source-dialect keywords the shared lexer reads as plain words; passed through
+# they would be invalid in Redshift or mean something else
+SOURCE_KEYWORDS = {
+    'REGEXP', 'RLIKE', 'SOUNDS', 'ROLLUP', 'CUBE', 'GROUPING', 'SETS', 'DIV', 'MOD', 'XOR',
+    'LOCK', 'SHARE', 'MODE', 'NOWAIT', 'SKIP', 'LOCKED', 'RETURNING', 'OUTFILE', 'DUMPFILE',
+    'MATCH', 'AGAINST', 'ESCAPE', 'NEXT', 'ONLY', 'PERCENT', 'TIES', 'FORCE', 'USE',
+    'HIGH_PRIORITY', 'LOW_PRIORITY', 'DELAYED', 'QUICK', 'SQL_CALC_FOUND_ROWS',
+    'SQL_NO_CACHE', 'SQL_CACHE', 'SQL_SMALL_RESULT', 'SQL_BIG_RESULT', 'SAFE', 'ORDINAL',
+    'RESPECT', 'ASOF', 'GLOBAL', 'ANY', 'SOME', 'PREWHERE', 'ARRAY_JOIN'
+}
+
+# In DDL these map to DISTKEY/SORTKEY and need the model
+DDL_BLOCKING_WORDS = {'PARTITION', 'ORDER', 'SET', 'CHARACTER', 'TTL'}
+
+BLOCKING_OPS = {'(+)', '@', '[', ']', '{', '}', '?', ':', '$', '\\', '#'}
+
+ALLOWED_HEADS = {'SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'SEL'}
+
+# Operators that mean something else in these dialects: MySQL || is logical OR
+# and ^ is XOR, Oracle || skips NULLs, and / and % follow different integer and
+# sign rules than Redshift's (only Teradata divides integers the same way, and
+# it has no % operator)
+DIALECT_BLOCKING_OPS = {
+    'Teradata': {'%'},
+    'Oracle': {'||', '/', '%'},
+    'MySQL': {'||', '/', '%', '^', '!', '&', '|', '~'},
+    'Clickhouse': {'/', '%'},
+    'Snowflake': {'/', '%'},
+    'BigQuery': {'||', '/', '%'},
+}
+# Dialects where '' is NULL rather than an empty string
+EMPTY_STRING_NULL_DIALECTS = {'Oracle'}
+# Adjacent operator pairs the lexer splits, e.g. MySQL's <=> and <<
+BLOCKING_OP_PAIRS = {('<=', '>'), ('<', '<'), ('>', '>')}
+
+# Dialects where "..." is a string literal and backslashes escape inside strings
+STRING_DQUOTE_DIALECTS = {'MySQL', 'BigQuery'}
+BACKSLASH_DIALECTS = {'MySQL', 'BigQuery', 'Clickhouse'}
+
+CAST_FUNCTIONS = {'CAST', 'TRY_CAST', 'SAFE_CAST'}
+
+# Keywords that may be directly followed by a parenthesis
+PAREN_KEYWORDS = {
+    'IN', 'EXISTS', 'VALUES', 'OVER', 'AS', 'AND', 'OR', 'NOT', 'ON', 'USING', 'FROM',
+    'JOIN', 'WHERE', 'WHEN', 'THEN', 'ELSE', 'UNION', 'INTERSECT', 'EXCEPT', 'MINUS',
+    'DISTINCT', 'ALL', 'KEY', 'UNIQUE', 'CHECK', 'SELECT'
+}
+# Words after which "name (" is a table or column list, not a function call
+NAME_BEFORE_PAREN = {'INTO', 'TABLE', 'VIEW', 'REFERENCES'}
+
+# Comments that carry instructions for the converter go to the model
+INSTRUCTION_COMMENT_RE = re.compile(r"\b(do not|don't|dont|never|avoid|prefer|instead|must|should)\b", re.IGNORECASE)
+
+def tokenize(sql, source_db=None):
+    """Shared lexer tokens as (kind, text), with words and quoted identifiers split by kind"""
+    tokens = []
+    for kind, text, _ in sql_lexer.tokenize(sql, source_db):
+        if kind in sql_lexer.WORD_KINDS:
+            kind = 'word'
+        elif kind == 'qident':
+            kind = 'dquote' if text[0] == '"' else 'backtick'
+        tokens.append((kind, text))
+    return tokens
+
+def _is_identifier(token):
+    kind, text = token
+    if kind in ('dquote', 'backtick'):
+        return True
+    upper = text.upper()
+    return kind == 'word' and upper not in SQL_KEYWORDS and upper not in REDSHIFT_TYPES
+
+def convert_statement(sql, source_db):
+    """Convert a statement locally, returns (redshift_sql, applied_rules) or None
+
+    None means the statement uses something outside the engine's safe subset
+    and must be converted by the model.
+    """
+    rules = DIALECT_RULES.get(source_db)
+    if rules is None:
+        return None
+    types = rules.get('types', {})
+    functions = rules.get('functions', {})
+    niladic = rules.get('niladic', {})
+    keywords = rules.get('keywords', {})
+
+    blocking_ops = BLOCKING_OPS | DIALECT_BLOCKING_OPS.get(source_db, set())
+    tokens = tokenize(sql, source_db)
+    significant = [i for i, (kind, _) in enumerate(tokens) if kind not in ('ws', 'comment')]
+    if not significant:
+        return None
+    head_kind, head = tokens[significant[0]]
+    head = head.upper()
+    if head_kind != 'word' or head not in ALLOWED_HEADS or (head == 'SEL' and 'SEL' not in keywords):
+        return None
+    words = [tokens[i][1].upper() for i in significant[:4]]
+    is_ddl = head == 'CREATE'
+    if is_ddl and not (words[1:2] in (['TABLE'], ['VIEW']) or words[1:3] in (['TEMP', 'TABLE'], ['TEMPORARY', 'TABLE'], ['OR', 'REPLACE'])):
+        return None
+    if is_ddl and words[1:3] == ['OR', 'REPLACE'] and words[3:4] != ['VIEW']:
+        return None
+
+    position = {token_index: n for n, token_index in enumerate(significant)}
+    out = []
+    applied = []
+    paren_stack = []
+    skip = set()
+
+    def sig(n):
+        return tokens[significant[n]] if 0 <= n < len(significant) else ('eof', '')
+
+    for i, (kind, text) in enumerate(tokens):
+        if i in skip:
+            continue
+        if kind == 'ws':
+            out.append(text)
+            continue
+        if kind == 'comment':
+            if text[0] == '#' or (text[0] == '/' and (len(text) < 4 or not text.endswith('*/'))):
+                return None
+            if INSTRUCTION_COMMENT_RE.search(text):
+                return None
+            out.append(text)
+            continue
+
+        n = position[i]
+        prev_kind, prev = sig(n - 1)
+        next_kind, nxt = sig(n + 1)
+
+        if kind in ('string', 'dquote', 'backtick') and (len(text) < 2 or text[-1] != text[0]):
+            # Unterminated literal
+            return None
+        if kind == 'string':
+            if text[0] == '$' or (source_db in BACKSLASH_DIALECTS and '\\' in text):
+                return None
+            if text == "''" and source_db in EMPTY_STRING_NULL_DIALECTS:
+                return None
+            out.append(text)
+        elif kind == 'dquote':
+            if source_db in STRING_DQUOTE_DIALECTS:
+                return None
+            out.append(text)
+        elif kind == 'backtick':
+            inner = text[1:-1]
+            if not rules.get('backticks') or '.' in inner or '"' in inner or not inner:
+                return None
+            out.append(f'"{inner}"')
+            applied.append('`→"')
+        elif kind == 'number':
+            out.append(text)
+        elif kind == 'op':
+            if text in blocking_ops:
+                return None
+            if i + 1 < len(tokens) and (text, tokens[i + 1][1]) in BLOCKING_OP_PAIRS:
+                return None
+            if text == '(':
+                paren_stack.append(prev.upper() if prev_kind == 'word' else None)
+            elif text == ')':
+                if paren_stack:
+                    paren_stack.pop()
+            out.append(text)
+        else:
+            upper = text.upper()
+            if prev == '.':
+                # Qualified name part; schema-qualified function calls need the model
+                if nxt == '(':
+                    return None
+                out.append(text)
+                continue
+            if upper in BLOCKING_WORDS or (is_ddl and upper in DDL_BLOCKING_WORDS):
+                return None
+            if upper in SOURCE_KEYWORDS or (
+                upper in sql_lexer.KEYWORDS and upper not in SQL_KEYWORDS and upper not in keywords and nxt != '('
+            ):
+                # A keyword the engine has no mapping for; calls are checked below
+                return None
+            if upper == 'LIMIT' and sig(n + 2)[1] == ',':
+                # MySQL LIMIT offset, count
+                return None
+            if head in ('UPDATE', 'DELETE') and upper in ('ORDER', 'LIMIT'):
+                # Redshift UPDATE and DELETE take neither
+                return None
+            if upper in ('EXCEPT', 'REPLACE') and prev == '*':
+                return None
+
+            in_cast = prev.upper() == 'AS' and paren_stack and paren_stack[-1] in CAST_FUNCTIONS
+            if in_cast or prev == '::' or (is_ddl and n > 3 and _is_identifier((prev_kind, prev))):
+                if upper in types:
+                    if upper in REQUIRES_PRECISION and nxt != '(':
+                        return None
+                    out.append(types[upper])
+                    applied.append(f'{upper}→{types[upper]}')
+                elif upper in REDSHIFT_TYPES and not (upper in INTEGER_TYPES and nxt == '('):
+                    out.append(text)
+                else:
+                    return None
+            elif nxt == '(' and not (prev_kind == 'word' and prev.upper() in NAME_BEFORE_PAREN):
+                if upper in niladic:
+                    if sig(n + 2)[1] != ')':
+                        return None
+                    skip.update((significant[n + 1], significant[n + 2]))
+                    out.append(niladic[upper])
+                    applied.append(f'{upper}()→{niladic[upper]}')
+                elif upper in functions:
+                    out.append(functions[upper])
+                    applied.append(f'{upper}→{functions[upper]}')
+                elif upper in AGGREGATE_FUNCTIONS and sig(n + 2)[1] == ')':
+                    return None
+                elif upper in SAFE_FUNCTIONS or upper in PAREN_KEYWORDS:
+                    out.append(text)
+                else:
+                    return None
+            elif upper in keywords:
+                if upper == 'SEL' and n != 0:
+                    return None
+                out.append(keywords[upper])
+                applied.append(f'{upper}→{keywords[upper]}')
+            else:
+                out.append(text)
+
+    converted = ''.join(out)
+    # Whatever the engine missed, output that does not validate goes to the model
+    if sql_validator.validate(converted):
+        return None
+    return converted, sorted(set(applied))
@@ -0,0 +1,111 @@
+import re
+
+# Single-pass SQL tokenizer shared by the converters. tokenize() walks the
+# input once with one compiled pattern and returns (kind, text, start) tuples:
+#
+#   ws, comment, string (quoted or dollar-quoted), qident ("..." or `...`),
+#   number, keyword, function (a word directly followed by "("), ident, op
+#
+# Whitespace and comments are kept so a token stream can be joined back into
+# the exact source text.
+
+KEYWORDS = {
+    'ALL', 'ALTER', 'AND', 'ANY', 'ARRAY', 'AS', 'ASC', 'BEGIN', 'BETWEEN', 'BY', 'CALL',
+    'CASE', 'CAST', 'CHECK', 'CLUSTER', 'COLLATE', 'COMMENT', 'COMMIT', 'CONNECT',
+    'CONSTRAINT', 'CREATE', 'CROSS', 'CURRENT', 'CURRENT_DATE', 'CURRENT_TIME',
+    'CURRENT_TIMESTAMP', 'DECLARE', 'DEFAULT', 'DELETE', 'DESC', 'DISTINCT', 'DROP',
+    'ELSE', 'END', 'ENGINE', 'EXCEPT', 'EXCLUDE', 'EXECUTE', 'EXISTS', 'FALSE', 'FETCH',
+    'FINAL', 'FIRST', 'FOLLOWING', 'FOR', 'FOREIGN', 'FROM', 'FULL', 'FUNCTION', 'GRANT',
+    'GROUP', 'HAVING', 'IF', 'ILIKE', 'IN', 'INDEX', 'INNER', 'INSERT', 'INTERSECT',
+    'INTERVAL', 'INTO', 'IS', 'JOIN', 'KEY', 'LAST', 'LATERAL', 'LEFT', 'LIKE', 'LIMIT',
+    'LOOP', 'MERGE', 'MINUS', 'NATURAL', 'NOT', 'NULL', 'NULLS', 'OFFSET', 'ON', 'OR',
+    'ORDER', 'OUTER', 'OVER', 'PARTITION', 'PIVOT', 'PRECEDING', 'PRIMARY', 'PROCEDURE',
+    'QUALIFY', 'RANGE', 'RECURSIVE', 'REFERENCES', 'RETURN', 'RETURNS', 'RIGHT',
+    'ROLLBACK', 'ROW', 'ROWS', 'SAMPLE', 'SELECT', 'SET', 'STRUCT', 'TABLE', 'TABLESAMPLE',
+    'TEMP', 'TEMPORARY', 'THEN', 'TOP', 'TRIGGER', 'TRUE', 'TRUNCATE', 'UNBOUNDED',
+    'UNION', 'UNIQUE', 'UNNEST', 'UNPIVOT', 'UPDATE', 'USING', 'VALUES', 'VIEW', 'WHEN',
+    'WHERE', 'WHILE', 'WINDOW', 'WITH'
+}
+
+TYPE_NAMES = {
+    'BIGINT', 'BINARY', 'BLOB', 'BOOL', 'BOOLEAN', 'BYTES', 'CHAR', 'CHARACTER', 'CLOB',
+    'DATE', 'DATETIME', 'DECIMAL', 'DOUBLE', 'FLOAT', 'FLOAT32', 'FLOAT64', 'GEOGRAPHY',
+    'INT', 'INT64', 'INTEGER', 'JSON', 'NUMBER', 'NUMERIC', 'OBJECT', 'PRECISION', 'REAL',
+    'SMALLINT', 'STRING', 'SUPER', 'TEXT', 'TIME', 'TIMESTAMP', 'TIMESTAMPTZ', 'TINYINT',
+    'VARBYTE', 'VARCHAR', 'VARCHAR2', 'VARIANT'
+}
+
+WORD_KINDS = ('keyword', 'function', 'ident')
+
+_PATTERN = r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z){hash_comment})
+  | (?P<string>{extra_strings}'(?:{squote_body})*(?:'|\Z)|\$\$.*?(?:\$\$|\Z)|\$(?P<tag>[^\W\d]\w*)\$.*?(?:\$(?P=tag)\$|\Z))
+  | (?P<qident>"(?:{dquote_body})*(?:"|\Z)|`[^`]*(?:`|\Z))
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<word>[^\W\d][\w$]*)(?P<call>(?=\s*\())?
+  | (?P<op>::|<>|!=|>=|<=|\|\||=>|->>|->|\(\+\)|.)
+"""
+
+# BigQuery raw strings (r'...', no backslash escapes) and triple-quoted strings,
+# either optionally bytes; tried before the plain quoted forms
+_BIGQUERY_STRINGS = (
+    r"""(?:[rR][bB]?|[bB][rR])(?:'{3}.*?(?:'{3}|\Z)|"{3}.*?(?:"{3}|\Z)|'[^'\n]*(?:'|\Z)|"[^"\n]*(?:"|\Z))|"""
+    r"""[bB]?(?:'{3}(?:[^\\]|\\.)*?(?:'{3}|\Z)|"{3}(?:[^\\]|\\.)*?(?:"{3}|\Z))|"""
+)
+
+# Oracle alternative quoting, q'[...]' with a bracket pair or any repeated delimiter
+_ORACLE_STRINGS = (
+    r"""[nN]?[qQ]'(?:\[.*?(?:\]'|\Z)|\{.*?(?:\}'|\Z)|\(.*?(?:\)'|\Z)|<.*?(?:>'|\Z)|(?P<qdelim>\S).*?(?:(?P=qdelim)'|\Z))|"""
+)
+
+def _compile(backslash_escapes, hash_comments, extra_strings=''):
+    return re.compile(_PATTERN.format(
+        extra_strings=extra_strings,
+        hash_comment=r'|\#[^\n]*' if hash_comments else '',
+        squote_body=r"[^'\\]|''|\\." if backslash_escapes else r"[^']|''",
+        dquote_body=r'[^"\\]|""|\\.' if backslash_escapes else r'[^"]|""'
+    ), re.VERBOSE | re.DOTALL)
+
+_DEFAULT_RE = _compile(False, False)
+_DIALECT_RE = {
+    'MySQL': _compile(True, True),
+    'BigQuery': _compile(True, True, _BIGQUERY_STRINGS),
+    'Oracle': _compile(False, False, _ORACLE_STRINGS),
+    'Clickhouse': _compile(True, False),
+}
+
+def tokenize(sql, source_db=None):
+    """Tokenize SQL in one linear pass, returns a list of (kind, text, start)"""
+    tokens = []
+    append = tokens.append
+    for m in _DIALECT_RE.get(source_db, _DEFAULT_RE).finditer(sql):
+        kind = m.lastgroup
+        text = m.group(0)
+        if kind == 'call' or kind == 'word':
+            upper = text.upper()
+            if upper in KEYWORDS or upper in TYPE_NAMES:
+                kind = 'keyword'
+            elif m.group('call') is not None:
+                kind = 'function'
+            else:
+                kind = 'ident'
+        elif kind == 'tag' or kind == 'qdelim':
+            kind = 'string'
+        append((kind, text, m.start()))
+    return tokens
+
+def significant(tokens):
+    """Tokens without whitespace and comments"""
+    return [t for t in tokens if t[0] != 'ws' and t[0] != 'comment']
+
+def normalize(tokens):
+    """Canonical text for a token stream: whitespace collapsed, keywords upper-cased
+
+    Comments are kept because they can carry conversion instructions.
+    """
+    return ' '.join(text.upper() if kind == 'keyword' else text for kind, text, _ in tokens if kind != 'ws')
+
+def constructs(tokens):
+    """Upper-cased keywords, type names and function names used in a token stream"""
+    return {text.upper() for kind, text, _ in tokens if kind == 'keyword' or kind == 'function'}
@@ -0,0 +1,99 @@
+import sql_lexer
+
+_ROUTINE_KINDS = {'PROCEDURE', 'FUNCTION', 'TRIGGER'}
+_ROUTINE_MODIFIERS = {'OR', 'REPLACE', 'TEMP', 'TEMPORARY', 'EDITIONABLE', 'NONEDITIONABLE'}
+
+# END followed by one of these closes a construct whose opener is not tracked
+_UNTRACKED_END_SUFFIXES = {'IF', 'LOOP', 'WHILE', 'REPEAT', 'FOR'}
+_NON_BLOCK_BEGIN_SUFFIXES = {'TRANSACTION', 'TRAN', 'WORK'}
+
+def _is_routine_head(words):
+    """True for CREATE [OR REPLACE] [TEMP] PROCEDURE/FUNCTION/TRIGGER"""
+    if not words or words[0] != 'CREATE':
+        return False
+    for word in words[1:]:
+        if word in _ROUTINE_KINDS:
+            return True
+        if word not in _ROUTINE_MODIFIERS:
+            return False
+    return False
+
+def split_statements(sql, source_db=None):
+    """Split a script into top-level statements
+
+    Semicolons inside string literals, quoted identifiers, comments, dollar-quoted
+    bodies and BEGIN/END or CASE/END blocks do not end a statement. Comments stay
+    attached to the statement that follows them; comments after the last
+    statement stay with it. Returns the statements in order,
+    each stripped and keeping its terminating semicolon.
+    """
+    return [sql[start:end].strip() for start, end in statement_spans(sql_lexer.tokenize(sql, source_db), len(sql))]
+
+def statement_spans(tokens, length):
+    """(start, end) offsets of each top-level statement in a token stream"""
+    all_tokens = tokens
+    tokens = sql_lexer.significant(tokens)
+    words = [text.upper() if kind in sql_lexer.WORD_KINDS else None for kind, text, _ in tokens]
+    spans = []
+    start = 0
+    depth = 0
+    routine_pending = False
+    head = None
+    end_case = None
+
+    def following(k):
+        return words[k + 1] if k + 1 < len(words) else None
+
+    for k, (kind, text, offset) in enumerate(tokens):
+        if kind == 'op' and text == ';':
+            if depth == 0 and not routine_pending:
+                if head is not None:
+                    spans.append((start, offset + 1))
+                start = offset + 1
+                head = None
+            continue
+        if head is None:
+            head = k
+        word = words[k]
+        if word is not None and k != end_case:
+            if word == 'CASE':
+                depth += 1
+            elif word == 'BEGIN':
+                if routine_pending:
+                    routine_pending = False
+                    depth += 1
+                elif following(k) not in _NON_BLOCK_BEGIN_SUFFIXES and not (k + 1 < len(tokens) and tokens[k + 1][1] == ';'):
+                    depth += 1
+            elif word == 'END':
+                if following(k) == 'CASE':
+                    # END CASE closes the CASE statement; its CASE opens nothing
+                    end_case = k + 1
+                if following(k) not in _UNTRACKED_END_SUFFIXES:
+                    depth = max(0, depth - 1)
+            elif word in ('AS', 'IS') and depth == 0 and not routine_pending:
+                # Oracle-style routine bodies declare variables before BEGIN,
+                # so their semicolons must not split the statement
+                nxt = following(k)
+                if nxt is not None and _is_routine_head(words[head:k]):
+                    routine_pending = nxt not in ('LANGUAGE', 'SELECT', 'WITH', 'RETURN')
+
+    if head is not None or (not spans and start < length):
+        spans.append((start, length))
+    elif spans and any(kind == 'comment' and offset >= start for kind, _, offset in all_tokens):
+        # Comments after the last statement belong to it
+        spans[-1] = (spans[-1][0], length)
+    return spans
+
+def is_comment_only(statement):
+    """True when a chunk holds nothing but comments and semicolons"""
+    return all(kind in ('ws', 'comment') or text == ';' for kind, text, _ in sql_lexer.tokenize(statement))
+
+def join_statements(statements):
+    """Reassemble converted statements into one script, one blank line apart"""
+    parts = []
+    for statement in statements:
+        statement = statement.strip()
+        if not statement.endswith(';') and not is_comment_only(statement):
+            statement += ';'
+        parts.append(statement)
+    return "\n\n".join(parts)
@@ -0,0 +1,298 @@
+import functools
+import os
+import re
+
+import sql_lexer
+import sql_splitter
+
+# Local checks on converted Redshift SQL, run before a model's answer is
+# accepted. validate() walks the shared lexer's tokens once and reports what
+# would make Redshift reject the statement: unterminated literals, unbalanced
+# parentheses, text that is not SQL, source-dialect types and constructs, and
+# calls to functions missing from the Redshift function catalog. It is not a
+# full parser; anything it reports is a real error, but passing does not prove
+# the statement runs.
+#
+# The catalog is the names extracted from the Redshift function reference pages
+# by infrastructure/download-docs.sh (python3 sql_validator.py pages... -o
+# redshift_functions.txt) plus REDSHIFT_FUNCTIONS. REDSHIFT_FUNCTIONS alone is
+# not the full catalog, so unknown functions are only reported when the file is
+# packaged; otherwise a valid function would send the answer back for repair.
+
+REDSHIFT_FUNCTIONS_PATH = os.environ.get(
+    'REDSHIFT_FUNCTIONS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'redshift_functions.txt')
+)
+
+REDSHIFT_FUNCTIONS = {
+    # Aggregate
+    'ANY_VALUE', 'AVG', 'COUNT', 'LISTAGG', 'MAX', 'MEDIAN', 'MIN',
+    'PERCENTILE_CONT', 'PERCENTILE_DISC', 'STDDEV', 'STDDEV_POP', 'STDDEV_SAMP', 'SUM',
+    'VARIANCE', 'VAR_POP', 'VAR_SAMP', 'BIT_AND', 'BIT_OR', 'BOOL_AND', 'BOOL_OR',
+    'HLL', 'HLL_CREATE_SKETCH', 'HLL_CARDINALITY', 'HLL_COMBINE', 'HLL_COMBINE_SKETCHES',
+    # Array and SUPER
+    'ARRAY', 'ARRAY_CONCAT', 'ARRAY_FLATTEN', 'ARRAY_CONTAINS', 'ARRAY_DISTINCT',
+    'ARRAY_EXCEPT', 'ARRAY_INTERSECTION', 'ARRAY_POSITION', 'ARRAY_POSITIONS',
+    'ARRAY_SORT', 'ARRAY_UNION', 'ARRAYS_OVERLAP', 'GET_ARRAY_LENGTH', 'SPLIT_TO_ARRAY',
+    'SUBARRAY', 'OBJECT', 'OBJECT_TRANSFORM', 'UPPER_ATTRIBUTE_NAMES', 'JSON_PARSE',
+    'JSON_SERIALIZE', 'JSON_SERIALIZE_TO_VARBYTE', 'CAN_JSON_PARSE', 'JSON_SIZE',
+    'JSON_TYPEOF', 'IS_ARRAY', 'IS_BIGINT', 'IS_BOOLEAN', 'IS_CHAR', 'IS_DECIMAL',
+    'IS_FLOAT', 'IS_INTEGER', 'IS_OBJECT', 'IS_SCALAR', 'IS_SMALLINT', 'IS_VARCHAR',
+    'IS_VALID_JSON', 'IS_VALID_JSON_ARRAY', 'JSON_ARRAY_LENGTH',
+    'JSON_EXTRACT_ARRAY_ELEMENT_TEXT', 'JSON_EXTRACT_PATH_TEXT',
+    # Conditional
+    'COALESCE', 'DECODE', 'GREATEST', 'LEAST', 'NULLIF', 'NVL', 'NVL2',
+    # Date and time
+    'ADD_MONTHS', 'CONVERT_TIMEZONE', 'CURRENT_DATE', 'DATE', 'DATE_CMP',
+    'DATE_CMP_TIMESTAMP', 'DATE_CMP_TIMESTAMPTZ', 'DATE_PART', 'DATE_PART_YEAR',
+    'DATE_TRUNC', 'DATEADD', 'DATEDIFF', 'DATEPART', 'DATETRUNC', 'DAYOFWEEK', 'EXTRACT',
+    'GETDATE', 'INTERVAL_CMP', 'LAST_DAY', 'MONTHS_BETWEEN', 'NEXT_DAY', 'SYSDATE',
+    'TIMEOFDAY', 'TIMESTAMP_CMP', 'TIMESTAMP_CMP_DATE', 'TIMESTAMP_CMP_TIMESTAMPTZ',
+    'TIMESTAMPTZ_CMP', 'TIMESTAMPTZ_CMP_DATE', 'TIMESTAMPTZ_CMP_TIMESTAMP', 'TIMEZONE',
+    'TO_TIMESTAMP', 'TRUNC', 'CURRENT_TIMESTAMP', 'LOCALTIMESTAMP',
+    # Math
+    'ABS', 'ACOS', 'ASIN', 'ATAN', 'ATAN2', 'CBRT', 'CEIL', 'CEILING', 'CHECKSUM', 'COS',
+    'COT', 'DEGREES', 'DEXP', 'DLOG1', 'DLOG10', 'EXP', 'FLOOR', 'LN', 'LOG', 'MOD', 'PI',
+    'POWER', 'POW', 'RADIANS', 'RANDOM', 'ROUND', 'SIGN', 'SIN', 'SQRT', 'TAN',
+    # String
+    'ASCII', 'BPCHARCMP', 'BTRIM', 'BTTEXT_PATTERN_CMP', 'CHAR_LENGTH', 'CHARACTER_LENGTH',
+    'CHARINDEX', 'CHR', 'COLLATE', 'CONCAT', 'CRC32', 'DIFFERENCE', 'INITCAP', 'LEFT',
+    'RIGHT', 'LEN', 'LENGTH', 'LOWER', 'LPAD', 'RPAD', 'LTRIM', 'MD5', 'OCTET_LENGTH',
+    'OCTETINDEX', 'POSITION', 'QUOTE_IDENT', 'QUOTE_LITERAL', 'REGEXP_COUNT',
+    'REGEXP_INSTR', 'REGEXP_REPLACE', 'REGEXP_SUBSTR', 'REPEAT', 'REPLACE', 'REPLICATE',
+    'REVERSE', 'RTRIM', 'SHA', 'SHA1', 'SHA2', 'SOUNDEX', 'SPLIT_PART', 'STRPOS',
+    'STRTOL', 'SUBSTR', 'SUBSTRING', 'TEXTLEN', 'TRANSLATE', 'TRIM', 'UPPER', 'FNV_HASH',
+    'TO_HEX', 'TO_VARBYTE', 'FROM_HEX', 'FROM_VARBYTE', 'GETBIT', 'VARBYTE',
+    # Data type formatting and conversion
+    'CAST', 'CONVERT', 'TO_CHAR', 'TO_DATE', 'TO_NUMBER', 'TEXT_TO_INT_ALT',
+    'TEXT_TO_NUMERIC_ALT', 'TRY_CAST',
+    # Window
+    'CUME_DIST', 'DENSE_RANK', 'FIRST_VALUE', 'LAG', 'LAST_VALUE', 'LEAD', 'NTH_VALUE',
+    'NTILE', 'PERCENT_RANK', 'RANK', 'RATIO_TO_REPORT', 'ROW_NUMBER',
+    # Spatial
+    'ST_ASGEOJSON', 'ST_ASTEXT', 'ST_CONTAINS', 'ST_DISTANCE', 'ST_DWITHIN',
+    'ST_GEOMFROMTEXT', 'ST_GEOMFROMGEOJSON', 'ST_INTERSECTS', 'ST_MAKEPOINT',
+    'ST_POINT', 'ST_SETSRID', 'ST_X', 'ST_Y', 'H3_FROMLONGLAT', 'H3_POLYFILL',
+    # System and information
+    'CURRENT_DATABASE', 'CURRENT_SCHEMA', 'CURRENT_SCHEMAS', 'CURRENT_USER',
+    'CURRENT_USER_ID', 'HAS_DATABASE_PRIVILEGE', 'HAS_SCHEMA_PRIVILEGE',
+    'HAS_TABLE_PRIVILEGE', 'PG_BACKEND_PID', 'PG_LAST_COPY_COUNT', 'PG_LAST_COPY_ID',
+    'PG_LAST_QUERY_ID', 'SESSION_USER', 'SLICE_NUM', 'USER', 'VERSION',
+}
+
+# Words the lexer sees directly before "(" that are not function calls
+NON_CALL_WORDS = {
+    'DISTKEY', 'SORTKEY', 'IDENTITY', 'VARYING', 'NVARCHAR', 'NCHAR', 'BPCHAR',
+    'VARBINARY', 'FLOAT4', 'FLOAT8', 'INT2', 'INT4', 'INT8', 'ENCODE', 'COMPOUND',
+    'INTERLEAVED', 'UNLOAD', 'GROUPING', 'ROLLUP', 'CUBE', 'SETS', 'WITHIN', 'TIMETZ',
+    'LANGUAGE', 'EXCEPTION', 'RAISE', 'PERFORM', 'LIKE'
+}
+# Words after which "name (" is a table, column or routine list, not a call
+NAME_BEFORE_PAREN = {
+    'INTO', 'TABLE', 'VIEW', 'REFERENCES', 'FUNCTION', 'PROCEDURE', 'CALL', 'EXISTS',
+    'COPY', 'ANALYZE', 'ONLY'
+}
+
+# Source-dialect types Redshift rejects, checked where a type is expected
+FOREIGN_TYPES = {
+    'VARCHAR2': 'VARCHAR', 'NVARCHAR2': 'NVARCHAR', 'NUMBER': 'DECIMAL or NUMERIC',
+    'DATETIME': 'TIMESTAMP', 'DATETIME2': 'TIMESTAMP', 'STRING': 'VARCHAR',
+    'INT64': 'BIGINT', 'FLOAT64': 'DOUBLE PRECISION', 'FLOAT32': 'REAL',
+    'TINYINT': 'SMALLINT', 'MEDIUMINT': 'INTEGER', 'VARIANT': 'SUPER', 'JSON': 'SUPER',
+    'JSONB': 'SUPER', 'CLOB': 'VARCHAR(65535)', 'BLOB': 'VARBYTE', 'BYTES': 'VARBYTE',
+    'LONGTEXT': 'VARCHAR(65535)', 'MEDIUMTEXT': 'VARCHAR(65535)', 'UUID': 'CHAR(36)',
+    'STRUCT': 'SUPER', 'MAP': 'SUPER', 'BYTEA': 'VARBYTE'
+}
+
+STATEMENT_HEADS = {
+    'ABORT', 'ALTER', 'ANALYZE', 'BEGIN', 'CALL', 'CANCEL', 'CLOSE', 'COMMENT', 'COMMIT',
+    'COPY', 'CREATE', 'DEALLOCATE', 'DECLARE', 'DELETE', 'DESC', 'DROP', 'END', 'EXECUTE',
+    'EXPLAIN', 'FETCH', 'GRANT', 'INSERT', 'LOCK', 'MERGE', 'PREPARE', 'REFRESH', 'RESET',
+    'REVOKE', 'ROLLBACK', 'SELECT', 'SET', 'SHOW', 'START', 'TRUNCATE', 'UNLOAD',
+    'UPDATE', 'VACUUM', 'VALUES', 'WITH', 'RAISE', 'RETURN', 'IF', 'LOOP', 'FOR', 'WHILE',
+    'EXIT', 'CONTINUE', 'ELSE', 'ELSIF', 'OPEN', 'PERFORM'
+}
+
+COLUMN_CONSTRAINT_WORDS = {'PRIMARY', 'FOREIGN', 'UNIQUE', 'CONSTRAINT', 'CHECK', 'KEY', 'LIKE'}
+
+_FUNCTION_TITLE_RE = re.compile(r'^(.{0,120}?)\s+functions?$', re.IGNORECASE)
+_NAME_RE = re.compile(r'\b[A-Z][A-Z0-9_]+\b')
+_TITLE_STOP_WORDS = {'AND', 'OR', 'SQL', 'AWS', 'JSON', 'SUPER', 'VARBYTE'}
+
+@functools.lru_cache(maxsize=1)
+def function_catalog():
+    """The catalog file merged with REDSHIFT_FUNCTIONS, or None when no file is packaged"""
+    if not REDSHIFT_FUNCTIONS_PATH or not os.path.exists(REDSHIFT_FUNCTIONS_PATH):
+        return None
+    try:
+        with open(REDSHIFT_FUNCTIONS_PATH, encoding='utf-8') as f:
+            names = {line.strip().upper() for line in f if line.strip()}
+    except Exception as e:
+        print(f"Function catalog error: {e}")
+        return None
+    return frozenset(names | REDSHIFT_FUNCTIONS)
+
+def extract_function_names(text):
+    """Function names from the titles in reference page text ("DATEADD function", "NVL and COALESCE functions")"""
+    names = set()
+    for line in text.split('\n'):
+        match = _FUNCTION_TITLE_RE.match(line.lstrip('#').strip())
+        if match:
+            names.update(name for name in _NAME_RE.findall(match.group(1)) if name not in _TITLE_STOP_WORDS)
+    return names
+
+def build_catalog(paths, out_path):
+    """Write the function names found in HTML or text reference pages, returns the count"""
+    import html_text
+    names = set()
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            content = f.read()
+        if path.endswith(('.html', '.htm')):
+            content = html_text.html_to_text(content, max_chars=len(content))
+        names.update(extract_function_names(content))
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write(''.join(f"{name}\n" for name in sorted(names)))
+    return len(names)
+
+def defined_functions(sql):
+    """Names of the functions and procedures a script creates, so calls to them pass"""
+    tokens = sql_lexer.significant(sql_lexer.tokenize(sql))
+    names = set()
+    for k, (kind, text, _) in enumerate(tokens):
+        if text.upper() in ('FUNCTION', 'PROCEDURE') and any(t[1].upper() == 'CREATE' for t in tokens[max(0, k - 4):k]):
+            j = k + 1
+            while j + 2 < len(tokens) and tokens[j + 1][1] == '.':
+                j += 2
+            if j < len(tokens):
+                names.add(tokens[j][1].strip('"').upper())
+    return names
+
+def _closing_paren(tokens, k):
+    """Index of the ")" matching the "(" at tokens[k], or None"""
+    depth = 0
+    for j in range(k, len(tokens)):
+        if tokens[j][1] == '(':
+            depth += 1
+        elif tokens[j][1] == ')':
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+def validate(sql, known_functions=()):
+    """Problems Redshift would reject in one converted statement, as messages; [] when none are found"""
+    tokens = sql_lexer.tokenize(sql)
+    issues = []
+    for kind, text, _ in tokens:
+        if kind == 'comment' and text.startswith('/*') and (len(text) < 4 or not text.endswith('*/')):
+            issues.append('unterminated /* comment')
+        elif kind == 'string' and not _is_terminated(text):
+            issues.append('unterminated string literal')
+        elif kind == 'qident' and text[0] == '`':
+            issues.append(f"backtick-quoted identifier {text}; Redshift quotes identifiers with double quotes")
+        elif kind == 'qident' and (len(text) < 2 or text[-1] != '"'):
+            issues.append('unterminated quoted identifier')
+    tokens = sql_lexer.significant(tokens)
+    if not tokens:
+        return issues
+
+    words = [text.upper() if kind in sql_lexer.WORD_KINDS else text for kind, text, _ in tokens]
+    if words[0] not in STATEMENT_HEADS and words[0] != '(':
+        issues.append(f"does not start with a SQL statement (found {tokens[0][1]!r})")
+    is_create_table = words[0] == 'CREATE' and 'TABLE' in words[1:4]
+    known = function_catalog()
+    openers = []
+    unknown = []
+
+    for k, (kind, text, _) in enumerate(tokens):
+        word = words[k]
+        prev = words[k - 1] if k else None
+        nxt = words[k + 1] if k + 1 < len(words) else None
+        if kind == 'op':
+            if text == '(':
+                if is_create_table and not openers and prev is not None and tokens[k - 1][0] in ('ident', 'qident', 'function'):
+                    openers.append('columns')
+                else:
+                    openers.append(prev if tokens[k - 1][0] in sql_lexer.WORD_KINDS else None)
+            elif text == ')':
+                if not openers:
+                    issues.append("unmatched ')'")
+                else:
+                    openers.pop()
+            elif text == '(+)':
+                issues.append('Oracle (+) outer join; use LEFT or RIGHT JOIN')
+            continue
+        if kind not in sql_lexer.WORD_KINDS:
+            continue
+
+        if prev == '::' or (prev == 'AS' and openers and openers[-1] in ('CAST', 'TRY_CAST', 'CONVERT')) \
+                or (openers and openers[-1] == 'columns' and k >= 2 and words[k - 2] in ('(', ',')
+                    and words[k - 1] not in COLUMN_CONSTRAINT_WORDS):
+            if word in FOREIGN_TYPES:
+                issues.append(f"type {text} is not a Redshift type; use {FOREIGN_TYPES[word]}")
+                continue
+
+        if word == 'TABLESAMPLE' or (word == 'SAMPLE' and nxt == '('):
+            issues.append(f"{word} is not supported by Redshift")
+        elif word == 'CONNECT' and nxt == 'BY':
+            issues.append('CONNECT BY is not supported by Redshift; use a recursive CTE')
+        elif word in ('ROWNUM', 'ROWID') and prev != '.':
+            issues.append(f"Oracle pseudocolumn {word} is not supported by Redshift")
+        elif word == 'DUAL' and prev == 'FROM':
+            issues.append('Redshift has no DUAL table; omit the FROM clause')
+        elif word in ('AUTO_INCREMENT', 'ENGINE') and (word == 'AUTO_INCREMENT' or nxt == '='):
+            issues.append(f"{word} is not supported by Redshift")
+        elif kind == 'function':
+            if prev == '.' or prev in NAME_BEFORE_PAREN or word in NON_CALL_WORDS:
+                continue
+            if known is None or word in known or word in known_functions:
+                continue
+            close = _closing_paren(tokens, k + 1)
+            if close is not None and close + 2 < len(words) and words[close + 1] == 'AS' and words[close + 2] == '(':
+                # CTE with a column list
+                continue
+            if word not in unknown:
+                unknown.append(word)
+    if openers:
+        issues.append(f"{len(openers)} unclosed '('")
+    issues.extend(f"function {name} is not in the Redshift function catalog" for name in unknown)
+    return issues
+
+def _is_terminated(text):
+    if text[0] == "'":
+        return len(text) >= 2 and text.endswith("'")
+    tag = text[:text.index('$', 1) + 1]
+    return len(text) >= 2 * len(tag) and text.endswith(tag)
+
+def validate_script(sql, known_functions=()):
+    """validate() for every statement of a converted script, messages prefixed by statement number"""
+    statements = [s for s in sql_splitter.split_statements(sql) if not sql_splitter.is_comment_only(s)]
+    if len(statements) <= 1:
+        return validate(sql, known_functions)
+    return [
+        f"statement {index}: {issue}"
+        for index, statement in enumerate(statements, 1) for issue in validate(statement, known_functions)
+    ]
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Build the Redshift function catalog or validate Redshift SQL')
+    parser.add_argument('paths', nargs='*', help='function reference pages to extract, or SQL files with --check')
+    parser.add_argument('-o', '--output', default='redshift_functions.txt', help='catalog file to write')
+    parser.add_argument('--check', action='store_true', help='validate the given SQL files instead')
+    args = parser.parse_args()
+    if not args.paths:
+        parser.error('no files given')
+    if args.check:
+        failed = False
+        for path in args.paths:
+            with open(path, encoding='utf-8') as f:
+                sql = f.read()
+            issues = validate_script(sql, defined_functions(sql))
+            for issue in issues:
+                print(f"{path}: {issue}")
+            failed = failed or bool(issues)
+        raise SystemExit(1 if failed else 0)
+    count = build_catalog(args.paths, args.output)
+    print(f"Wrote {count} function names from {len(args.paths)} pages to {args.output}")
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+
+# Read-only endpoints whose payload only changes on deploy. Each response is
+# serialized once at import with a strong ETag, and a request whose
+# If-None-Match carries that ETag gets an empty 304, so CloudFront and browsers
+# can revalidate without the body being rebuilt or resent.
+
+STATIC_MAX_AGE_SECONDS = int(os.environ.get('STATIC_MAX_AGE_SECONDS', '300'))
+# CloudFront may keep them longer; a deploy changes the ETag
+STATIC_CDN_MAX_AGE_SECONDS = int(os.environ.get('STATIC_CDN_MAX_AGE_SECONDS', '3600'))
+
+PUBLIC_CACHE_CONTROL = f"public, max-age={STATIC_MAX_AGE_SECONDS}, s-maxage={STATIC_CDN_MAX_AGE_SECONDS}"
+# Cached copies must be revalidated every time, e.g. health checks
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+def static_response(payload, cache_control=PUBLIC_CACHE_CONTROL):
+    """Pre-serialized 200 response for a payload, with its ETag"""
+    body = json.dumps(payload)
+    etag = '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+    return {
+        'body': body,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json',
+            'Cache-Control': cache_control,
+            'ETag': etag
+        }
+    }
+
+def request_header(event, name):
+    """Header value from an API Gateway or function URL event, matched case-insensitively"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        # Weak comparison, as If-None-Match requires: W/"x" matches "x"
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
+
+def serve(static, event):
+    """The static response, or a bodiless 304 when the client already has it"""
+    headers = dict(static['headers'])
+    if etag_matches(request_header(event, 'If-None-Match'), headers['ETag']):
+        del headers['Content-Type']
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
+    return {'statusCode': 200, 'headers': headers, 'body': static['body']}
@@ -0,0 +1,21 @@
+import sys
+import types
+
+import aws_clients
+
+def test_clients_are_shared_per_service_and_config(monkeypatch):
+    built = []
+    boto3 = types.SimpleNamespace(client=lambda service, **kwargs: built.append((service, kwargs)) or object())
+    config = types.SimpleNamespace(Config=lambda **kwargs: kwargs)
+    monkeypatch.setitem(sys.modules, 'boto3', boto3)
+    monkeypatch.setitem(sys.modules, 'botocore.config', config)
+    monkeypatch.setattr(aws_clients, '_clients', {})
+
+    default = aws_clients.client('lambda')
+    assert aws_clients.client('lambda') is default
+    slow = aws_clients.client('lambda', read_timeout=900, retries={'max_attempts': 0})
+    assert slow is not default
+    assert aws_clients.client('lambda', retries={'max_attempts': 0}, read_timeout=900) is slow
+    assert aws_clients.client('bedrock-runtime') is not default
+    assert [service for service, _ in built] == ['lambda', 'lambda', 'bedrock-runtime']
+    assert built[1][1]['config'] == {'read_timeout': 900, 'retries': {'max_attempts': 0}}
@@ -0,0 +1,14 @@
+import benchmark
+
+def test_lambda_init_within_budget_without_boto3(tmp_path, monkeypatch):
+    monkeypatch.setenv('JOB_STORE', 'sqlite')
+    monkeypatch.setenv('JOB_STORE_PATH', str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setenv('KNOWLEDGE_BASE_ID', 'benchmark')
+    monkeypatch.setenv('DOCS_INDEX_PATH', str(tmp_path / 'missing.idx'))
+    results = benchmark.cold_start(list(benchmark.COLD_START_HANDLERS), 1, 100000, benchmark.INIT_BUDGET_MS)
+    assert set(results) == set(benchmark.COLD_START_HANDLERS)
+    for target, result in results.items():
+        assert 'error' not in result, (target, result)
+        assert not result['boto3_loaded_at_import'], target
+        assert not result['boto3_loaded_before_convert'], target
+        assert result['init_ms'] <= benchmark.INIT_BUDGET_MS, (target, result['init_ms'])
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import job_store
+import jobs
+
+def store(tmp_path):
+    return job_store.SQLiteJobStore(str(tmp_path / 'jobs.sqlite3'))
+
+def test_run_job_records_progress_and_result(tmp_path):
+    jobs_db = store(tmp_path)
+    job = jobs_db.create_job('Oracle', 'SELECT 1 FROM t; -- note\nSELECT 2 FROM t;', 'nova-pro', False)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        status = jobs.run_job(jobs_db, job['job_id'], lambda statement: (statement.lower(), None, 'model'), executor)
+    assert status == 'completed'
+    finished = jobs_db.get_job(job['job_id'])
+    assert finished['status'] == 'completed'
+    assert finished['redshift_sql'] == 'select 1 from t;\n\n-- note\nselect 2 from t;'
+    assert finished['completed_count'] == 2
+    assert [s['status'] for s in finished['statements']] == ['completed', 'completed']
+
+def test_failed_statements_keep_their_sql(tmp_path):
+    jobs_db = store(tmp_path)
+    job = jobs_db.create_job('Oracle', 'SELECT 1 FROM t; SELECT 2 FROM t;', 'nova-pro', False)
+
+    def convert(statement):
+        if '2' in statement:
+            raise RuntimeError('boom')
+        return statement, None, 'rules'
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert jobs.run_job(jobs_db, job['job_id'], convert, executor) == 'completed_with_errors'
+    finished = jobs_db.get_job(job['job_id'])
+    assert finished['failed_count'] == 1
+    assert '-- Conversion failed: boom\nSELECT 2 FROM t;' in finished['redshift_sql']
+
+def test_status_and_result_are_written_together(tmp_path):
+    jobs_db = store(tmp_path)
+    job = jobs_db.create_job('Oracle', 'SELECT 1 FROM t', 'nova-pro', False)
+    jobs_db.start_job(job['job_id'], 1)
+    jobs_db.finish_job(job['job_id'], 'completed', 'SELECT 1 FROM t;', None)
+    with jobs_db._connect() as conn:
+        row = conn.execute("SELECT job, result FROM jobs WHERE job_id = ?", (job['job_id'],)).fetchone()
+    assert '"completed"' in row[0] and 'SELECT 1 FROM t;' in row[1]
+
+def test_unknown_job_updates_are_ignored(tmp_path):
+    jobs_db = store(tmp_path)
+    jobs_db.start_job('missing', 3)
+    jobs_db.finish_job('missing', 'completed', 'SELECT 1;')
+    assert jobs_db.get_job('missing') is None
+
+def test_jobs_past_their_deadline_fail(tmp_path, monkeypatch):
+    jobs_db = store(tmp_path)
+    job = jobs_db.create_job('Oracle', 'SELECT 1 FROM t', 'nova-pro', False)
+    jobs_db.start_job(job['job_id'], 1, deadline=time.time() + 60)
+    running = jobs.expire_stale(jobs_db, jobs_db.get_job(job['job_id']))
+    assert running['status'] == 'running'
+    monkeypatch.setattr(jobs.time, 'time', lambda: running['deadline'] + jobs.JOB_DEADLINE_GRACE_SECONDS + 1)
+    expired = jobs.expire_stale(jobs_db, jobs_db.get_job(job['job_id']))
+    assert expired['status'] == 'failed' and expired['error']
+
+def test_jobs_without_progress_fail(tmp_path, monkeypatch):
+    jobs_db = store(tmp_path)
+    job = jobs_db.create_job('Oracle', 'SELECT 1 FROM t', 'nova-pro', False)
+    assert jobs.expire_stale(jobs_db, jobs_db.get_job(job['job_id']))['status'] == 'queued'
+    monkeypatch.setattr(jobs, 'JOB_STALE_SECONDS', -1)
+    assert jobs.expire_stale(jobs_db, jobs_db.get_job(job['job_id']))['status'] == 'failed'
@@ -0,0 +1,75 @@
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import model_invoke
+
+NOVA = {'id': 'nova', 'name': 'Nova', 'format': 'nova'}
+CLAUDE = {'id': 'claude', 'name': 'Claude', 'format': 'claude'}
+
+class Throttled(Exception):
+    response = {'Error': {'Code': 'ThrottlingException'}}
+
+class FakeBedrock:
+    """invoke_model answering per model id after a delay, or raising queued errors first"""
+
+    def __init__(self, delays, errors=None):
+        self.delays = delays
+        self.errors = errors or {}
+        self.calls = []
+        self.released = threading.Event()
+
+    def invoke_model(self, modelId, body):
+        self.calls.append(modelId)
+        if self.errors.get(modelId):
+            raise self.errors[modelId].pop(0)
+        self.released.wait(self.delays[modelId])
+        if modelId == 'nova':
+            result = {'output': {'message': {'content': [{'text': 'from nova'}]}}, 'usage': {'inputTokens': 3, 'outputTokens': 2}}
+        else:
+            result = {'content': [{'text': 'from claude'}], 'usage': {'input_tokens': 4, 'output_tokens': 5}}
+        return {'body': io.BytesIO(json.dumps(result).encode('utf-8'))}
+
+@pytest.fixture(autouse=True)
+def fast_hedging(monkeypatch):
+    monkeypatch.setattr(model_invoke, '_latencies', {})
+    monkeypatch.setattr(model_invoke, 'HEDGE_DEFAULT_DELAY_SECONDS', 0.05)
+    monkeypatch.setattr(model_invoke, 'RETRY_BASE_SECONDS', 0.001)
+
+def test_fast_primary_is_not_hedged():
+    client = FakeBedrock({'nova': 0, 'claude': 0})
+    usage = {}
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        text, answered = model_invoke.invoke_hedged(executor, client, NOVA, 'p', hedge_config=CLAUDE, usage=usage)
+    assert (text, answered) == ('from nova', NOVA)
+    assert client.calls == ['nova']
+    assert usage['input_tokens'] == 3 and usage['output_tokens'] == 2
+
+def test_slow_primary_is_hedged_and_the_hedge_wins():
+    client = FakeBedrock({'nova': 5, 'claude': 0})
+    usage = {}
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        text, answered = model_invoke.invoke_hedged(executor, client, NOVA, 'p', deadline_seconds=2, hedge_config=CLAUDE, usage=usage)
+        client.released.set()
+    assert (text, answered) == ('from claude', CLAUDE)
+    assert client.calls == ['nova', 'claude']
+    assert usage['output_tokens'] == 5
+
+def test_deadline_without_an_answer():
+    client = FakeBedrock({'nova': 5})
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(model_invoke.DeadlineExceeded):
+            model_invoke.invoke_hedged(executor, client, NOVA, 'p', deadline_seconds=0.1)
+        client.released.set()
+
+def test_throttling_is_retried_other_errors_are_not():
+    client = FakeBedrock({'nova': 0}, {'nova': [Throttled(), Throttled()]})
+    assert model_invoke.invoke_with_retries(client, NOVA, 'p') == 'from nova'
+    assert client.calls == ['nova'] * 3
+    client = FakeBedrock({'nova': 0}, {'nova': [ValueError('bad request')]})
+    with pytest.raises(ValueError):
+        model_invoke.invoke_with_retries(client, NOVA, 'p')
+    assert client.calls == ['nova']
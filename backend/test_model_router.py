@@ -0,0 +1,29 @@
+import model_router
+
+PLSQL = (
+    "DECLARE CURSOR c IS SELECT JSON_VALUE(doc, '$.a') FROM (SELECT * FROM (SELECT * FROM "
+    "(SELECT doc FROM t WHERE ROWNUM < 10 CONNECT BY PRIOR id = pid))); "
+    "BEGIN LOOP FETCH c INTO v; EXIT WHEN c%NOTFOUND; EXECUTE IMMEDIATE 'x'; END LOOP; END;"
+)
+
+def test_simple_statement_goes_to_the_cheapest_tier():
+    assert model_router.choose_model('SELECT a, b FROM t WHERE c = 1', 'Oracle', model_router.DEFAULT_TIERS) == ('nova-pro', 0)
+
+def test_complexity_signals():
+    signals = model_router.complexity(PLSQL, 'Oracle')
+    assert signals['procedural']
+    assert signals['subqueries'] == 3
+    assert signals['semi_structured'] == ['JSON_VALUE']
+    assert {'CONNECT', 'ROWNUM'} <= set(signals['dialect_features'])
+    assert model_router.choose_model(PLSQL, 'Oracle', model_router.DEFAULT_TIERS) == ('claude-haiku-4.5', signals['score'])
+
+def test_snowflake_path_access_counts_as_semi_structured():
+    assert model_router.complexity('SELECT payload:customer.id FROM events', 'Snowflake')['semi_structured'] == [':']
+    assert model_router.complexity('SELECT payload:customer.id FROM events', 'Oracle')['semi_structured'] == []
+
+def test_tiers_pick_the_highest_threshold_reached():
+    tiers = model_router.parse_tiers('claude-opus-4.6:60, nova-pro:0,ignored')
+    assert tiers == [(0, 'nova-pro'), (60, 'claude-opus-4.6')]
+    assert model_router.choose_model(PLSQL, 'Oracle', tiers)[0] == 'claude-opus-4.6'
+    # The cheapest tier is used even when its threshold is above the score
+    assert model_router.choose_model('SELECT 1', None, [(10, 'nova-pro'), (50, 'claude-opus-4.6')])[0] == 'nova-pro'
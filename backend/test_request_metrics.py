@@ -0,0 +1,26 @@
+import json
+
+import request_metrics
+
+def test_operation_for_reports_matched_route():
+    routes = {'/stats': None, '/jobs': None}
+    assert request_metrics.operation_for('/stats', routes) == '/stats'
+    assert request_metrics.operation_for('/convert', routes, ('/convert',)) == '/convert'
+
+def test_operation_for_folds_unknown_paths():
+    routes = {'/stats': None}
+    assert request_metrics.operation_for('/wp-login.php', routes) == request_metrics.OTHER_OPERATION
+    assert request_metrics.operation_for('/stats/../x', routes) == request_metrics.OTHER_OPERATION
+
+def test_finish_logs_one_emf_line(capsys):
+    metrics = request_metrics.start('lambda', '/stats')
+    with request_metrics.stage('rules'):
+        pass
+    request_metrics.measure('request_bytes', 10, 'Bytes')
+    assert metrics.finish(200).startswith('rules;dur=')
+    assert metrics.finish(200) is None
+    record = json.loads(capsys.readouterr().out)
+    assert record['operation'] == '/stats'
+    assert record['status'] == 200
+    assert record['request_bytes'] == 10
+    assert record['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['service', 'operation']]
@@ -0,0 +1,59 @@
+import result_cache
+
+class FakeDynamoDB:
+    """batch_get_item that leaves every key unprocessed for the first `throttled` calls"""
+
+    def __init__(self, items, throttled):
+        self.items = items
+        self.throttled = throttled
+        self.calls = 0
+
+    def batch_get_item(self, RequestItems):
+        self.calls += 1
+        keys = RequestItems[result_cache.RESULT_CACHE_TABLE]['Keys']
+        if self.calls <= self.throttled:
+            return {'Responses': {}, 'UnprocessedKeys': RequestItems}
+        found = [self.items[k['cache_key']] for k in keys if k['cache_key'] in self.items]
+        return {'Responses': {result_cache.RESULT_CACHE_TABLE: found}, 'UnprocessedKeys': {}}
+
+def fake_table(monkeypatch, throttled):
+    item = {'cache_key': 'k1', 'result': '{"redshift_sql": "SELECT 1"}', 'expires_at': 4102444800}
+    client = FakeDynamoDB({'k1': item}, throttled)
+    sleeps = []
+    monkeypatch.setattr(result_cache.aws_clients, 'dynamodb', lambda: client)
+    monkeypatch.setattr(result_cache.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(result_cache, '_lru', type(result_cache._lru)())
+    return client, sleeps
+
+def test_unprocessed_keys_back_off_before_retrying(monkeypatch):
+    client, sleeps = fake_table(monkeypatch, throttled=2)
+    assert result_cache.get_cached_results(['k1', 'k2']) == {'k1': {'redshift_sql': 'SELECT 1'}}
+    assert client.calls == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= result_cache.BATCH_RETRY_BASE_SECONDS
+    assert 0 <= sleeps[1] <= result_cache.BATCH_RETRY_BASE_SECONDS * 2
+
+def test_batch_get_gives_up_after_its_attempts(monkeypatch):
+    client, sleeps = fake_table(monkeypatch, throttled=10)
+    assert result_cache.get_cached_results(['k1']) == {}
+    assert client.calls == result_cache.BATCH_GET_ATTEMPTS
+    assert len(sleeps) == result_cache.BATCH_GET_ATTEMPTS - 1
+
+def test_found_results_fill_the_memory_tier(monkeypatch):
+    client, sleeps = fake_table(monkeypatch, throttled=0)
+    result_cache.get_cached_results(['k1'])
+    assert result_cache.get_cached_results(['k1']) == {'k1': {'redshift_sql': 'SELECT 1'}}
+    assert client.calls == 1
+    assert sleeps == []
+
+def test_reformatted_sql_shares_a_cache_key():
+    key = result_cache.make_cache_key('Oracle', 'select a\n  from t', 'nova-pro', False, 'v1')
+    assert key == result_cache.make_cache_key('Oracle', 'SELECT a FROM t', 'nova-pro', False, 'v1')
+    assert key != result_cache.make_cache_key('Oracle', 'SELECT a FROM t', 'nova-pro', True, 'v1')
+    assert key != result_cache.make_cache_key('Oracle', 'SELECT a FROM t', 'nova-pro', False, 'v2')
+    assert key != result_cache.make_statement_key('Oracle', 'SELECT a FROM t', 'nova-pro', False, 'v1')
+
+def test_normalization_keeps_literals_identifiers_and_comments():
+    assert result_cache.normalize_sql("SELECT a FROM t WHERE b = 'x  Y'") == "SELECT a FROM t WHERE b = 'x  Y'"
+    assert result_cache.normalize_sql('select "Mixed" from t') != result_cache.normalize_sql('select "MIXED" from t')
+    assert result_cache.normalize_sql('SELECT a FROM t -- use QUALIFY') != result_cache.normalize_sql('SELECT a FROM t')
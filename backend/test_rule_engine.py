@@ -0,0 +1,40 @@
+import rule_engine
+
+def converts(sql, source_db):
+    result = rule_engine.convert_statement(sql, source_db)
+    return result and result[0]
+
+def test_mechanical_mappings():
+    assert rule_engine.convert_statement('SELECT NVL(a, 1), SYSDATE FROM t', 'Oracle') == (
+        'SELECT COALESCE(a, 1), GETDATE() FROM t', ['NVL→COALESCE', 'SYSDATE→GETDATE()']
+    )
+    assert converts('SELECT CAST(a AS INT64) FROM `t`', 'BigQuery') == 'SELECT CAST(a AS BIGINT) FROM "t"'
+    assert converts('SELECT ROW_NUMBER() OVER (ORDER BY a) FROM t', 'Snowflake') == (
+        'SELECT ROW_NUMBER() OVER (ORDER BY a) FROM t'
+    )
+
+def test_division_goes_to_the_model_where_numeric_rules_differ():
+    for source_db in ('Snowflake', 'Oracle', 'Clickhouse', 'MySQL', 'BigQuery'):
+        assert converts('SELECT 5/2', source_db) is None, source_db
+        assert converts('SELECT a % b FROM t', source_db) is None, source_db
+    # Teradata divides integers as Redshift does
+    assert converts('SELECT a/b FROM t', 'Teradata') == 'SELECT a/b FROM t'
+
+def test_functions_with_different_results_go_to_the_model():
+    assert converts('SELECT AVG(a) FROM t', 'Snowflake') is None
+    assert converts('SELECT GREATEST(a, b) FROM t', 'MySQL') is None
+    assert converts('SELECT LEAST(a, b) FROM t', 'Oracle') is None
+    assert converts('SELECT count() FROM t', 'Clickhouse') is None
+    assert converts('SELECT count(a) FROM t', 'Clickhouse') == 'SELECT count(a) FROM t'
+
+def test_oracle_null_string_semantics_go_to_the_model():
+    assert converts('SELECT a || b FROM t', 'Oracle') is None
+    assert converts("SELECT a FROM t WHERE b = ''", 'Oracle') is None
+    assert converts("SELECT a FROM t WHERE b = 'x'", 'Oracle') == "SELECT a FROM t WHERE b = 'x'"
+
+def test_unmapped_constructs_go_to_the_model():
+    assert converts("SELECT a FROM t WHERE b REGEXP 'x'", 'MySQL') is None
+    assert converts('SELECT a FROM t LIMIT 5, 10', 'MySQL') is None
+    assert converts('DELETE FROM t WHERE a = 1 LIMIT 1', 'MySQL') is None
+    assert converts('SELECT a FROM t -- do not use NVL here', 'Oracle') is None
+    assert converts('SELECT a FROM t', 'Unknown') is None
@@ -0,0 +1,29 @@
+import sql_lexer
+import sql_splitter
+
+def strings(sql, source_db='BigQuery'):
+    return [text for kind, text, _ in sql_lexer.tokenize(sql, source_db) if kind == 'string']
+
+def test_bigquery_triple_quoted_strings():
+    assert sql_splitter.split_statements("SELECT '''it's; here''' AS a; SELECT 2;", 'BigQuery') == [
+        "SELECT '''it's; here''' AS a;", 'SELECT 2;'
+    ]
+    assert strings('SELECT """multi\nline; "quoted" """ AS b') == ['"""multi\nline; "quoted" """']
+    assert strings("SELECT '''a\\''' b'''") == ["'''a\\''' b'''"]
+
+def test_bigquery_raw_strings():
+    # A backslash does not escape the closing quote of a raw string
+    assert strings("SELECT r'a\\', 'b;c'") == ["r'a\\'", "'b;c'"]
+    assert strings('SELECT R"\\d+;" AS p') == ['R"\\d+;"']
+    assert strings("SELECT rb'''x;\\''' AS q") == ["rb'''x;\\'''"]
+    assert sql_splitter.split_statements("SELECT r'''a;b''' AS c; SELECT 2", 'BigQuery') == [
+        "SELECT r'''a;b''' AS c;", 'SELECT 2'
+    ]
+
+def test_raw_prefix_is_an_identifier_elsewhere():
+    assert [t[:2] for t in sql_lexer.tokenize("SELECT r FROM t", 'BigQuery') if t[0] != 'ws'] == [
+        ('keyword', 'SELECT'), ('ident', 'r'), ('keyword', 'FROM'), ('ident', 't')
+    ]
+    # Other dialects keep '' as an escaped quote inside a plain string
+    assert strings("SELECT '''a'''", 'Oracle') == ["'''a'''"]
+    assert strings("SELECT r'a'", 'Oracle') == ["'a'"]
@@ -0,0 +1,40 @@
+import sql_splitter
+
+def test_splits_top_level_statements():
+    assert sql_splitter.split_statements("SELECT 'a;b' AS x; -- c;\nSELECT \"d;\" FROM t") == [
+        "SELECT 'a;b' AS x;", '-- c;\nSELECT "d;" FROM t'
+    ]
+    assert sql_splitter.split_statements('SELECT 1;  \n') == ['SELECT 1;']
+    assert sql_splitter.split_statements('SELECT 1; -- done\n') == ['SELECT 1; -- done']
+    assert sql_splitter.split_statements('SELECT 1;; ') == ['SELECT 1;']
+
+def test_case_expressions_and_blocks_do_not_split():
+    assert sql_splitter.split_statements('SELECT CASE WHEN a THEN 1 END; SELECT 2') == [
+        'SELECT CASE WHEN a THEN 1 END;', 'SELECT 2'
+    ]
+    assert sql_splitter.split_statements('BEGIN TRANSACTION; SELECT 1; COMMIT;') == [
+        'BEGIN TRANSACTION;', 'SELECT 1;', 'COMMIT;'
+    ]
+
+def test_end_case_closes_the_case_statement():
+    sql = (
+        'CREATE PROCEDURE p() BEGIN CASE x WHEN 1 THEN SELECT 1; ELSE SELECT 2; END CASE; '
+        'IF y THEN SELECT 3; END IF; END; SELECT 4; SELECT 5;'
+    )
+    assert sql_splitter.split_statements(sql, 'MySQL') == [
+        'CREATE PROCEDURE p() BEGIN CASE x WHEN 1 THEN SELECT 1; ELSE SELECT 2; END CASE; '
+        'IF y THEN SELECT 3; END IF; END;',
+        'SELECT 4;', 'SELECT 5;'
+    ]
+
+def test_oracle_routines_and_alternative_quoting():
+    sql = 'CREATE OR REPLACE PROCEDURE p IS v NUMBER; BEGIN v := 1; END; SELECT 1 FROM dual;'
+    assert sql_splitter.split_statements(sql, 'Oracle') == [
+        'CREATE OR REPLACE PROCEDURE p IS v NUMBER; BEGIN v := 1; END;', 'SELECT 1 FROM dual;'
+    ]
+    assert sql_splitter.split_statements("SELECT q'[a;b]', Q'!c;!' FROM dual; SELECT q FROM t", 'Oracle') == [
+        "SELECT q'[a;b]', Q'!c;!' FROM dual;", 'SELECT q FROM t'
+    ]
+
+def test_join_statements_terminates_each_statement():
+    assert sql_splitter.join_statements(['SELECT 1', '-- note', 'SELECT 2;']) == 'SELECT 1;\n\n-- note\n\nSELECT 2;'
@@ -0,0 +1,53 @@
+import pytest
+
+import sql_validator
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    path = tmp_path / 'redshift_functions.txt'
+    path.write_text('ST_BUFFER\nST_AREA\n')
+    monkeypatch.setattr(sql_validator, 'REDSHIFT_FUNCTIONS_PATH', str(path))
+    sql_validator.function_catalog.cache_clear()
+    yield
+    sql_validator.function_catalog.cache_clear()
+
+@pytest.fixture
+def no_catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(sql_validator, 'REDSHIFT_FUNCTIONS_PATH', str(tmp_path / 'missing.txt'))
+    sql_validator.function_catalog.cache_clear()
+    yield
+    sql_validator.function_catalog.cache_clear()
+
+def test_unknown_functions_need_the_catalog_file(no_catalog):
+    assert sql_validator.function_catalog() is None
+    assert sql_validator.validate("SELECT ST_AREA(ST_BUFFER(geom, 1)) FROM parcels") == []
+
+def test_catalog_file_reports_unknown_functions(catalog):
+    assert sql_validator.validate("SELECT ST_AREA(ST_BUFFER(geom, 1)), NVL(a, 0) FROM parcels") == []
+    assert sql_validator.validate("SELECT IFNULL(a, 0) FROM t") == [
+        'function IFNULL is not in the Redshift function catalog'
+    ]
+    assert sql_validator.validate("SELECT my_fn(a) FROM t", {'MY_FN'}) == []
+
+def test_defined_functions_count_as_known(catalog):
+    sql = "CREATE FUNCTION util.f_add(a int) RETURNS int AS $$ SELECT $1 + 1 $$ LANGUAGE sql;\nSELECT f_add(1);"
+    assert sql_validator.defined_functions(sql) == {'F_ADD'}
+    assert sql_validator.validate_script(sql, sql_validator.defined_functions(sql)) == []
+
+def test_reports_source_dialect_leftovers(no_catalog):
+    issues = sql_validator.validate("SELECT ROWNUM, CAST(x AS VARCHAR2(10)) FROM dual")
+    assert 'Oracle pseudocolumn ROWNUM is not supported by Redshift' in issues
+    assert 'type VARCHAR2 is not a Redshift type; use VARCHAR' in issues
+    assert 'Redshift has no DUAL table; omit the FROM clause' in issues
+
+def test_reports_broken_statements(no_catalog):
+    assert sql_validator.validate("SELECT 'abc FROM t") == ['unterminated string literal']
+    assert sql_validator.validate("SELECT (a FROM t") == ["1 unclosed '('"]
+    assert sql_validator.validate("Here is the converted SQL") == [
+        "does not start with a SQL statement (found 'Here')"
+    ]
+
+def test_validate_script_numbers_statements(no_catalog):
+    assert sql_validator.validate_script("SELECT 1;\nSELECT `a` FROM t;") == [
+        'statement 2: backtick-quoted identifier `a`; Redshift quotes identifiers with double quotes'
+    ]
@@ -0,0 +1,31 @@
+import json
+
+import static_responses
+
+MODELS = static_responses.static_response({'models': ['nova-pro']})
+
+def test_first_request_gets_the_body_and_etag():
+    response = static_responses.serve(MODELS, {'headers': {}})
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {'models': ['nova-pro']}
+    assert response['headers']['Cache-Control'] == static_responses.PUBLIC_CACHE_CONTROL
+    assert response['headers']['ETag'].startswith('"')
+
+def test_matching_if_none_match_gets_an_empty_304():
+    etag = MODELS['headers']['ETag']
+    for header in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+        response = static_responses.serve(MODELS, {'headers': {'if-none-match': header}})
+        assert response['statusCode'] == 304
+        assert response['body'] == ''
+        assert response['headers']['ETag'] == etag
+        assert 'Content-Type' not in response['headers']
+
+def test_stale_etag_gets_the_body():
+    response = static_responses.serve(MODELS, {'headers': {'If-None-Match': '"stale"'}})
+    assert response['statusCode'] == 200
+    assert response['body'] == MODELS['body']
+
+def test_etag_changes_with_the_payload():
+    other = static_responses.static_response({'models': ['nova-pro', 'claude-haiku-4.5']})
+    assert other['headers']['ETag'] != MODELS['headers']['ETag']
+    assert static_responses.static_response({'models': ['nova-pro']})['headers']['ETag'] == MODELS['headers']['ETag']
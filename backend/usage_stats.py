@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+# Token usage, throughput, latency and cache counters per model and source
+# dialect for GET /stats. Counters are kept per UTC day. With a table the
+# counters of a request are buffered and flushed with one atomic ADD per
+# (day, model, dialect) item, so concurrent Lambdas never overwrite each other;
+# without one (app.py) they stay in memory. Latency is kept as a histogram so
+# percentiles can be summed across containers.
+
+STATS_TABLE = os.environ.get('STATS_TABLE', 'sql-converter-stats')
+STATS_TTL_DAYS = int(os.environ.get('STATS_TTL_DAYS', '30'))
+
+# Upper bounds of the latency histogram buckets in milliseconds, plus an overflow bucket
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+def _bucket(prefix, seconds):
+    ms = seconds * 1000
+    for bound in LATENCY_BUCKETS_MS:
+        if ms <= bound:
+            return f"{prefix}_le_{bound}"
+    return f"{prefix}_le_inf"
+
+def _today():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+def histogram_percentile(counters, prefix, p):
+    """Upper bound in ms of the bucket holding the p-th quantile, or None without samples"""
+    buckets = [(bound, counters.get(f"{prefix}_le_{bound}", 0)) for bound in LATENCY_BUCKETS_MS]
+    buckets.append((None, counters.get(f"{prefix}_le_inf", 0)))
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+    seen = 0
+    for bound, count in buckets:
+        seen += count
+        if seen >= p * total:
+            # The overflow bucket reports the largest finite bound
+            return bound if bound is not None else LATENCY_BUCKETS_MS[-1]
+    return None
+
+def summarize(counters):
+    """Derived figures for one group of counters"""
+    hits, misses = counters.get('cache_hits', 0), counters.get('cache_misses', 0)
+    model_seconds = counters.get('model_ms', 0) / 1000
+    requests = counters.get('requests', 0)
+    return {
+        'requests': requests,
+        'errors': counters.get('errors', 0),
+        'model_calls': counters.get('model_calls', 0),
+        'input_tokens': counters.get('input_tokens', 0),
+        'output_tokens': counters.get('output_tokens', 0),
+        'output_tokens_per_sec': round(counters.get('output_tokens', 0) / model_seconds, 1) if model_seconds else None,
+        'cache_hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        'latency_ms': {f"p{int(p * 100)}": histogram_percentile(counters, 'request', p) for p in (0.5, 0.95, 0.99)},
+        'model_latency_ms': {f"p{int(p * 100)}": histogram_percentile(counters, 'call', p) for p in (0.5, 0.95, 0.99)}
+    }
+
+class UsageStats:
+    """Per (day, model, dialect) usage counters in memory or in a DynamoDB table"""
+
+    def __init__(self, table_name=None):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.table_name = table_name
+
+    @property
+    def table(self):
+        if not self.table_name:
+            return None
+        import aws_clients
+        return aws_clients.table(self.table_name)
+
+    def _add(self, model, source_db, counts):
+        key = (_today(), model or 'none', source_db or 'unknown')
+        with self.lock:
+            self.pending.setdefault(key, Counter()).update(counts)
+
+    def record_call(self, model, source_db, input_tokens, output_tokens, seconds):
+        """One model call with its token usage and latency"""
+        self._add(model, source_db, {
+            'model_calls': 1,
+            'input_tokens': input_tokens or 0,
+            'output_tokens': output_tokens or 0,
+            'model_ms': int(seconds * 1000),
+            _bucket('call', seconds): 1
+        })
+
+    def record_request(self, model, source_db, seconds, cache=None, error=False):
+        """One conversion request with its end-to-end latency and cache outcome"""
+        counts = {'requests': 1, _bucket('request', seconds): 1}
+        if cache == 'hit':
+            counts['cache_hits'] = 1
+        elif cache == 'miss':
+            counts['cache_misses'] = 1
+        if error:
+            counts['errors'] = 1
+        self._add(model, source_db, counts)
+
+    def record_finished(self, metrics, status):
+        """Count a finished request_metrics request; only conversions carry a source_db
+
+        Requests count under their model_id property, the Bedrock model id their
+        model calls are recorded under, or under model when they set none.
+        """
+        properties = metrics.properties
+        if 'source_db' in properties:
+            self.record_request(
+                properties.get('model_id') or properties.get('model'), properties['source_db'], metrics.total_seconds or 0,
+                cache=properties.get('cache'), error=status >= 500 or 'error_type' in properties
+            )
+
+    def flush(self):
+        """Write buffered counters to the table; in memory they simply stay put"""
+        if not self.table_name:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        expires_at = int(time.time()) + STATS_TTL_DAYS * 86400
+        for (day, model, source_db), counts in pending.items():
+            names = {f"#c{i}": name for i, name in enumerate(counts)}
+            values = {f":c{i}": value for i, value in enumerate(counts.values())}
+            try:
+                self.table.update_item(
+                    Key={'stats_key': f"{day}#{model}#{source_db}"},
+                    UpdateExpression='SET #day = :day, #model = :model, source_db = :db, expires_at = :exp ADD '
+                                     + ', '.join(f"#c{i} :c{i}" for i in range(len(counts))),
+                    ExpressionAttributeNames={**names, '#day': 'day', '#model': 'model'},
+                    ExpressionAttributeValues={
+                        **values, ':day': day, ':model': model, ':db': source_db, ':exp': expires_at
+                    }
+                )
+            except Exception as e:
+                print(f"Stats write error: {e}")
+
+    def _rows(self, since):
+        if not self.table_name:
+            with self.lock:
+                return [(model, db, dict(counts)) for (day, model, db), counts in self.pending.items() if day >= since]
+        rows = []
+        scan = {}
+        while True:
+            response = self.table.scan(**scan)
+            for item in response.get('Items', []):
+                if item.get('day', '') >= since:
+                    counts = {k: int(v) for k, v in item.items() if k not in ('stats_key', 'day', 'model', 'source_db', 'expires_at')}
+                    rows.append((item['model'], item['source_db'], counts))
+            if 'LastEvaluatedKey' not in response:
+                return rows
+            scan = {'ExclusiveStartKey': response['LastEvaluatedKey']}
+
+    def stats(self, days=1):
+        """Usage over the last `days` UTC days, in total, per model and per source dialect"""
+        since = (datetime.now(timezone.utc) - timedelta(days=max(1, days) - 1)).strftime('%Y-%m-%d')
+        totals, models, dialects = Counter(), {}, {}
+        for model, source_db, counts in self._rows(since):
+            totals.update(counts)
+            models.setdefault(model, Counter()).update(counts)
+            dialects.setdefault(source_db, Counter()).update(counts)
+        return {
+            'since': since,
+            'backend': 'dynamodb' if self.table_name else 'memory',
+            'totals': summarize(totals),
+            'models': {model: summarize(counts) for model, counts in sorted(models.items())},
+            'source_dbs': {db: summarize(counts) for db, counts in sorted(dialects.items())}
+        }
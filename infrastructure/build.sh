@@ -13,7 +13,10 @@ mkdir -p package
 pip3 install boto3==1.35.0 -t package/ --quiet
 
 # Copy application code
-cp lambda_handler.py package/
+cp lambda_handler.py aws_clients.py html_text.py job_store.py jobs.py model_invoke.py model_router.py prompt_context.py request_metrics.py result_cache.py rule_engine.py sql_lexer.py sql_splitter.py sql_validator.py static_responses.py usage_stats.py package/
+if [ -f redshift_functions.txt ]; then
+  cp redshift_functions.txt package/
+fi
 
 # Create zip
 cd package
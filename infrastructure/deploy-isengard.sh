@@ -39,7 +39,7 @@ aws iam create-policy \
     "Version": "2012-10-17",
     "Statement": [{
       "Effect": "Allow",
-      "Action": ["bedrock:InvokeModel"],
+      "Action": ["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"],
       "Resource": [
         "arn:aws:bedrock:us-east-1::foundation-model/amazon.nova-pro-v1:0",
         "arn:aws:bedrock:us-east-1::foundation-model/us.anthropic.claude-*"
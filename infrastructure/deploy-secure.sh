@@ -33,7 +33,8 @@ BEDROCK_POLICY=$(aws iam create-policy \
     "Statement": [{
       "Effect": "Allow",
       "Action": [
-        "bedrock:InvokeModel"
+        "bedrock:InvokeModel",
+        "bedrock:InvokeModelWithResponseStream"
       ],
       "Resource": [
         "arn:aws:bedrock:us-east-1::foundation-model/amazon.nova-pro-v1:0",
@@ -49,33 +50,94 @@ aws iam attach-role-policy \
   --role-name $ROLE_NAME \
   --policy-arn $BEDROCK_POLICY
 
-# Create least-privilege DynamoDB policy (only for features table)
-DYNAMODB_POLICY=$(aws iam create-policy \
-  --policy-name sql-converter-dynamodb-features \
-  --policy-document '{
+# Create least-privilege DynamoDB policy (only for features, result cache, jobs and stats tables)
+# Statement reuse reads and writes the result cache in batches
+DYNAMODB_POLICY_DOCUMENT='{
     "Version": "2012-10-17",
     "Statement": [{
       "Effect": "Allow",
       "Action": [
         "dynamodb:GetItem",
-        "dynamodb:PutItem"
+        "dynamodb:PutItem",
+        "dynamodb:UpdateItem",
+        "dynamodb:Scan"
+      ],
+      "Resource": [
+        "arn:aws:dynamodb:us-east-1:*:table/sql-converter-features",
+        "arn:aws:dynamodb:us-east-1:*:table/sql-converter-results",
+        "arn:aws:dynamodb:us-east-1:*:table/sql-converter-jobs",
+        "arn:aws:dynamodb:us-east-1:*:table/sql-converter-stats"
+      ]
+    }, {
+      "Effect": "Allow",
+      "Action": [
+        "dynamodb:BatchGetItem",
+        "dynamodb:BatchWriteItem"
       ],
-      "Resource": "arn:aws:dynamodb:us-east-1:*:table/sql-converter-features"
+      "Resource": "arn:aws:dynamodb:us-east-1:*:table/sql-converter-results"
     }]
-  }' \
+  }'
+DYNAMODB_POLICY=$(aws iam create-policy \
+  --policy-name sql-converter-dynamodb-features \
+  --policy-document "$DYNAMODB_POLICY_DOCUMENT" \
   --query 'Policy.Arn' \
-  --output text 2>/dev/null) || DYNAMODB_POLICY="arn:aws:iam::$(aws sts get-caller-identity --query Account --output text):policy/sql-converter-dynamodb-features"
+  --output text 2>/dev/null) || {
+  DYNAMODB_POLICY="arn:aws:iam::$(aws sts get-caller-identity --query Account --output text):policy/sql-converter-dynamodb-features"
+  # The policy exists from an earlier deploy; make the current document its default version
+  aws iam create-policy-version \
+    --policy-arn $DYNAMODB_POLICY \
+    --policy-document "$DYNAMODB_POLICY_DOCUMENT" \
+    --set-as-default > /dev/null || echo "  ! Could not update $DYNAMODB_POLICY (at most 5 versions); delete an old version and rerun"
+}
 
 aws iam attach-role-policy \
   --role-name $ROLE_NAME \
   --policy-arn $DYNAMODB_POLICY
 
+# Result cache, job and stats tables (entries expire via DynamoDB TTL on expires_at)
+create_ttl_table() {
+    local table=$1 key=$2
+    if ! aws dynamodb describe-table --table-name $table --region $REGION >/dev/null 2>&1; then
+        aws dynamodb create-table \
+          --table-name $table \
+          --attribute-definitions AttributeName=$key,AttributeType=S \
+          --key-schema AttributeName=$key,KeyType=HASH \
+          --billing-mode PAY_PER_REQUEST \
+          --region $REGION >/dev/null
+        aws dynamodb wait table-exists --table-name $table --region $REGION
+        aws dynamodb update-time-to-live \
+          --table-name $table \
+          --time-to-live-specification Enabled=true,AttributeName=expires_at \
+          --region $REGION >/dev/null
+    fi
+}
+create_ttl_table sql-converter-results cache_key
+create_ttl_table sql-converter-jobs job_id
+create_ttl_table sql-converter-stats stats_key
+
+# POST /jobs hands work to an async invocation of this same function
+aws iam put-role-policy \
+  --role-name $ROLE_NAME \
+  --policy-name sql-converter-self-invoke \
+  --policy-document "{
+    \"Version\": \"2012-10-17\",
+    \"Statement\": [{
+      \"Effect\": \"Allow\",
+      \"Action\": \"lambda:InvokeFunction\",
+      \"Resource\": \"arn:aws:lambda:$REGION:*:function:$FUNCTION_NAME\"
+    }]
+  }"
+
 echo "Waiting for IAM role to propagate..."
 sleep 10
 
 # Build Lambda package
 cd backend
-zip -q lambda.zip lambda_handler.py
+zip -q lambda.zip lambda_handler.py aws_clients.py html_text.py job_store.py jobs.py model_invoke.py model_router.py prompt_context.py request_metrics.py result_cache.py rule_engine.py sql_lexer.py sql_splitter.py sql_validator.py static_responses.py usage_stats.py
+if [ -f redshift_functions.txt ]; then
+  # Function names extracted from the docs extend the validator's catalog
+  zip -q lambda.zip redshift_functions.txt
+fi
 cd ..
 
 # Create or update Lambda function with security best practices
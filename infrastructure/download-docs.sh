@@ -48,6 +48,14 @@ for file in /tmp/redshift-docs/*.html; do
   sed 's/<[^>]*>//g' "$file" | sed 's/&nbsp;/ /g' | sed 's/&lt;/</g' | sed 's/&gt;/>/g' > "/tmp/redshift-docs/${filename}.txt"
 done
 
+# Build the local retrieval index packaged with the KB Lambda
+echo "🔎 Building local documentation index..."
+python3 backend/doc_index.py /tmp/redshift-docs/*.html -o backend/redshift_docs.idx
+
+# Function catalog for validating converted SQL in the Lambda
+echo "🧾 Extracting Redshift function catalog..."
+python3 backend/sql_validator.py /tmp/redshift-docs/*functions*.html -o backend/redshift_functions.txt
+
 # Upload to S3
 echo "☁️  Uploading to S3..."
 aws s3 sync /tmp/redshift-docs/ s3://$KB_BUCKET/redshift-docs/ --region $REGION --exclude "*.html"
@@ -24,7 +24,11 @@ echo "✅ Switched to Knowledge Base handler"
 # Build Lambda package
 echo "📦 Building Lambda package..."
 cd backend
-zip -q lambda.zip lambda_handler.py
+zip -q lambda.zip lambda_handler.py aws_clients.py doc_index.py html_text.py prompt_context.py request_metrics.py rule_engine.py sql_lexer.py static_responses.py usage_stats.py
+if [ -f redshift_docs.idx ]; then
+  # Local index answers retrieval in-process instead of calling the Knowledge Base
+  zip -q lambda.zip redshift_docs.idx
+fi
 cd ..
 
 # Update Lambda function code